@@ -0,0 +1,342 @@
+""" Benchmark the hook against synthetic git repositories
+
+Creates a repository with a configurable number of staged Python files,
+optionally leaves some of them with unstaged changes, and times
+check_repo in several modes. The results are written as JSON::
+
+    python benchmark.py --files 100 --lines 200 --unstaged-ratio 0.2
+
+Every mode is run --repeat times. The timings of a run are split into
+the phases recorded by git_pylint_commit_hook.profiling.Profiler.
+
+With --memory every run happens in a child process and its peak resident
+memory is recorded as well. Large commits are best linted by a stand-in
+for pylint printing --fake-messages messages per file, as real pylint
+would take hours on them::
+
+    python benchmark.py --files 10000 --lines 10 --fake-pylint \
+        --memory --modes parallel --repeat 1
+
+The batch and in-process modes always run the real pylint.
+"""
+from __future__ import print_function
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from git_pylint_commit_hook import commit_hook
+from git_pylint_commit_hook import profiling
+
+# Keyword arguments of check_repo for every mode. The cached mode is
+# warmed up with one untimed run
+MODES = {
+    'sequential': {'jobs': 1, 'use_cache': False},
+    'parallel': {'use_cache': False},
+    'batch': {'batch_mode': True, 'use_cache': False},
+    'in-process': {'in_process': True, 'use_cache': False},
+    'cached': {'use_cache': True},
+}
+
+FUNCTION_TEMPLATE = '''
+
+def function_{index}(value):
+    """ Add up a range of values """
+    total = value
+    for item in range({count}):
+        total += item * {factor}
+    return total
+'''
+
+
+def _git(*args):
+    subprocess.check_output(('git',) + args)
+
+
+def _module(rand, lines):
+    """ Returns the source of a module of roughly the given length """
+    source = '""" Synthetic module """\n'
+    index = 0
+    while source.count('\n') < lines:
+        source += FUNCTION_TEMPLATE.format(
+            index=index, count=rand.randint(1, 100),
+            factor=rand.randint(1, 10))
+        index += 1
+    return source
+
+
+def create_repository(path, files, lines, unstaged_ratio, seed=0):
+    """ Create a repository with staged Python files
+
+    Half of the files are committed first and modified in the staged
+    change, the other half are added by it.
+
+    :type path: str
+    :param path: Directory to create the repository in
+    :type files: int
+    :param files: Number of staged Python files
+    :type lines: int
+    :param lines: Approximate number of lines per file
+    :type unstaged_ratio: float
+    :param unstaged_ratio: Fraction of the staged files to leave with
+        unstaged changes
+    :type seed: int
+    :param seed: Seed of the generated contents
+    """
+    rand = random.Random(seed)
+    filenames = [
+        os.path.join('package{}'.format(i % 10), 'module{}.py'.format(i))
+        for i in range(files)
+    ]
+
+    os.chdir(path)
+    _git('init', '-q')
+    _git('config', 'user.email', 'benchmark@example.com')
+    _git('config', 'user.name', 'benchmark')
+    for directory in set(os.path.dirname(name) for name in filenames):
+        os.mkdir(directory)
+
+    committed = filenames[:files // 2]
+    for filename in committed:
+        with open(filename, 'w') as file_handle:
+            file_handle.write(_module(rand, lines))
+    with open('README', 'w') as file_handle:
+        file_handle.write('Synthetic repository\n')
+    _git('add', '--all')
+    _git('commit', '-q', '-m', 'Initial commit')
+
+    for filename in filenames:
+        with open(filename, 'w') as file_handle:
+            file_handle.write(_module(rand, lines))
+    _git('add', '--all')
+
+    for filename in rand.sample(filenames, int(files * unstaged_ratio)):
+        with open(filename, 'a') as file_handle:
+            file_handle.write('UNSTAGED = {}\n'.format(rand.random()))
+
+
+def write_fake_pylint(path, messages):
+    """ Write a stand-in for pylint
+
+    :type path: str
+    :param path: Path of the script
+    :type messages: int
+    :param messages: Number of messages to print per file
+    :returns: str -- Path of the script
+    """
+    with open(path, 'w') as file_handle:
+        file_handle.write('\n'.join([
+            '#!/bin/sh',
+            'for last; do :; done',
+            'i=0',
+            'while [ $i -lt {} ]; do'.format(messages),
+            '    echo "$last:$i:0: C0103: Synthetic message (invalid-name)"',
+            '    i=$((i + 1))',
+            'done',
+            'echo "Your code has been rated at 9.00/10"',
+            '']))
+    os.chmod(path, 0o755)
+    return path
+
+
+@contextlib.contextmanager
+def _quiet():
+    """ Discard the report of the hook """
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+
+
+def _timed_run(limit, options):
+    """ Run check_repo once
+
+    :returns: dict -- The timings of the run
+    """
+    profiler = profiling.Profiler()
+    start = time.time()
+    with _quiet():
+        passed = commit_hook.check_repo(limit, profiler=profiler, **options)
+    run = profiler.as_dict()
+    run['wall'] = time.time() - start
+    run['passed'] = passed
+    return run
+
+
+def _measured_run(limit, options):
+    """ Run check_repo once in a child process, recording its peak memory
+
+    The peak resident memory of a process only grows, so every run gets
+    a fresh one.
+
+    :returns: dict -- The timings of the run and its peak memory in
+        kilobytes
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_fd)
+            run = _timed_run(limit, options)
+            run['max_rss_kb'] = resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss
+            with os.fdopen(write_fd, 'w') as file_handle:
+                json.dump(run, file_handle)
+            status = 0
+        finally:
+            os._exit(status)  # pylint: disable=protected-access
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as file_handle:
+        data = file_handle.read()
+    _, status = os.waitpid(pid, 0)
+    if status != 0:
+        raise RuntimeError('the benchmark run failed')
+    return json.loads(data)
+
+
+def run_mode(mode, repeat, limit=0.0, memory=False, **kwargs):
+    """ Time check_repo in one mode
+
+    :type memory: bool
+    :param memory: Record the peak memory of every run
+    :returns: dict -- The timings of every run
+    """
+    options = dict(MODES[mode], **kwargs)
+    if options.get('use_cache'):
+        with _quiet():
+            commit_hook.check_repo(limit, clear_cache=True, **options)
+
+    execute = _measured_run if memory else _timed_run
+    runs = [execute(limit, options) for _ in range(repeat)]
+
+    walls = sorted(run['wall'] for run in runs)
+    result = {
+        'mode': mode,
+        'runs': runs,
+        'min': walls[0],
+        'median': walls[len(walls) // 2],
+    }
+    if memory:
+        result['max_rss_kb'] = max(run['max_rss_kb'] for run in runs)
+    return result
+
+
+def main(argv=None):
+    """ Command line entry point """
+    parser = argparse.ArgumentParser(
+        description='Benchmark git-pylint-commit-hook')
+    parser.add_argument(
+        '--files', type=int, default=50,
+        help='Number of staged Python files. Default: 50')
+    parser.add_argument(
+        '--lines', type=int, default=100,
+        help='Approximate number of lines per file. Default: 100')
+    parser.add_argument(
+        '--unstaged-ratio', type=float, default=0.0,
+        help='Fraction of the files with unstaged changes. Default: 0')
+    parser.add_argument(
+        '--modes', default=','.join(sorted(MODES)),
+        help='Comma separated modes to run. Default: all of {}'.format(
+            ', '.join(sorted(MODES))))
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='Number of timed runs per mode. Default: 3')
+    parser.add_argument(
+        '--jobs', type=int, default=multiprocessing.cpu_count(),
+        help='Number of parallel jobs. Default: number of CPUs')
+    parser.add_argument(
+        '--stash', action='store_true',
+        help='Stash unstaged changes in every run')
+    parser.add_argument(
+        '--index', action='store_true',
+        help='Lint the staged contents from the index in every run')
+    parser.add_argument(
+        '--fake-pylint', action='store_true',
+        help='Lint with a stand-in printing --fake-messages per file')
+    parser.add_argument(
+        '--fake-messages', type=int, default=10,
+        help='Number of messages the stand-in prints per file. Default: 10')
+    parser.add_argument(
+        '--memory', action='store_true',
+        help='Record the peak resident memory of every run')
+    parser.add_argument(
+        '--output-memory', type=float,
+        help='Megabytes of pylint output the hook holds in memory')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='Seed of the generated contents. Default: 0')
+    parser.add_argument(
+        '--output',
+        help='Write the results to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    modes = [mode for mode in args.modes.split(',') if mode]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error('unknown mode: {}'.format(mode))
+
+    cwd = os.getcwd()
+    path = tempfile.mkdtemp(prefix='pylint_hook_benchmark_')
+    try:
+        create_repository(
+            path, args.files, args.lines, args.unstaged_ratio, args.seed)
+        options = {
+            'stash': args.stash,
+            'index': args.index,
+            'output_memory': args.output_memory,
+        }
+        if args.fake_pylint:
+            options['pylint'] = write_fake_pylint(
+                os.path.join(path, '.git', 'fake-pylint'),
+                args.fake_messages)
+        results = [
+            run_mode(
+                mode, args.repeat, memory=args.memory,
+                jobs=MODES[mode].get('jobs', args.jobs), **options)
+            for mode in modes
+        ]
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path)
+
+    report = json.dumps({
+        'config': {
+            'files': args.files,
+            'lines': args.lines,
+            'unstaged_ratio': args.unstaged_ratio,
+            'repeat': args.repeat,
+            'jobs': args.jobs,
+            'stash': args.stash,
+            'index': args.index,
+            'fake_pylint': args.fake_pylint,
+            'fake_messages': args.fake_messages,
+            'memory': args.memory,
+            'output_memory': args.output_memory,
+            'seed': args.seed,
+        },
+        'results': results,
+    }, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as file_handle:
+            file_handle.write(report + '\n')
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
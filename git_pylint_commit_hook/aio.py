@@ -0,0 +1,184 @@
+""" Asyncio backend running git and pylint processes concurrently
+
+The event loop runs in a background thread. check_repo stays synchronous:
+it submits processes and waits for their results in order, while the
+processes after them keep running. Requires Python 3.8 or later, so the
+module is only imported when the backend is selected.
+"""
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+
+from git_pylint_commit_hook import limits
+from git_pylint_commit_hook import profiling
+
+# Before 3.8 the child watcher only works with a loop in the main thread,
+# so create_subprocess_exec fails in the loop thread of the Runner
+if sys.version_info < (3, 8):
+    raise ImportError('the asyncio backend requires Python 3.8 or later')
+
+
+async def _execute(cmd):
+    with profiling.command(cmd):
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = await process.communicate()
+    return process.returncode, stdout, stderr
+
+
+def _kill(process):
+    """ Kill a process, unless it already exited """
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+
+def run_all(commands):
+    """ Run commands concurrently and wait for all of them
+
+    :type commands: list
+    :param commands: The command lines
+    :returns: list -- (status, stdout, stderr) tuples, in the order of
+        commands
+    """
+    async def run():
+        return await asyncio.gather(*[_execute(cmd) for cmd in commands])
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+class Runner(object):
+    """ Runs pylint processes on an event loop in a background thread """
+
+    def __init__(self, jobs, timeout=None, profiler=None, max_memory=None):
+        """ Start the event loop
+
+        :type jobs: int
+        :param jobs: Maximum number of pylint processes running at once
+        :type timeout: float
+        :param timeout: Seconds after which a pylint process is killed,
+            or None to wait for as long as it takes
+        :type profiler: profiling.Profiler
+        :param profiler: Records the time spent linting every file
+        :type max_memory: int
+        :param max_memory: Megabytes of memory a pylint process may use at
+            most, or None for no limit
+        """
+        self.timeout = timeout
+        self.profiler = profiler
+        self.max_memory = max_memory
+        self.loop = asyncio.new_event_loop()
+        self._semaphore = None
+        # The pylint processes running
+        self._processes = set()
+        self._thread = threading.Thread(target=self._run_loop)
+        self._thread.daemon = True
+        self._thread.start()
+        self._call(self._create_semaphore(max(1, jobs)))
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _create_semaphore(self, jobs):
+        self._semaphore = asyncio.Semaphore(jobs)
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        """ Kill the processes still running and stop the event loop
+
+        The processes are reaped and the tasks linting with them finish
+        before the loop stops, so nothing is left running once this
+        returns.
+        """
+        self._call(self._shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    async def _shutdown(self):
+        for process in self._processes:
+            _kill(process)
+        tasks = [
+            task for task in asyncio.all_tasks()
+            if task is not asyncio.current_task()
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Let the transports of the processes run their close callbacks
+        await asyncio.sleep(0)
+
+    async def _lint(self, filename, cmd, stdin, parser, record):
+        async with self._semaphore:
+            start = time.time()
+            with profiling.command(cmd):
+                process = await asyncio.create_subprocess_exec(
+                    *limits.command(cmd, self.max_memory),
+                    stdin=subprocess.PIPE if stdin is not None else None,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE)
+                self._processes.add(process)
+                try:
+                    stderr = await asyncio.wait_for(
+                        self._communicate(process, stdin, parser),
+                        self.timeout)
+                except asyncio.TimeoutError:
+                    _kill(process)
+                    await process.wait()
+                    parser.timed_out(self.timeout)
+                    stderr = b''
+                except asyncio.CancelledError:
+                    _kill(process)
+                    await process.wait()
+                    raise
+                finally:
+                    self._processes.discard(process)
+            if record and self.profiler is not None:
+                self.profiler.record_file(filename, time.time() - start)
+        return parser.result(filename, process.returncode, stderr)
+
+    @staticmethod
+    async def _communicate(process, stdin, parser):
+        """ Feed stdin and parse stdout line by line, returning stderr """
+        if stdin is not None:
+            process.stdin.write(stdin)
+            await process.stdin.drain()
+            process.stdin.close()
+        stderr = asyncio.ensure_future(process.stderr.read())
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            parser.feed(line.decode('utf-8', 'replace'))
+        await process.wait()
+        return await stderr
+
+    def lint(self, filename, cmd, stdin, parser, record=True):
+        """ Start linting a file
+
+        :type filename: str
+        :param filename: The linted file
+        :type cmd: list
+        :param cmd: The pylint command
+        :type stdin: bytes
+        :param stdin: Contents to feed pylint, for --from-stdin
+        :type parser: object
+        :param parser: Parser of pylint's output, with the feed, timed_out
+            and result methods of commit_hook._OutputParser
+        :type record: bool
+        :param record: Record the time spent linting the file
+        :returns: concurrent.futures.Future -- Resolves to the result of
+            parser.result
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._lint(filename, cmd, stdin, parser, record), self.loop)
@@ -0,0 +1,351 @@
+""" Run pylint once over several files and report a score per file
+
+The files can either be linted in the current process with :func:`run`,
+which returns structured results, or in a separate process::
+
+    python git_pylint_commit_hook/batch.py [--index | --blobs] [pylint options] -- FILE...
+
+The output contains one section per file, each starting with a
+``SEPARATOR`` line followed by the file name. A section holds the
+messages for that file and a "Your code has been rated at" line computed
+from the file's own statistics, so it can be parsed exactly like the
+output of a single-file pylint run.
+
+With ``--index`` the staged contents of the files are linted instead of
+the contents of the working tree. With ``--blobs`` every file is given
+as ``BLOB:FILE`` and the contents of the blob are linted as the file.
+"""
+from __future__ import print_function
+
+import collections
+import os
+import subprocess
+import sys
+import threading
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+SEPARATOR = '~~~~~~~~ git-pylint-commit-hook: '
+
+# The brief output leaves out pylint's reports. exceeded names the limit
+# pylint ran into, see limits.py
+FileResult = collections.namedtuple(
+    'FileResult',
+    'filename, score, ignored, messages, output, brief, exceeded'
+)
+
+
+def read_objects(objects):
+    """ Read git objects with a single git process
+
+    :type objects: list
+    :param objects: Object names, like blob ids or ":path" for the staged
+        contents of a file
+    :returns: dict -- Mapping object names to their contents as bytes.
+        Missing objects are left out
+    """
+    objects = list(objects)
+    if not objects:
+        return {}
+
+    process = subprocess.Popen(
+        ['git', 'cat-file', '--batch'],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE)
+    output, _ = process.communicate(''.join(
+        '{}\n'.format(name) for name in objects).encode('utf-8'))
+
+    contents = {}
+    position = 0
+    for name in objects:
+        end = output.index(b'\n', position)
+        header = output[position:end].split()
+        position = end + 1
+        if header[-1] == b'missing':
+            continue
+        size = int(header[2])
+        contents[name] = output[position:position + size]
+        position += size + 1
+
+    return contents
+
+
+def read_prefixes(objects, size):
+    """ Read the start of git objects with a single git process
+
+    The objects are streamed, so large objects are never held in memory.
+
+    :type objects: list
+    :param objects: Object names, like blob ids
+    :type size: int
+    :param size: Number of bytes to read from the start of every object
+    :returns: dict -- Mapping object names to the first size bytes of
+        their contents. Missing objects are left out
+    """
+    objects = list(objects)
+    if not objects:
+        return {}
+
+    process = subprocess.Popen(
+        ['git', 'cat-file', '--batch'],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE)
+
+    def write_names():
+        # Written from a thread, as git blocks once we stop reading
+        process.stdin.write(''.join(
+            '{}\n'.format(name) for name in objects).encode('utf-8'))
+        process.stdin.close()
+
+    writer = threading.Thread(target=write_names)
+    writer.start()
+
+    prefixes = {}
+    for name in objects:
+        header = process.stdout.readline().split()
+        if not header or header[-1] == b'missing':
+            continue
+        remaining = int(header[2])
+        prefixes[name] = process.stdout.read(min(size, remaining))
+        remaining -= len(prefixes[name])
+        while remaining:
+            chunk = process.stdout.read(min(remaining, 65536))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        process.stdout.read(1)
+    process.stdout.close()
+    writer.join()
+    process.wait()
+
+    return prefixes
+
+
+def read_index(filenames):
+    """ Read the staged contents of files with a single git process
+
+    :type filenames: list
+    :param filenames: Files to read, relative to the repository root
+    :returns: dict -- Mapping file names to their staged contents as
+        bytes. Files that are not in the index are left out
+    """
+    filenames = list(filenames)
+    objects = read_objects(':' + filename for filename in filenames)
+    return dict(
+        (filename, objects[':' + filename])
+        for filename in filenames if ':' + filename in objects)
+
+
+def _score(linter, stats):
+    """ Evaluate the score of a single module
+
+    :type stats: dict
+    :param stats: The statistics of the module, as collected by
+        PerFileReporter
+    :returns: float -- The score, or None if no statements were analysed
+    """
+    if not stats or not stats['statement']:
+        return None
+    try:
+        return eval(  # pylint: disable=eval-used
+            linter.config.evaluation, {}, dict(stats))
+    except Exception:  # pylint: disable=broad-except
+        return None
+
+
+def _pylint():
+    """ Import pylint and define the classes extending it
+
+    Importing pylint and astroid takes a good part of a second. The hook
+    also reads git objects with this module, so pylint is only imported
+    once files are linted.
+
+    :returns: tuple -- The pylint.lint module, and the PerFileReporter
+        and ContentsLinter classes
+    """
+    # pylint: disable=import-outside-toplevel
+    from pylint import lint
+    from pylint.reporters.text import TextReporter
+
+    class PerFileReporter(TextReporter):
+        """ Text reporter writing the messages of every module to its own
+        buffer
+
+        pylint keeps its statistics by module name, so files with the same
+        module name in different directories would share them. The
+        statistics of every file are copied by path once pylint moves on
+        to the next file.
+        """
+
+        def __init__(self):
+            TextReporter.__init__(self, StringIO())
+            self.buffers = {}
+            self.messages = {}
+            self.stats = {}
+            self._current = None
+
+        def _buffer(self, path):
+            path = os.path.abspath(path)
+            if path not in self.buffers:
+                self.buffers[path] = StringIO()
+            return self.buffers[path]
+
+        def _collect_stats(self):
+            # Called before pylint resets the statistics of the next module
+            if self._current is not None:
+                path, module = self._current
+                self.stats[path] = dict(
+                    self.linter.stats['by_module'].get(module, {}))
+            self._current = None
+
+        def on_set_current_module(self, module, filepath):
+            TextReporter.on_set_current_module(self, module, filepath)
+            self._collect_stats()
+            if filepath:
+                self._current = (os.path.abspath(filepath), module)
+
+        def on_close(self, stats, previous_stats):
+            self._collect_stats()
+            TextReporter.on_close(self, stats, previous_stats)
+
+        def handle_message(self, msg):
+            self.messages.setdefault(
+                os.path.abspath(msg.path), []).append(msg)
+            self.out = self._buffer(msg.path)
+            TextReporter.handle_message(self, msg)
+
+        def display_reports(self, layout):
+            """ Reports span every file in the run, so they are not shown """
+
+    class ContentsLinter(lint.PyLinter):
+        """ Linter reading the given files from memory instead of the disk """
+
+        # Maps absolute paths to the source to lint
+        contents = {}
+
+        def get_ast(self, filepath, modname, data=None):
+            if data is None:
+                data = self.contents.get(os.path.abspath(filepath))
+            return lint.PyLinter.get_ast(self, filepath, modname, data)
+
+    return lint, PerFileReporter, ContentsLinter
+
+
+def run(pylint_args, filenames, contents=None):
+    """ Lint all files in one pylint run in the current process
+
+    :type pylint_args: list
+    :param pylint_args: Options passed on to pylint
+    :type filenames: list
+    :param filenames: Files to lint
+    :type contents: dict
+    :param contents: Source to lint in place of the files on disk, as
+        returned by read_index
+    :returns: list -- A FileResult per file, in the order of filenames.
+        The score is None if no statements were analysed. If pylint
+        rejected its options, every file gets pylint's error as output
+    """
+    lint, reporter_class, contents_linter = _pylint()
+    run_class = lint.Run
+    if contents is not None:
+        linter_class = type('ContentsLinter', (contents_linter,), {
+            'contents': dict(
+                (os.path.abspath(filename),
+                 source.decode('utf-8', 'replace'))
+                for filename, source in contents.items()),
+        })
+        run_class = type('ContentsRun', (lint.Run,), {
+            'LinterClass': linter_class,
+        })
+
+    reporter = reporter_class()
+    # pylint exits on bad options and rc files even with exit=False,
+    # writing why to stderr
+    stderr, sys.stderr = sys.stderr, StringIO()
+    try:
+        linter = run_class(
+            list(pylint_args) + list(filenames),
+            reporter=reporter, exit=False).linter
+    except SystemExit as error:
+        output = sys.stderr.getvalue() or \
+            'pylint exited with status {}\n'.format(error.code)
+        return [
+            FileResult(filename, None, False, [], output, output, None)
+            for filename in filenames
+        ]
+    finally:
+        errors, sys.stderr = sys.stderr.getvalue(), stderr
+    # Pass on the warnings of a run that went through
+    stderr.write(errors)
+
+    results = []
+    for filename in filenames:
+        path = os.path.abspath(filename)
+        messages = reporter.messages.get(path, [])
+        score = _score(linter, reporter.stats.get(path))
+
+        output = reporter.buffers.get(path, StringIO()).getvalue()
+        if score is not None:
+            output += '\n{}\nYour code has been rated at {:.2f}/10\n\n'.format(
+                '-' * 35, score)
+
+        results.append(FileResult(
+            filename,
+            score,
+            any(msg.symbol == 'file-ignored' for msg in messages),
+            messages,
+            output,
+            output,
+            None))
+
+    return results
+
+
+def lint_files(pylint_args, filenames, contents=None, out=sys.stdout):
+    """ Lint all files in one pylint run, writing a section per file
+
+    :type pylint_args: list
+    :param pylint_args: Options passed on to pylint
+    :type filenames: list
+    :param filenames: Files to lint
+    :type contents: dict
+    :param contents: Source to lint in place of the files on disk
+    :type out: file
+    :param out: Stream to write the sections to
+    """
+    for result in run(pylint_args, filenames, contents):
+        out.write('{}{}\n'.format(SEPARATOR, result.filename))
+        out.write(result.output)
+
+
+def main(argv=None):
+    """ Command line entry point """
+    if argv is None:
+        argv = sys.argv[1:]
+    if '--' in argv:
+        split = argv.index('--')
+        pylint_args, filenames = argv[:split], argv[split + 1:]
+    else:
+        pylint_args, filenames = [], argv
+
+    contents = None
+    if '--index' in pylint_args:
+        pylint_args.remove('--index')
+        contents = read_index(filenames)
+    elif '--blobs' in pylint_args:
+        pylint_args.remove('--blobs')
+        blobs = [argument.split(':', 1) for argument in filenames]
+        objects = read_objects(blob for blob, _ in blobs)
+        filenames = [filename for _, filename in blobs]
+        contents = dict(
+            (filename, objects[blob])
+            for blob, filename in blobs if blob in objects)
+    lint_files(pylint_args, filenames, contents)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
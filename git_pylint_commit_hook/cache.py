@@ -0,0 +1,320 @@
+""" Persistent cache of pylint results, keyed by file contents """
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# Default upper bound for the size of the cache directory, in bytes
+DEFAULT_MAX_SIZE = 32 * 1024 * 1024
+
+
+def blob_sha(filename):
+    """ Compute the git object id of a file's contents
+
+    This is the same hash git uses for the blob, so it matches the
+    staged blob reported by ``git diff-index`` when the file is clean.
+
+    :type filename: str
+    :param filename: Path of the file to hash
+    :returns: str -- Hex digest of the blob
+    """
+    with open(filename, 'rb') as file_handle:
+        data = file_handle.read()
+    digest = hashlib.sha1('blob {}\0'.format(len(data)).encode('ascii'))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def file_digest(filename):
+    """ Hash a file's contents, or return '' if there is no such file
+
+    :type filename: str
+    :param filename: Path of the file to hash
+    :returns: str -- Hex digest of the contents
+    """
+    if not filename or not os.path.exists(filename):
+        return ''
+    with open(filename, 'rb') as file_handle:
+        return hashlib.sha1(file_handle.read()).hexdigest()
+
+
+def write_json_atomically(path, data):
+    """ Write data to a JSON file, creating its directory if needed
+
+    The data goes to a temporary file next to path first, so that
+    concurrent hooks never read a partially written file. The temporary
+    file is removed if writing it fails.
+
+    :type path: str
+    :param path: Path of the file
+    :type data: dict
+    :param data: JSON serializable data to write
+    """
+    directory = os.path.dirname(path) or os.curdir
+    try:
+        os.makedirs(directory)
+    except OSError as error:
+        if error.errno != errno.EEXIST:
+            raise
+
+    handle, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as file_handle:
+            json.dump(data, file_handle, separators=(',', ':'))
+        os.rename(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class LintCache(object):
+    """ A directory of cached pylint results with LRU eviction
+
+    Every entry is stored in its own file. Reading an entry touches it, so
+    once the cache grows over max_size bytes the least recently used
+    entries are evicted first.
+    """
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        """ Create a cache
+
+        :type path: str
+        :param path: Directory holding the cache entries
+        :type max_size: int
+        :param max_size: Maximum size of the cache in bytes
+        """
+        self.path = path
+        self.max_size = max_size
+
+    @staticmethod
+    def key(*parts):
+        """ Build a cache key out of JSON serializable parts
+
+        :returns: str -- The key
+        """
+        return hashlib.sha1(
+            json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def get(self, key):
+        """ Look up an entry
+
+        :type key: str
+        :param key: Key of the entry
+        :returns: dict -- The cached value, or None on a miss
+        """
+        entry = self._entry(key)
+        try:
+            with open(entry) as file_handle:
+                value = json.load(file_handle)
+            os.utime(entry, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return value
+
+    def put(self, key, value):
+        """ Store an entry, replacing any previous value
+
+        :type key: str
+        :param key: Key of the entry
+        :type value: dict
+        :param value: JSON serializable value to store
+        """
+        write_json_atomically(self._entry(key), value)
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache fits """
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+
+        entries = []
+        total = 0
+        for name in names:
+            entry = os.path.join(self.path, name)
+            try:
+                stat = os.stat(entry)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """ Remove all entries """
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class Baseline(object):
+    """ Scores of files, keyed by path and blob id
+
+    The baseline is a single JSON file. It only holds scores for one
+    pylint configuration and is discarded when the configuration changes.
+    """
+
+    def __init__(self, path, config):
+        """ Load a baseline
+
+        :type path: str
+        :param path: Path of the baseline file
+        :type config: str
+        :param config: Key of the pylint configuration, see LintCache.key
+        """
+        self.path = path
+        self.config = config
+        self.files = {}
+        try:
+            with open(path) as file_handle:
+                data = json.load(file_handle)
+            if data.get('config') == config:
+                self.files = data['files']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def get(self, filename, blob):
+        """ Look up the score of a file
+
+        :returns: float -- The score, or None if it is not known
+        """
+        return self.files.get(filename, {}).get(blob)
+
+    def set(self, filename, blob, score, keep=()):
+        """ Record the score of a file
+
+        :type keep: list
+        :param keep: Blob ids of other versions of the file to keep the
+            scores of. All other versions are dropped
+        """
+        scores = self.files.setdefault(filename, {})
+        for old_blob in list(scores):
+            if old_blob not in keep:
+                del scores[old_blob]
+        scores[blob] = score
+
+    def save(self):
+        """ Write the baseline back to disk """
+        write_json_atomically(
+            self.path, {'config': self.config, 'files': self.files})
+
+
+class Classifications(object):
+    """ Whether blobs are Python scripts, keyed by blob id
+
+    The classifications are kept in a single JSON file. Once it holds more
+    than max_entries blobs, only the ones looked up by the current run are
+    saved.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        """ Load the classifications
+
+        :type path: str
+        :param path: Path of the JSON file
+        :type max_entries: int
+        :param max_entries: Number of blobs to keep at most
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.blobs = {}
+        self._used = set()
+        self._changed = False
+        try:
+            with open(path) as file_handle:
+                self.blobs = json.load(file_handle)['blobs']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def get(self, blob):
+        """ Look up a blob
+
+        :returns: bool -- True for Python scripts, or None if unknown
+        """
+        self._used.add(blob)
+        return self.blobs.get(blob)
+
+    def set(self, blob, is_python):
+        """ Record the classification of a blob """
+        self._used.add(blob)
+        self.blobs[blob] = is_python
+        self._changed = True
+
+    def save(self):
+        """ Write the classifications back to disk, if they changed """
+        if not self._changed:
+            return
+        if len(self.blobs) > self.max_entries:
+            self.blobs = dict(
+                (blob, value) for blob, value in self.blobs.items()
+                if blob in self._used)
+
+        write_json_atomically(self.path, {'blobs': self.blobs})
+        self._changed = False
+
+
+class Timings(object):
+    """ How long pylint takes to lint every path, learned over the runs
+
+    The times are kept in a single JSON file as a moving average, so files
+    that got slower or faster are picked up within a few runs. Once it
+    holds more than max_entries paths, only the ones linted by the current
+    run are saved.
+    """
+
+    # Weight of the latest time in the average
+    SMOOTHING = 0.5
+
+    def __init__(self, path, max_entries=10000):
+        """ Load the timings
+
+        :type path: str
+        :param path: Path of the JSON file
+        :type max_entries: int
+        :param max_entries: Number of paths to keep at most
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.seconds = {}
+        self._used = set()
+        try:
+            with open(path) as file_handle:
+                self.seconds = json.load(file_handle)['seconds']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def record(self, filename, seconds):
+        """ Add the time of a pylint run on a file to its average """
+        self._used.add(filename)
+        previous = self.seconds.get(filename)
+        if previous is not None:
+            seconds = self.SMOOTHING * seconds + \
+                (1 - self.SMOOTHING) * previous
+        self.seconds[filename] = seconds
+
+    def save(self):
+        """ Write the timings back to disk, if any were recorded """
+        if not self._used:
+            return
+        if len(self.seconds) > self.max_entries:
+            self.seconds = dict(
+                (filename, seconds)
+                for filename, seconds in self.seconds.items()
+                if filename in self._used)
+
+        write_json_atomically(self.path, {'seconds': self.seconds})
+        self._used = set()
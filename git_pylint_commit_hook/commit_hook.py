@@ -1,16 +1,37 @@
 """ Commit hook for pylint """
 from __future__ import print_function
 
+import codecs
 import collections
 import contextlib
 import decimal
+import functools
+import io
+import itertools
 import os
 import re
 import sys
 import subprocess
-
-import configparser
-import pylint.config as pylint_config
+import tempfile
+import threading
+import time
+
+from pylint import __version__ as pylint_version
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from git_pylint_commit_hook import batch
+from git_pylint_commit_hook import cache
+from git_pylint_commit_hook import config
+from git_pylint_commit_hook import dependents
+from git_pylint_commit_hook import ignore
+from git_pylint_commit_hook import limits
+from git_pylint_commit_hook import profiling
+from git_pylint_commit_hook import sharding
+from git_pylint_commit_hook import spool
 
 ExecutionResult = collections.namedtuple(
     'ExecutionResult',
@@ -24,80 +45,592 @@ def _futurize_str(obj):
     return obj
 
 
-def _execute(cmd):
-    process = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
-    )
-    stdout, stderr = process.communicate()
-    status = process.poll()
+def _execute(cmd, stdin=None):
+    with profiling.command(cmd):
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if stdin is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        stdout, stderr = process.communicate(stdin)
+        status = process.poll()
     return ExecutionResult(status, stdout, stderr)
 
 
-def _current_commit():
-    if _execute('git rev-parse --verify HEAD'.split()).status:
-        return '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
-    return 'HEAD'
+# Command lines of batch.read_objects and sharding.object_sizes, for the
+# profiler
+_CAT_FILE = ['git', 'cat-file', '--batch']
+_CAT_FILE_CHECK = ['git', 'cat-file', '--batch-check']
+
+# The hash of git's empty tree, used in place of HEAD before the first commit
+_EMPTY_TREE = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+
+# head_path is the path of the committed version: the source of a renamed
+# or copied file, the path itself otherwise
+StagedFile = collections.namedtuple(
+    'StagedFile',
+    'path, status, blob, head_blob, head_path'
+)
+
+_HUNK_REGEXP = re.compile(
+    r'^@@ -[0-9]+(?:,([0-9]+))? \+([0-9]+)(?:,([0-9]+))? @@')
+
+# Starts the messages of a module in pylint's text output
+_MODULE_HEADER = '************* Module '
+
+
+class _GitState(object):
+    """ The state of the repository, shared by everything in one hook run
+
+    Every piece of information is read the first time it is needed, with
+    as few git processes as possible, and reused afterwards.
+
+    With a revision range, the files changed by the commits of the range
+    take the place of the staged files.
+    """
+
+    def __init__(self, revision_range=None):
+        self.revision_range = revision_range
+        self._git_dir = None
+        self._has_head = None
+        self._staged_files = None
+        self._changed_lines = None
+        # Set once the working tree is known to match the index
+        self.worktree_matches_index = False
+
+    # rev-parse prints the .git directory even if HEAD does not exist,
+    # in which case it exits with status 1
+    _HEAD_COMMAND = ['git', 'rev-parse', '--git-dir', '-q', '--verify', 'HEAD']
+
+    def _read_head(self):
+        self._parse_head(_execute(self._HEAD_COMMAND))
+
+    def _parse_head(self, res):
+        lines = _futurize_str(res.stdout).splitlines()
+        if res.status not in (0, 1) or not lines:
+            raise subprocess.CalledProcessError(res.status, self._HEAD_COMMAND)
+        self._git_dir = lines[0]
+        self._has_head = not res.status
+
+    def _staged_files_command(self, commit):
+        if self.revision_range:
+            # diff-tree does not understand A...B
+            return [
+                'git', 'diff', '--raw', '-z', '--no-abbrev', '-M', '-C',
+                self.revision_range]
+        return ['git', 'diff-index', '--cached', '-z', '-M', '-C', commit]
+
+    def _changed_lines_command(self, commit):
+        # The prefixes are pinned, whatever diff.noprefix or
+        # diff.mnemonicPrefix say, since the new paths are read after b/
+        cmd = [
+            'git', '-c', 'core.quotepath=off', 'diff', '--no-color',
+            '--no-ext-diff', '--src-prefix=a/', '--dst-prefix=b/', '-M', '-C',
+            '-U0']
+        if self.revision_range:
+            return cmd + [self.revision_range]
+        return cmd + ['--cached', commit]
+
+    def prefetch(self, run_all, changed_lines=False):
+        """ Read the state with concurrent git processes
+
+        The staged changes are read against HEAD at the same time as HEAD
+        is verified. Before the initial commit they are read again against
+        the empty tree. Unlike staged_files and changed_lines, which parse
+        git's output as it is read, the whole output of every process is
+        held until they all exit.
+
+        :type run_all: function
+        :param run_all: Runs a list of commands concurrently, see
+            aio.run_all
+        :type changed_lines: bool
+        :param changed_lines: Also read the lines changed by the commit
+        """
+        commands = [
+            self._HEAD_COMMAND, self._staged_files_command('HEAD')]
+        if changed_lines:
+            commands.append(self._changed_lines_command('HEAD'))
+        results = [ExecutionResult(*res) for res in run_all(commands)]
+        self._parse_head(results[0])
+        if not self.has_head:
+            return
+        for cmd, res in zip(commands[1:], results[1:]):
+            if res.status:
+                raise subprocess.CalledProcessError(res.status, cmd)
+        self._parse_staged_files(io.BytesIO(results[1].stdout))
+        if changed_lines:
+            self._parse_changed_lines(io.BytesIO(results[2].stdout))
+
+    @property
+    def git_dir(self):
+        """ Path of the repository's .git directory """
+        if self._git_dir is None:
+            self._read_head()
+        return self._git_dir
+
+    @property
+    def has_head(self):
+        """ True if there is an initial commit """
+        if self._has_head is None:
+            self._read_head()
+        return self._has_head
+
+    @property
+    def commit(self):
+        """ The commit to compare the index with """
+        return 'HEAD' if self.has_head else _EMPTY_TREE
+
+    def staged_files(self):
+        """ Returns the files about to be committed
+
+        :returns: list -- A StagedFile per added, modified, renamed or
+            copied file. In a revision range, head_blob is the blob at the
+            start of the range and blob the one at its end
+        """
+        if self._staged_files is None:
+            # git's output is parsed as it is read, so only the StagedFile
+            # tuples are held
+            cmd = self._staged_files_command(self.commit)
+            with profiling.command(cmd):
+                process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+                self._parse_staged_files(process.stdout)
+                process.stdout.close()
+                if process.wait():
+                    raise subprocess.CalledProcessError(
+                        process.returncode, cmd)
+
+        return self._staged_files
+
+    def _parse_staged_files(self, stream):
+        # The fields are read a chunk at a time, never split all at once
+        self._staged_files = list(_raw_diff_files(_nul_fields(stream)))
+
+    def changed_lines(self):
+        """ Returns the lines added or modified by the commit
+
+        :returns: dict -- Mapping paths to the set of line numbers the
+            staged changes add or modify
+        """
+        if self._changed_lines is None:
+            # The diff is parsed a line at a time as it is read, so only
+            # the line numbers are held
+            cmd = self._changed_lines_command(self.commit)
+            with profiling.command(cmd):
+                process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+                self._parse_changed_lines(process.stdout)
+                process.stdout.close()
+                if process.wait():
+                    raise subprocess.CalledProcessError(
+                        process.returncode, cmd)
+
+        return self._changed_lines
+
+    def _parse_changed_lines(self, output):
+        # The output is an iterable of byte lines. Hunk bodies are skipped
+        # by their line counts: an added line starting with "++ " reads as
+        # a "+++ " file header
+        self._changed_lines = {}
+        lines = None
+        removed = added = 0
+        header = False
+        for line in output:
+            line = line.decode('utf-8', 'replace').rstrip('\n')
+            if removed > 0 or added > 0:
+                if line.startswith(('-', ' ')):
+                    removed -= 1
+                if line.startswith(('+', ' ')):
+                    added -= 1
+                continue
+            if line.startswith('--- '):
+                header = True
+                continue
+            if header and line.startswith('+++ '):
+                header = False
+                path = line[4:].rstrip('\t')
+                if path.startswith('"'):
+                    path = codecs.escape_decode(
+                        path[1:-1].encode('utf-8'))[0].decode('utf-8')
+                lines = None
+                if path.startswith('b/'):
+                    lines = self._changed_lines.setdefault(path[2:], set())
+                continue
+            header = False
+            match = re.match(_HUNK_REGEXP, line)
+            if match:
+                removed = int(match.group(1) or 1)
+                start = int(match.group(2))
+                added = int(match.group(3) or 1)
+                if lines is not None:
+                    lines.update(range(start, start + added))
+
+
+def _nul_fields(stream, chunk_size=65536):
+    """ Yield the NUL separated fields of a stream as it is read
+
+    :type stream: file
+    :param stream: Binary stream, like the stdout of a git process
+    :type chunk_size: int
+    :param chunk_size: Number of bytes to read at once
+    :returns: iterator -- The fields as str
+    """
+    rest = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        fields = (rest + chunk).split(b'\0')
+        rest = fields.pop()
+        for field in fields:
+            yield _futurize_str(field)
+    if rest:
+        yield _futurize_str(rest)
+
+
+def _raw_diff_files(fields):
+    """ Yield the added and modified files of ``git diff --raw -z`` output
+
+    Renamed and copied files are modifications of their source. Their
+    status is R or C, without the similarity index.
+
+    :type fields: iterator
+    :param fields: The NUL separated fields of the output
+    :returns: iterator -- A StagedFile per added, modified, renamed or
+        copied file
+    :raises: ValueError -- If the output ends in the middle of a record
+    """
+    for meta in fields:
+        if not meta:
+            continue
+        _, _, head_blob, blob, status = meta[1:].split()
+        paths = [next(fields, None)]
+        if status[0] in 'RC':
+            paths.append(next(fields, None))
+        if None in paths:
+            raise ValueError('Truncated git diff record: {}'.format(meta))
+        if status[0] in 'AMRC':
+            yield StagedFile(
+                paths[-1], status[0], blob, head_blob, paths[0])
+
+
+def _current_commit(git_state=None):
+    return (git_state or _GitState()).commit
+
+
+def _git_dir(git_state=None):
+    """ Returns the path of the repository's .git directory """
+    return (git_state or _GitState()).git_dir
 
 
 def _current_stash():
     res = _execute('git rev-parse -q --verify refs/stash'.split())
     if res.status:
         # not really as meaningful for a stash, but makes some sense
-        return '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+        return _EMPTY_TREE
     return res.stdout
 
 
-def _get_list_of_committed_files():
+def _get_list_of_committed_files(git_state=None):
     """ Returns a list of files about to be commited. """
-    files = []
-    # pylint: disable=E1103
-    diff_index_cmd = 'git diff-index --cached %s' % _current_commit()
-    output = subprocess.check_output(
-        diff_index_cmd.split()
-    )
-    for result in _futurize_str(output).split('\n'):
-        if result != '':
-            result = result.split()
-            if result[4] in ['A', 'M']:
-                files.append(result[5])
-
-    return files
-
-
-def _is_python_file(filename):
+    return [
+        staged.path
+        for staged in (git_state or _GitState()).staged_files()
+    ]
+
+
+# Number of bytes read from the start of a file to look for a shebang
+_SNIFF_SIZE = 256
+
+# The git attribute deciding whether a file is linted
+_PYLINT_ATTRIBUTE = 'pylint'
+
+
+def _has_python_shebang(prefix):
+    """ Check if the first line of a file's contents is a Python shebang
+
+    :type prefix: bytes
+    :param prefix: The start of the file's contents
+    :returns: bool -- True if the first line contains "python" and "#!"
+    """
+    first_line = prefix[:_SNIFF_SIZE].split(b'\n', 1)[0]
+    return b'python' in first_line and b'#!' in first_line
+
+
+def _is_python_file(filename, contents=None):
     """Check if the input file looks like a Python script
 
     Returns True if the filename ends in ".py" or if the first line
-    contains "python" and "#!", returns False otherwise.
+    contains "python" and "#!", returns False otherwise. The first line
+    is read from contents if given, or from the file otherwise. Only the
+    first few hundred bytes are ever looked at.
 
     """
     if filename.endswith('.py'):
         return True
-    try:
-        with open(filename, 'r') as file_handle:
-            first_line = file_handle.readline()
-        return 'python' in first_line and '#!' in first_line
-    except UnicodeDecodeError:
-        return False
+    if contents is None:
+        with open(filename, 'rb') as file_handle:
+            contents = file_handle.read(_SNIFF_SIZE)
+    return _has_python_shebang(contents)
+
+
+def _pylint_attributes(paths):
+    """ Look up the pylint git attribute of files
+
+    :type paths: list
+    :param paths: Paths relative to the repository root
+    :returns: dict -- Mapping paths to True where the attribute is set
+        and to False where it is unset. Files it is not specified for
+        are left out
+    """
+    if not paths:
+        return {}
+    res = _execute(
+        ['git', 'check-attr', '-z', '--stdin', _PYLINT_ATTRIBUTE],
+        ''.join(path + '\0' for path in paths).encode('utf-8'))
+    if res.status:
+        raise subprocess.CalledProcessError(res.status, 'git check-attr')
+
+    attributes = {}
+    fields = _futurize_str(res.stdout).split('\0')
+    for i in range(0, len(fields) - 2, 3):
+        path, _, value = fields[i:i + 3]
+        if value in ('set', 'unset'):
+            attributes[path] = value == 'set'
+    return attributes
+
+
+def _classify(staged_files, git_state):
+    """ Returns the staged files that are Python scripts
+
+    The pylint git attribute decides if it is set or unset for a file.
+    Otherwise files ending in ".py" are Python scripts, as are files whose
+    staged contents start with a Python shebang. The shebangs of all files
+    are read with a single git process and remembered by blob id.
+
+    :type staged_files: list
+    :param staged_files: StagedFile tuples
+    :type git_state: _GitState
+    :param git_state: The state of the repository
+    :returns: list -- The StagedFile tuples of the Python scripts
+    """
+    attributes = _pylint_attributes([staged.path for staged in staged_files])
+    classifications = _classifications(git_state)
+
+    unknown = set(
+        staged.blob for staged in staged_files
+        if staged.path not in attributes and
+        not staged.path.endswith('.py') and
+        classifications.get(staged.blob) is None)
+    with profiling.command(_CAT_FILE):
+        prefixes = batch.read_prefixes(sorted(unknown), _SNIFF_SIZE)
+    for blob in unknown:
+        classifications.set(
+            blob, _has_python_shebang(prefixes.get(blob, b'')))
+    classifications.save()
+
+    python_files = []
+    for staged in staged_files:
+        is_python = attributes.get(staged.path)
+        if is_python is None:
+            is_python = staged.path.endswith('.py') or \
+                classifications.get(staged.blob)
+        if is_python:
+            python_files.append(staged)
+    return python_files
+
+
+def _shard(python_files, shard, timings_path=None):
+    """ Returns the files linted by one shard of the run
+
+    :type python_files: list
+    :param python_files: StagedFile tuples of all Python files
+    :type shard: tuple
+    :param shard: (i, n) for the i-th of n shards, counting from 1
+    :type timings_path: str
+    :param timings_path: JSON file with the lint time of files, to
+        balance the shards by time instead of by size
+    :returns: list -- The StagedFile tuples of the shard, in their order
+        in python_files
+    """
+    with profiling.command(_CAT_FILE_CHECK):
+        blob_sizes = sharding.object_sizes(
+            set(staged.blob for staged in python_files))
+    timings = None
+    if timings_path:
+        if os.path.exists(timings_path):
+            timings = sharding.load_timings(timings_path)
+        else:
+            print('WARNING: {} not found, balancing the shards by file '
+                  'size'.format(timings_path))
+
+    index, count = shard
+    shards = sharding.split(sharding.weights(
+        dict((staged.path, blob_sizes.get(staged.blob, 0))
+             for staged in python_files),
+        timings), count)
+    return [
+        staged for staged in python_files if staged.path in shards[index - 1]
+    ]
 
 
 _SCORE_REGEXP = re.compile(
     r'^Your\ code\ has\ been\ rated\ at\ (\-?[0-9\.]+)/10')
 
 
-def _parse_score(pylint_output):
+def _parse_score(pylint_output, default=0.0):
     """Parse the score out of pylint's output as a float
 
-    If the score is not found, return 0.0.
+    If the score is not found, return default.
 
     """
     for line in pylint_output.splitlines():
         match = re.match(_SCORE_REGEXP, _futurize_str(line))
         if match:
             return float(match.group(1))
-    return 0.0
+    return default
+
+
+# A message in pylint's default text output
+_MESSAGE_REGEXP = re.compile(
+    r'^.*?:([0-9]+):[0-9]+: ([CRWEFI][0-9]{4}): ')
+
+_MESSAGE_TEMPLATE = '{path}:{line}:{column}: {msg_id}: {msg} ({symbol})'
+
+# The fields of a message in pylint's default text output
+_MESSAGE_FIELDS_REGEXP = re.compile(
+    r'^.*?:([0-9]+):([0-9]+): ([CRWEFI][0-9]{4}): (.*) \(([a-z0-9-]+)\)$')
+
+
+def _messages(result):
+    """ Returns the pylint messages of a file
+
+    The messages are read from pylint directly if the engine provides them,
+    or picked from pylint's default text output otherwise.
+
+    :type result: batch.FileResult
+    :param result: The pylint result of the file
+    :returns: list -- (line, message id, formatted message) tuples
+    """
+    if result.messages is not None:
+        return [
+            (msg.line, msg.msg_id, _MESSAGE_TEMPLATE.format(**msg._asdict()))
+            for msg in result.messages
+        ]
+
+    messages = []
+    for line in result.output.splitlines():
+        match = re.match(_MESSAGE_REGEXP, line)
+        if match:
+            messages.append((int(match.group(1)), match.group(2), line))
+    return messages
+
+
+def _message_fields(result):
+    """ Returns the pylint messages of a file as dicts
+
+    :type result: batch.FileResult
+    :param result: The pylint result of the file
+    :returns: list -- Dicts with the line, column, msg_id, symbol and
+        message of every message
+    """
+    if result.messages is not None:
+        return [
+            {
+                'line': msg.line,
+                'column': msg.column,
+                'msg_id': msg.msg_id,
+                'symbol': msg.symbol,
+                'message': msg.msg,
+            }
+            for msg in result.messages
+        ]
+
+    messages = []
+    for line in result.output.splitlines():
+        match = re.match(_MESSAGE_FIELDS_REGEXP, line)
+        if match:
+            messages.append({
+                'line': int(match.group(1)),
+                'column': int(match.group(2)),
+                'msg_id': match.group(3),
+                'symbol': match.group(5),
+                'message': match.group(4),
+            })
+    return messages
+
+
+def _moved_output(output, old_path, new_path):
+    """ Returns the output of pylint for a file that was moved
+
+    :type output: str
+    :param output: pylint's output for the file at old_path
+    :type old_path: str
+    :param old_path: The path the file was linted at
+    :type new_path: str
+    :param new_path: The path the file was moved to
+    :returns: str -- The output, with the messages and the module header
+        at new_path
+    """
+    lines = []
+    for line in output.split('\n'):
+        if line.startswith(old_path + ':'):
+            line = new_path + line[len(old_path):]
+        elif line.startswith(_MODULE_HEADER):
+            line = _MODULE_HEADER + _module_name(new_path)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _module_name(path):
+    """ Returns the name pylint gives the module of a file
+
+    The packages are the directories above the file holding an
+    ``__init__.py``.
+
+    :type path: str
+    :param path: Path of the file
+    :returns: str -- The dotted module name
+    """
+    directory, filename = os.path.split(path)
+    names = []
+    if filename != '__init__.py':
+        names.append(os.path.splitext(filename)[0])
+    while directory and \
+            os.path.exists(os.path.join(directory, '__init__.py')):
+        directory, name = os.path.split(directory)
+        names.insert(0, name)
+    return '.'.join(names) or '__init__'
+
+
+def _messages_on_lines(result, lines):
+    """ Returns the pylint messages of a file that are on the given lines
+
+    :type result: batch.FileResult
+    :param result: The pylint result of the file
+    :type lines: set
+    :param lines: Line numbers to keep messages for
+    :returns: list -- The messages, formatted like pylint's text output
+    """
+    return [
+        message for line, _, message in _messages(result) if line in lines
+    ]
+
+
+def _error_messages(result, lines=None):
+    """ Returns the error and fatal pylint messages of a file
+
+    :type result: batch.FileResult
+    :param result: The pylint result of the file
+    :type lines: set
+    :param lines: Line numbers to keep errors for, or None to keep them
+        all. Fatal messages are always kept
+    :returns: list -- The messages, formatted like pylint's text output
+    """
+    return [
+        message for line, msg_id, message in _messages(result)
+        if msg_id[0] == 'F' or msg_id[0] == 'E' and (
+            lines is None or line in lines)
+    ]
 
 
 _IGNORE_REGEXT = re.compile(
@@ -119,13 +652,14 @@ def _check_ignore(pylint_output):
 
 
 @contextlib.contextmanager
-def _stash_unstaged():
+def _stash_unstaged(git_state=None):
     """Stashes any changes on entry and restores them on exit.
 
     If there is no initial commit, print a warning and do nothing.
 
     """
-    if _current_commit() != 'HEAD':
+    git_state = git_state or _GitState()
+    if not git_state.has_head:
         # git stash doesn't work with no initial commit, so warn and do nothing
         print('WARNING: unable to stash changes with no initial commit')
         yield
@@ -136,32 +670,58 @@ def _stash_unstaged():
     original_stash = _current_stash()
     # leave a message marking the stash as ours in case something goes wrong
     # so that the user can work out what happened and fix things manually
-    subprocess.check_call('git stash save -q --keep-index '
-                          'git-pylint-commit-hook'.split())
+    cmd = 'git stash save -q --keep-index git-pylint-commit-hook'.split()
+    with profiling.command(cmd):
+        subprocess.check_call(cmd)
     stashed = original_stash != _current_stash()
     if stashed:
         print('Unstaged changes were detected and stashed')
+    git_state.worktree_matches_index = True
 
     try:
         # let the caller do whatever they wanted to do
         # (but we still want to restore the tree if an exception was thrown)
         yield
     finally:
+        git_state.worktree_matches_index = False
         # only restore if we actually stashed something
         if stashed:
             print('Restoring stashed changes')
             # avoid merge issues
-            subprocess.check_call('git reset --hard -q'.split())
+            cmd = 'git reset --hard -q'.split()
+            with profiling.command(cmd):
+                subprocess.check_call(cmd)
             # restore everything to how it was
-            subprocess.check_call('git stash pop --index -q'.split())
+            cmd = 'git stash pop --index -q'.split()
+            with profiling.command(cmd):
+                subprocess.check_call(cmd)
 
 
 @contextlib.contextmanager
-def _noop():
+def _noop(_git_state=None):
     """A context manager that does nothing."""
     yield
 
 
+@contextlib.contextmanager
+def _profiled(stash_context, git_state, profiler):
+    """ Time the stash and restore of stash_context as the stash phase
+
+    The commands run in the block are recorded by the profiler, which is
+    stopped once the tree has been restored.
+    """
+    profiler.switch('stash')
+    try:
+        with profiling.activate(profiler), stash_context(git_state):
+            profiler.switch('git')
+            try:
+                yield
+            finally:
+                profiler.switch('stash')
+    finally:
+        profiler.stop()
+
+
 def _is_ignored(filename, ignored_paths):
     """ Check if the file should be ignored
 
@@ -172,17 +732,1046 @@ def _is_ignored(filename, ignored_paths):
         List of regular expressions we should validate against
     :returns: bool -- True if the file should be ignored
     """
-    for ignored_path in ignored_paths:
-        if re.findall(ignored_path, filename):
-            return True
+    return ignore.IgnoreMatcher(ignored_paths).match(filename)
 
-    return False
+
+def _pylint_args(pylint_params, pylintrc):
+    """ Build the pylint command line options
+
+    :type pylint_params: str
+    :param pylint_params: Custom pylint parameters to add to the command
+    :type pylintrc: str
+    :param pylintrc: Path to pylintrc file, or None
+    :returns: list -- The options to pass to pylint
+    """
+    args = []
+    if pylint_params:
+        args += pylint_params.split()
+        if '--rcfile' not in pylint_params:
+            if pylintrc:
+                args.append('--rcfile={}'.format(pylintrc))
+    else:
+        if pylintrc:
+            args.append('--rcfile={}'.format(pylintrc))
+
+    return args
+
+
+# The configuration a group of files is linted with. limits picks the
+# limits of files matching its patterns, key identifies the results of the
+# configuration in the cache and the baseline
+_LintConfig = collections.namedtuple(
+    '_LintConfig',
+    'rcfile, pylint, args, limit, limits, key'
+)
+
+
+def _lint_config(rcfile, options, pylint, pylint_params, limit, batched):
+    """ Build the configuration of the files linted with a pylintrc
+
+    The [pre-commit-hook] options of the pylintrc override the command and
+    the limit given to the hook, and add to its pylint parameters. Files
+    with different limits are linted alike, so they share a group.
+
+    :type rcfile: str
+    :param rcfile: Path of the pylintrc, or None
+    :type options: config.HookConfig
+    :param options: The [pre-commit-hook] options of the pylintrc, or None
+    :type pylint: str
+    :param pylint: Path to pylint executable
+    :type pylint_params: str
+    :param pylint_params: Custom pylint parameters
+    :type limit: float
+    :param limit: Minimum score to pass the commit
+    :type batched: bool
+    :param batched: True if the files are linted in a single pylint run,
+        which scores them differently
+    :returns: _LintConfig -- The configuration
+    """
+    if options:
+        if options.command is not None:
+            pylint = options.command
+        if options.params is not None:
+            pylint_params += ' ' + options.params
+        if options.limit is not None:
+            limit = options.limit
+    args = _pylint_args(pylint_params, rcfile)
+    return _LintConfig(
+        rcfile, pylint, args, limit,
+        config.LimitMatcher(options.limits if options else []),
+        (pylint, args, cache.file_digest(rcfile), pylint_version, batched))
+
+
+def _lint_configs(
+        python_files, config_cache, pylintrc, find_rcfiles, pylint,
+        pylint_params, limit, batched):
+    """ Returns the configuration of every file
+
+    Files are linted with the pylintrc of their subproject, if it has one.
+    The files sharing a pylintrc share a _LintConfig and form a group.
+
+    :type python_files: list
+    :param python_files: Files to lint
+    :type config_cache: config.ConfigCache
+    :param config_cache: Finds and loads the pylintrc files
+    :type pylintrc: str
+    :param pylintrc: Path of the pylintrc of the repository, or None
+    :type find_rcfiles: bool
+    :param find_rcfiles: Look for the pylintrc of every subproject
+    :returns: dict -- Mapping files to their _LintConfig. See _lint_config
+        for the other parameters
+    """
+    configs_by_rcfile = {}
+    lint_configs = {}
+    for python_file in python_files:
+        rcfile = pylintrc
+        if find_rcfiles:
+            rcfile = config_cache.directory_rcfile(python_file) or pylintrc
+        if rcfile not in configs_by_rcfile:
+            configs_by_rcfile[rcfile] = _lint_config(
+                rcfile, config_cache.load(rcfile) if rcfile else None,
+                pylint, pylint_params, limit, batched)
+        lint_configs[python_file] = configs_by_rcfile[rcfile]
+    return lint_configs
+
+
+class _OutputParser(object):
+    """ Parser of pylint's text output, fed one line at a time
+
+    Next to the full output it keeps the output without the reports, so
+    a single pylint run serves both views.
+    """
+
+    def __init__(self, max_memory=None):
+        """ Create a parser
+
+        :type max_memory: int
+        :param max_memory: The memory limit of the pylint process in
+            megabytes, or None if it has none
+        """
+        self.max_memory = max_memory
+        self.lines = []
+        self.brief = []
+        self.score = None
+        self.ignored = False
+        self.exceeded = None
+        self._in_report = False
+        self._previous = None
+
+    def feed(self, line):
+        """ Parse the next line of output, including its line break """
+        text = line.rstrip('\r\n')
+        self.lines.append(line)
+
+        match = re.match(_SCORE_REGEXP, text)
+        if match and self.score is None:
+            self.score = float(match.group(1))
+        if re.search(_IGNORE_REGEXT, text):
+            self.ignored = True
+
+        if self._in_report:
+            # The reports end at the rule above the score
+            if match and self._previous and set(self._previous) == set('-'):
+                self._in_report = False
+                self.brief.append(self._previous + '\n')
+        elif text and set(text) == set('=') and self._previous == 'Report':
+            # The reports start with an underlined "Report" heading
+            self._in_report = True
+            self.brief.pop()
+            while len(self.brief) > 1 and not self.brief[-1].strip() and \
+                    not self.brief[-2].strip():
+                self.brief.pop()
+        if not self._in_report:
+            self.brief.append(line)
+        self._previous = text
+
+    def timed_out(self, timeout):
+        """ Note that pylint was killed after timeout seconds """
+        self.exceeded = limits.TIMEOUT
+        self.feed('pylint timed out after {:g} seconds\n'.format(timeout))
+
+    def result(self, filename, status=0, stderr=''):
+        """ Returns the parsed output as a FileResult
+
+        :type filename: str
+        :param filename: The linted file
+        :type status: int
+        :param status: Exit status of pylint
+        :type stderr: str
+        :param stderr: What pylint wrote to stderr
+        :returns: batch.FileResult -- The score is None if pylint did not
+            rate the file
+        """
+        stderr = _futurize_str(stderr)
+        if self.exceeded is None and \
+                limits.out_of_memory(status, stderr, self.max_memory):
+            self.exceeded = limits.OOM
+            self.feed('pylint ran out of memory\n')
+        output = ''.join(self.lines)
+        brief = ''.join(self.brief)
+        if not output and status:
+            # pylint failed without a word on stdout, show what went wrong
+            output = brief = stderr or \
+                'pylint exited with status {}\n'.format(status)
+        return batch.FileResult(
+            filename, self.score, self.ignored, None, output, brief,
+            self.exceeded)
+
+
+class _SpoolingParser(_OutputParser):
+    """ Output parser putting its result in a spool """
+
+    def __init__(self, result_spool, max_memory=None):
+        _OutputParser.__init__(self, max_memory)
+        self.result_spool = result_spool
+
+    def result(self, filename, status=0, stderr=''):
+        """ Finish parsing, see _OutputParser.result
+
+        :returns: int -- The key of the FileResult in the spool
+        """
+        return self.result_spool.put(
+            _OutputParser.result(self, filename, status, stderr))
+
+
+def _parse_result(filename, result):
+    """ Turn the output of a pylint process into a FileResult
+
+    :type filename: str
+    :param filename: The linted file
+    :type result: ExecutionResult
+    :param result: Result of the pylint process
+    :returns: batch.FileResult -- The score is None if pylint did not
+        rate the file
+    """
+    parser = _OutputParser()
+    for line in _futurize_str(result.stdout).splitlines(True):
+        parser.feed(line)
+    return parser.result(filename, result.status, result.stderr)
+
+
+class _Processes(object):
+    """ The pylint processes running for a hook run
+
+    Once cancelled, the running processes are killed and no new ones are
+    started.
+    """
+
+    def __init__(self, max_memory=None):
+        """ Create an empty registry
+
+        :type max_memory: int
+        :param max_memory: Megabytes of memory every process may use at
+            most, or None for no limit
+        """
+        self.max_memory = max_memory
+        self.cancelled = False
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def start(self, cmd, **kwargs):
+        """ Start a process, unless cancelled
+
+        :type cmd: list
+        :param cmd: The command line
+        :returns: subprocess.Popen -- The process, or None if cancelled
+        """
+        with self._lock:
+            if self.cancelled:
+                return None
+            process = subprocess.Popen(
+                limits.command(cmd, self.max_memory), **kwargs)
+            self._running.add(process)
+        return process
+
+    def finished(self, process):
+        """ Forget a process that exited """
+        with self._lock:
+            self._running.discard(process)
+
+    def cancel(self):
+        """ Kill the running processes and start no more
+
+        Returns once the killed processes are gone.
+        """
+        with self._lock:
+            self.cancelled = True
+            running = list(self._running)
+        for process in running:
+            try:
+                process.kill()
+            except OSError:
+                pass
+        for process in running:
+            process.wait()
+
+
+def _lint(filename, cmd, stdin=None, timeout=None, processes=None):
+    """ Run pylint, parsing its output line by line as it is produced
+
+    :type filename: str
+    :param filename: The linted file
+    :type cmd: list
+    :param cmd: The pylint command
+    :type stdin: bytes
+    :param stdin: Contents to feed pylint, for --from-stdin
+    :type timeout: float
+    :param timeout: Seconds after which pylint is killed, or None
+    :type processes: _Processes
+    :param processes: Tracks pylint for cancellation
+    :returns: batch.FileResult -- The score is None if pylint did not
+        rate the file
+    """
+    processes = processes or _Processes()
+    parser = _OutputParser(processes.max_memory)
+    # stderr goes to a file so that pylint never blocks on a full pipe
+    # while we are reading stdout
+    with profiling.command(cmd), tempfile.TemporaryFile() as stderr:
+        process = processes.start(
+            cmd,
+            stdin=subprocess.PIPE if stdin is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=stderr
+        )
+        if process is None:
+            parser.feed('pylint was cancelled\n')
+            return parser.result(filename)
+        killed = []
+
+        def kill():
+            killed.append(True)
+            process.kill()
+
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+        try:
+            if stdin is not None:
+                # pylint reads all of stdin before it writes anything
+                process.stdin.write(stdin)
+                process.stdin.close()
+            for line in iter(process.stdout.readline, b''):
+                parser.feed(line.decode('utf-8', 'replace'))
+            process.stdout.close()
+            status = process.wait()
+        finally:
+            if timer is not None:
+                timer.cancel()
+            processes.finished(process)
+        if killed:
+            parser.timed_out(timeout)
+        stderr.seek(0)
+        return parser.result(filename, status, stderr.read())
+
+
+def _split_batch_output(output):
+    """ Split the output of a batched pylint run into per file sections
+
+    :type output: str
+    :param output: Output of git_pylint_commit_hook.batch
+    :returns: dict -- Mapping file names to their part of the output
+    """
+    sections = {}
+    filename = None
+    for line in _futurize_str(output).splitlines(True):
+        if line.startswith(batch.SEPARATOR):
+            filename = line[len(batch.SEPARATOR):].rstrip('\n')
+            sections[filename] = ''
+        elif filename is not None:
+            sections[filename] += line
+    return sections
+
+
+def _run_batches(
+        pool, command, python_files, jobs, weights=None, result_spool=None,
+        arguments=None):
+    """ Lint files in one pylint run per worker
+
+    Without weights the files are split in contiguous chunks, so that the
+    results of the first chunk can be reported while the others are still
+    running. With weights, the chunks are balanced to finish at about the
+    same time instead.
+
+    :type pool: multiprocessing.pool.ThreadPool
+    :param pool: Worker pool to run the batches in
+    :type command: list
+    :param command: Batch command, without the files to lint
+    :type python_files: list
+    :param python_files: Files to lint
+    :type jobs: int
+    :param jobs: Number of batches to split the files in
+    :type weights: dict
+    :param weights: Mapping files to the time they are expected to take
+    :type result_spool: spool.OutputSpool
+    :param result_spool: Holds the results of finished batches until they
+        are yielded
+    :type arguments: dict
+    :param arguments: Mapping files to the command line arguments naming
+        them, if not the files themselves
+    :returns: iterator -- A FileResult per file, in order. The batches
+        are started right away
+    """
+    if not python_files:
+        return iter([])
+    if weights:
+        shards = sharding.split(
+            dict((python_file, weights[python_file])
+                 for python_file in python_files),
+            min(jobs, len(python_files)))
+        chunks = [
+            [python_file for python_file in python_files
+             if python_file in shard]
+            for shard in shards
+        ]
+    else:
+        size = -(-len(python_files) // jobs)
+        chunks = [
+            python_files[i:i + size]
+            for i in range(0, len(python_files), size)
+        ]
+    arguments = arguments or {}
+    runs = [
+        pool.apply_async(_execute, (
+            command + ['--'] +
+            [arguments.get(python_file, python_file) for python_file in chunk],
+        ))
+        for chunk in chunks
+    ]
+    return _batch_results(python_files, chunks, runs, result_spool)
+
+
+def _batch_results(python_files, chunks, runs, result_spool=None):
+    """ Yield the results of batched runs in the order of the files
+
+    The output of a batch is split into the results of its files as soon
+    as the first of them is yielded, and the results wait in result_spool,
+    if given, for their turn.
+    """
+    chunk_of = dict(
+        (python_file, i)
+        for i, chunk in enumerate(chunks) for python_file in chunk)
+    results = {}
+    for python_file in python_files:
+        if python_file not in results:
+            i = chunk_of[python_file]
+            run = runs[i].get()
+            sections = _split_batch_output(run.stdout)
+            for path in chunks[i]:
+                result = _parse_result(path, ExecutionResult(
+                    run.status, sections.pop(path, ''), run.stderr))
+                results[path] = result_spool.put(result) \
+                    if result_spool else result
+        result = results.pop(python_file)
+        yield result_spool.pop(result) if result_spool else result
+
+
+def _run_grouped(python_files, lint_configs, run):
+    """ Lint the files sharing a configuration together, a group at a time
+
+    :type python_files: list
+    :param python_files: Files to lint
+    :type lint_configs: dict
+    :param lint_configs: Mapping files to their _LintConfig
+    :type run: function
+    :param run: Lints the files of a group, called with their _LintConfig
+        and paths. Returns an iterable of their results, in order
+    :returns: iterator -- A result per file, in order
+    """
+    groups = collections.OrderedDict()
+    for python_file in python_files:
+        groups.setdefault(
+            lint_configs[python_file].rcfile, []).append(python_file)
+    results = dict(
+        (rcfile, iter(run(lint_configs[paths[0]], paths)))
+        for rcfile, paths in groups.items())
+    return (
+        next(results[lint_configs[python_file].rcfile])
+        for python_file in python_files)
+
+
+def _pylint_command(lint_config, python_file, from_stdin=False):
+    """ Returns the command linting a file in a pylint process of its own
+
+    :type lint_config: _LintConfig
+    :param lint_config: Configuration of the file
+    :type python_file: str
+    :param python_file: The file to lint
+    :type from_stdin: bool
+    :param from_stdin: Feed pylint the contents on stdin
+    :returns: list -- The command line
+    """
+    if from_stdin:
+        return [lint_config.pylint] + lint_config.args + [
+            '--from-stdin', python_file]
+    return [lint_config.pylint] + lint_config.args + [python_file]
+
+
+class _Engine(object):
+    """ Lints files with the engine chosen for the run
+
+    In order of preference, files are linted by a listening daemon, in
+    process, in batched pylint processes, or one by one on the asyncio
+    runner or the thread pool. The staged files and the committed versions
+    of modified files go through the same engine, so their scores compare.
+    If the daemon fails, the next engine takes over for the rest of the
+    run.
+    """
+
+    def __init__(
+            self, pool, jobs, lint_configs, result_spool, processes,
+            profiler, weights, timeout=None, in_process=False,
+            batch_mode=False, use_asyncio=False, server_path=None,
+            server_blobs=None):
+        """ Create an engine
+
+        :type pool: multiprocessing.pool.ThreadPool
+        :param pool: Runs pylint processes and batches in the background
+        :type jobs: int
+        :param jobs: Number of pylint processes to run at once
+        :type lint_configs: dict
+        :param lint_configs: Mapping files to their _LintConfig
+        :type result_spool: spool.OutputSpool
+        :param result_spool: Holds the results until they are reported
+        :type processes: _Processes
+        :param processes: Tracks the pylint processes for cancellation
+        :type profiler: profiling.Profiler
+        :param profiler: Records the time spent linting every file
+        :type weights: dict
+        :param weights: Mapping files to the time they are expected to take
+        :type timeout: float
+        :param timeout: Seconds after which a pylint process linting a
+            single file is killed, or None
+        :type server_path: str
+        :param server_path: Socket of the daemon to lint with, or None
+        :type server_blobs: dict
+        :param server_blobs: Mapping paths of staged files to their blob
+            ids, so the daemon can tell which cached modules changed
+        """
+        self.pool = pool
+        self.jobs = jobs
+        self.lint_configs = lint_configs
+        self.result_spool = result_spool
+        self.processes = processes
+        self.profiler = profiler
+        self.weights = weights
+        self.timeout = timeout
+        self.in_process = in_process
+        self.batch_mode = batch_mode
+        self.use_asyncio = use_asyncio
+        self.server_path = server_path
+        self.server_blobs = server_blobs
+        self.runner = None
+        # Paths of the files linted one by one, as they finish
+        self.finished = queue.Queue()
+
+    @property
+    def ordered(self):
+        """ True if the results have to be waited for in order """
+        return self.server_path is not None or self.in_process or \
+            self.batch_mode
+
+    def close(self):
+        """ Stop the asyncio runner, if one was started """
+        if self.runner:
+            self.runner.close()
+
+    def lint(self, python_files, contents=None, blobs=None, record=True):
+        """ Start linting files
+
+        :type python_files: list
+        :param python_files: Files to lint
+        :type contents: dict
+        :param contents: Source to lint in place of the files on disk
+        :type blobs: dict
+        :param blobs: Mapping files to the blob ids of their contents, so
+            batched pylint processes read them from git. Required with
+            contents
+        :type record: bool
+        :param record: Record the lint times of files linted one by one
+            and put them in finished as they are done
+        :returns: dict -- Mapping files to functions waiting for their
+            batch.FileResult. If ordered, they are called in the order of
+            python_files
+        """
+        if not python_files:
+            return {}
+        results = None
+        if self.server_path is not None:
+            results = self._serve(python_files, contents)
+        if results is not None:
+            pass
+        elif self.in_process:
+            results = _run_grouped(
+                python_files, self.lint_configs,
+                lambda lint_config, paths: batch.run(
+                    lint_config.args, paths, contents))
+        elif self.batch_mode:
+            command = [sys.executable, batch.__file__]
+            arguments = None
+            if contents is not None:
+                command.append('--blobs')
+                arguments = dict(
+                    (python_file, '{}:{}'.format(
+                        blobs[python_file], python_file))
+                    for python_file in python_files)
+            results = _run_grouped(
+                python_files, self.lint_configs,
+                lambda lint_config, paths: _run_batches(
+                    self.pool, command + lint_config.args, paths,
+                    self.jobs, self.weights, self.result_spool, arguments))
+        else:
+            return self._lint_each(python_files, contents, record)
+        results = iter(results)
+        return dict(
+            (python_file, functools.partial(next, results))
+            for python_file in python_files)
+
+    def _serve(self, python_files, contents):
+        """ Lint with the daemon, returning None if it failed """
+        # pylint: disable=import-outside-toplevel
+        from git_pylint_commit_hook import server
+
+        try:
+            results = list(_run_grouped(
+                python_files, self.lint_configs,
+                lambda lint_config, paths: server.lint(
+                    self.server_path, lint_config.args, paths, contents,
+                    self.server_blobs) or [None] * len(paths)))
+        except server.ServerError as error:
+            print('WARNING: the pylint daemon failed, linting without '
+                  'it\n{}'.format(error))
+            results = None
+        # A socket left behind with no daemon listening on it
+        if results is None or None in results:
+            self.server_path = None
+            return None
+        return results
+
+    def _lint_each(self, python_files, contents, record):
+        """ Start a pylint process per file, the slowest files first """
+        if self.use_asyncio and self.runner is None:
+            # pylint: disable=import-outside-toplevel
+            from git_pylint_commit_hook import aio
+
+            self.runner = aio.Runner(
+                self.jobs, self.timeout, self.profiler,
+                self.processes.max_memory)
+        pending = {}
+        for python_file in sorted(
+                python_files, key=lambda path: -self.weights[path]):
+            stdin = contents[python_file] if contents is not None else None
+            command = _pylint_command(
+                self.lint_configs[python_file], python_file,
+                stdin is not None)
+            if self.runner:
+                future = self.runner.lint(
+                    python_file, command, stdin,
+                    _SpoolingParser(
+                        self.result_spool, self.processes.max_memory),
+                    record)
+                if record:
+                    future.add_done_callback(
+                        lambda _, path=python_file: self.finished.put(path))
+                key = future.result
+            else:
+                key = self.pool.apply_async(
+                    self._execute, (python_file, command, stdin, record)).get
+            pending[python_file] = functools.partial(self._pop, key)
+        return pending
+
+    def _execute(self, python_file, command, stdin, record):
+        """ Run pylint on the thread pool
+
+        :returns: int -- The key of the result in result_spool
+        """
+        start = time.time()
+        try:
+            return self.result_spool.put(_lint(
+                python_file, command, stdin, self.timeout, self.processes))
+        finally:
+            if record:
+                self.profiler.record_file(python_file, time.time() - start)
+                self.finished.put(python_file)
+
+    def _pop(self, key):
+        return self.result_spool.pop(key())
+
+
+def _find_dependents(
+        git_state, python_files, ignored, index, depth, budget):
+    """ Returns the modules importing the files to lint
+
+    :type python_files: list
+    :param python_files: StagedFile of the files to lint
+    :type ignored: ignore.IgnoreMatcher
+    :param ignored: Patterns of the files to leave out
+    :type index: bool
+    :param index: The files are linted from the index
+    :type depth: int
+    :param depth: Number of import levels to follow
+    :type budget: int
+    :param budget: Maximum number of dependents
+    :returns: list -- A StagedFile per dependent, with its tracked blob
+    """
+    import_index = _import_index(git_state)
+    tracked_blobs = import_index.update()
+    found = []
+    for path in import_index.dependents(
+            [staged.path for staged in python_files], depth, budget):
+        # Dependents deleted from the working tree are left to the commit
+        # deleting them
+        if not ignored.match(path) and (index or os.path.exists(path)):
+            found.append(StagedFile(
+                path, '', tracked_blobs[path], tracked_blobs[path], path))
+    return found
+
+
+def _dependent_lines(path, python_files, index_contents):
+    """ Returns the lines of a dependent involving the other linted files
+
+    :type path: str
+    :param path: Path of the dependent
+    :type python_files: list
+    :param python_files: StagedFile of the linted files, dependents
+        included, as a dependent may import another one
+    :type index_contents: dict
+    :param index_contents: Staged contents of the files if linted from the
+        index, or None
+    :returns: set -- Line numbers, see dependents.related_lines
+    """
+    if index_contents is not None:
+        source = index_contents.get(path, b'')
+    else:
+        try:
+            with open(path, 'rb') as file_handle:
+                source = file_handle.read()
+        except (IOError, OSError):
+            source = b''
+    return dependents.related_lines(
+        path, source,
+        [staged.path for staged in python_files if staged.path != path])
+
+
+def _look_up_cache(
+        lint_cache, linted_blobs, staged_files_by_path, lint_configs,
+        dependent_files, result_spool):
+    """ Find the results of the files linted before
+
+    A file moved without changes reuses the result of its old path.
+
+    :type lint_cache: cache.LintCache
+    :param lint_cache: The cache of pylint results
+    :type linted_blobs: dict
+    :param linted_blobs: Mapping files to the blob ids pylint will see
+    :type staged_files_by_path: dict
+    :param staged_files_by_path: Mapping files to their StagedFile
+    :type lint_configs: dict
+    :param lint_configs: Mapping files to their _LintConfig
+    :type dependent_files: set
+    :param dependent_files: Dependents, whose results depend on the
+        changed modules and are never cached
+    :type result_spool: spool.OutputSpool
+    :param result_spool: Holds the cached results until they are reported
+    :returns: tuple -- The keys of the cached results in result_spool and
+        the cache keys of the files, both by path
+    """
+    cached = {}
+    cache_keys = {}
+    for python_file, blob in linted_blobs.items():
+        if python_file in dependent_files:
+            continue
+        key = lint_configs[python_file].key
+        cache_keys[python_file] = lint_cache.key(python_file, blob, key)
+        value = lint_cache.get(cache_keys[python_file])
+        head_path = staged_files_by_path[python_file].head_path
+        if value is None and head_path != python_file and \
+                blob == staged_files_by_path[python_file].head_blob:
+            # A file moved without changes rates as it did before
+            value = lint_cache.get(lint_cache.key(head_path, blob, key))
+            if value is not None:
+                value = dict(
+                    value,
+                    output=_moved_output(
+                        value['output'], head_path, python_file),
+                    brief=_moved_output(
+                        value.get('brief', value['output']),
+                        head_path, python_file))
+        if value is not None:
+            cached[python_file] = result_spool.put(batch.FileResult(
+                python_file, value['score'], value['ignored'], None,
+                value['output'], value.get('brief', value['output']),
+                None))
+    return cached, cache_keys
+
+
+def _look_up_baselines(baselines, python_files, linted_blobs, lint_configs):
+    """ Find the scores of the committed versions of modified files
+
+    :type baselines: dict
+    :param baselines: Mapping pylintrc files to their cache.Baseline
+    :type python_files: list
+    :param python_files: StagedFile of the files to lint
+    :type linted_blobs: dict
+    :param linted_blobs: Mapping files to the blob ids pylint will see
+    :type lint_configs: dict
+    :param lint_configs: Mapping files to their _LintConfig
+    :returns: tuple -- The scores by path, and the StagedFile of the
+        modified files whose committed version has no score yet
+    """
+    scores = {}
+    missing = []
+    for staged in python_files:
+        if staged.status not in ('M', 'R', 'C') or \
+                staged.path not in linted_blobs:
+            continue
+        baseline = baselines[lint_configs[staged.path].rcfile]
+        score = baseline.get(staged.path, staged.head_blob)
+        if score is None:
+            score = baseline.get(staged.head_path, staged.head_blob)
+        if score is None:
+            missing.append(staged)
+        else:
+            scores[staged.path] = score
+    return scores, missing
+
+
+def _lint_committed(engine, missing):
+    """ Start linting the committed versions of modified files
+
+    They are linted at the path of the staged version, so that renamed
+    files are rated like the file they became.
+
+    :type engine: _Engine
+    :param engine: The engine linting the staged files
+    :type missing: list
+    :param missing: StagedFile of the modified files
+    :returns: function -- Waits for the scores, in the order of missing
+    """
+    with profiling.command(_CAT_FILE):
+        objects = batch.read_objects(staged.head_blob for staged in missing)
+    pending = engine.lint(
+        [staged.path for staged in missing],
+        dict((staged.path, objects[staged.head_blob]) for staged in missing),
+        dict((staged.path, staged.head_blob) for staged in missing),
+        record=False)
+    return lambda: [pending[staged.path]().score for staged in missing]
+
+
+def _verdict(
+        result, limit, file_limit=None, previous_score=None,
+        changed_lines=None, max_new_messages=0, dependent_lines=None):
+    """ Decide whether a file passes
+
+    :type result: batch.FileResult
+    :param result: The result of the file
+    :type limit: float
+    :param limit: Minimum score of the files of its configuration
+    :type file_limit: float
+    :param file_limit: Minimum score set for the file by the limits
+        option, or None
+    :type previous_score: float
+    :param previous_score: Score of the committed version to compare with
+        instead of the limit, or None
+    :type changed_lines: set
+    :param changed_lines: Lines changed by the commit, to gate on the
+        messages on them instead, or None
+    :type max_new_messages: int
+    :param max_new_messages: Maximum number of messages on changed_lines
+    :type dependent_lines: set
+    :param dependent_lines: Lines involving the linted modules if the file
+        is a dependent, failing on the errors on them only, or None
+    :returns: tuple -- (passed, messages, flag): messages are shown in
+        place of the output if not None, flag tells what the file was
+        compared with
+    """
+    if dependent_lines is not None:
+        # Only errors involving the linted modules count, so the ones the
+        # dependent had before the commit do not block it
+        messages = _error_messages(result, dependent_lines)
+        return not messages, messages, 'DEPENDENT'
+    if changed_lines is not None:
+        messages = _messages_on_lines(result, changed_lines)
+        passed = result.score is not None and \
+            len(messages) <= max_new_messages
+        return passed, messages, '{} NEW'.format(len(messages))
+    score = result.score or 0.0
+    if previous_score is not None:
+        return (
+            round(score, 2) >= round(previous_score, 2), None,
+            'BASELINE {:.2f}'.format(previous_score))
+    if file_limit is not None:
+        return (
+            score >= float(file_limit), None,
+            'LIMIT {:.2f}'.format(file_limit))
+    return score >= float(limit), None, None
+
+
+def _status(result, passed):
+    """ Returns the status of a file, see check_repo """
+    if result.exceeded:
+        # pylint ran into the timeout or the memory limit
+        return result.exceeded
+    if result.ignored or passed:
+        return 'PASSED'
+    if result.score is None and not result.output:
+        # pylint produced no output but also no errors
+        return 'SKIPPED'
+    return 'FAILED'
+
+
+def _shown_output(result, messages, suppress_report):
+    """ Returns the output to show for a file that did not pass """
+    if result.exceeded:
+        return result.brief
+    if messages is not None:
+        return '\n'.join(messages) + '\n'
+    if suppress_report:
+        return result.brief
+    return result.output
+
+
+def _print_verdict(
+        result, status, flag, cached, show_output, messages,
+        suppress_report):
+    """ Print the score and status of a file, and its output if asked to
+
+    :type result: batch.FileResult
+    :param result: The result of the file
+    :type status: str
+    :param status: Its status
+    :type flag: str
+    :param flag: What the file was compared with, see _verdict
+    :type cached: bool
+    :param cached: The result came from the cache
+    :type show_output: bool
+    :param show_output: Also print the output, see _shown_output
+    """
+    flags = [status]
+    if result.ignored:
+        flags.append('IGNORED')
+    if cached:
+        flags.append('CACHED')
+    if flag:
+        flags.append(flag)
+    print('{:.2}/10.00\t{}'.format(
+        decimal.Decimal(result.score or 0.0), '\t'.join(flags)))
+    if show_output:
+        print(_shown_output(result, messages, suppress_report))
+
+
+def _store_result(lint_cache, key, result):
+    """ Cache the result of a file
+
+    Only files pylint rated or skipped without a word are cached, not
+    crashes, syntax errors or runs cut short by a limit, which is not part
+    of the key.
+    """
+    if not result.exceeded and (
+            result.score is not None or not result.output):
+        lint_cache.put(key, {
+            'score': result.score,
+            'ignored': result.ignored,
+            'output': result.output,
+            'brief': result.brief,
+        })
+
+
+def _lint_cache(git_state):
+    """ Returns the cache of pylint results stored in the .git directory """
+    return cache.LintCache(
+        os.path.join(git_state.git_dir, 'git-pylint-commit-hook', 'cache'))
+
+
+def _baseline(git_state, config_key, rcfile=None):
+    """ Returns the baseline scores stored in the .git directory
+
+    Subprojects linted with a pylintrc of their own get a baseline of their
+    own, named after the pylintrc.
+    """
+    name = 'baseline.json'
+    if rcfile:
+        name = 'baseline-{}.json'.format(
+            cache.LintCache.key(os.path.abspath(rcfile))[:16])
+    return cache.Baseline(
+        os.path.join(git_state.git_dir, 'git-pylint-commit-hook', name),
+        cache.LintCache.key(config_key))
+
+
+def _classifications(git_state):
+    """ Returns the classifications of blobs stored in the .git directory
+    """
+    return cache.Classifications(
+        os.path.join(
+            git_state.git_dir, 'git-pylint-commit-hook', 'classified.json'))
+
+
+def _timings(git_state):
+    """ Returns the lint times of files stored in the .git directory """
+    return cache.Timings(
+        os.path.join(
+            git_state.git_dir, 'git-pylint-commit-hook', 'timings.json'))
+
+
+def _config_cache(git_state):
+    """ Returns the pylintrc files and options cached in the .git directory
+    """
+    return config.ConfigCache(
+        os.path.join(
+            git_state.git_dir, 'git-pylint-commit-hook', 'config.json'))
+
+
+def _import_index(git_state):
+    """ Returns the import index stored in the .git directory """
+    return dependents.ImportIndex(
+        os.path.join(
+            git_state.git_dir, 'git-pylint-commit-hook', 'imports.json'))
+
+
+def _cpu_count():
+    """ Returns the number of CPUs, the default number of jobs """
+    # pylint: disable=import-outside-toplevel
+    import multiprocessing
+
+    return multiprocessing.cpu_count()
+
+
+def serve():
+    """ Run the pylint daemon of the current repository until interrupted
+
+    :returns: int -- Exit code
+    """
+    # pylint: disable=import-outside-toplevel
+    from git_pylint_commit_hook import server
+
+    return server.serve(_git_dir())
+
+
+def _write_empty_results(
+        shard, shard_results, total_files, output_format, output_file):
+    """ Write the results of a run that had no files to lint """
+    if shard_results:
+        sharding.write_results(shard_results, shard, True, {}, total_files)
+    if output_format:
+        # pylint: disable=import-outside-toplevel
+        from git_pylint_commit_hook import reporting
+
+        reporting.create(output_format, output_file).close(True)
 
 
 def check_repo(
         limit, pylint='pylint', pylintrc=None, pylint_params='',
         suppress_report=False, always_show_violations=False,
-        ignored_files=None, stash=False):
+        ignored_files=None, stash=False, jobs=None, batch_mode=False,
+        in_process=False, use_cache=True, clear_cache=False, index=False,
+        diff_only=False, max_new_messages=0, use_baseline=False,
+        check_dependents=False, dependents_depth=1, dependents_budget=50,
+        profiler=None, ignored_globs=None, ignored_paths=None,
+        use_server=True, use_asyncio=False, timeout=None,
+        revision_range=None, shard=None, shard_timings=None,
+        shard_results=None, output_format=None, output_file=None,
+        fail_fast=False, max_memory=None, allow_timeout=False,
+        allow_oom=False, output_memory=None):
     """ Main function doing the checks
 
     :type limit: float
@@ -201,10 +1790,117 @@ def check_repo(
     :param ignored_files: List of files to exclude from the validation
     :type stash: bool
     :param stash: Stash any unstaged changes while linting
+    :type jobs: int
+    :param jobs: Number of pylint processes to run in parallel.
+        Defaults to the number of CPUs
+    :type batch_mode: bool
+    :param batch_mode: Lint all files in one pylint run per job instead
+        of starting pylint once per file
+    :type in_process: bool
+    :param in_process: Lint all files in one pylint run inside this
+        process, reading the results from pylint directly
+    :type use_cache: bool
+    :param use_cache: Reuse the results of files whose contents and
+        pylint configuration have been linted before
+    :type clear_cache: bool
+    :param clear_cache: Remove all cached results before linting
+    :type index: bool
+    :param index: Lint the staged contents of the files straight from the
+        index, leaving the working tree alone. Makes stash unnecessary
+    :type diff_only: bool
+    :param diff_only: Gate on the messages on lines added or modified by
+        the commit instead of the score of the whole file
+    :type max_new_messages: int
+    :param max_new_messages: Maximum number of messages allowed on the
+        changed lines of a file in diff_only mode
+    :type use_baseline: bool
+    :param use_baseline: Fail modified files only if their score dropped
+        below the score of the committed version
+    :type check_dependents: bool
+    :param check_dependents: Also lint the modules importing the staged
+        modules, failing on pylint errors in them
+    :type dependents_depth: int
+    :param dependents_depth: Number of import levels to follow when
+        looking for dependents
+    :type dependents_budget: int
+    :param dependents_budget: Maximum number of dependents to lint
+    :type profiler: profiling.Profiler
+    :param profiler: Records the time spent in every phase of the run
+    :type ignored_globs: list
+    :param ignored_globs: Globs of files to exclude from the validation
+    :type ignored_paths: list
+    :param ignored_paths: gitignore-style patterns of files to exclude
+        from the validation
+    :type use_server: bool
+    :param use_server: Lint with the pylint daemon of the repository if
+        one is listening, see server.py
+    :type use_asyncio: bool
+    :param use_asyncio: Run git and pylint processes on an asyncio event
+        loop instead of a thread pool
+    :type timeout: float
+    :param timeout: Seconds after which a pylint process linting a single
+        file is killed, or None to wait for as long as it takes
+    :type revision_range: str
+    :param revision_range: Lint the files changed by a range of commits,
+        like "origin/main..HEAD", instead of the staged files. With index,
+        their contents at the end of the range are linted
+    :type shard: tuple
+    :param shard: (i, n) to lint only the i-th of n shards of the files,
+        counting from 1
+    :type shard_timings: str
+    :param shard_timings: JSON file with the lint time of files, to
+        balance the shards by time, see sharding.load_timings
+    :type shard_results: str
+    :param shard_results: Write the verdict of the run to this file, to be
+        merged with the verdicts of the other shards
+    :type output_format: str
+    :param output_format: Also write the results to output_file in one of
+        reporting.FORMATS
+    :type output_file: str
+    :param output_file: File to write the results to
+    :type fail_fast: bool
+    :param fail_fast: Stop at the first file that fails, killing the
+        pylint processes still running
+    :type max_memory: int
+    :param max_memory: Megabytes of memory a pylint process linting a
+        single file may use at most, or None for no limit
+    :type allow_timeout: bool
+    :param allow_timeout: Pass files pylint did not finish within timeout
+        instead of failing them
+    :type allow_oom: bool
+    :param allow_oom: Pass files pylint ran out of memory on instead of
+        failing them
+    :type output_memory: float
+    :param output_memory: Megabytes of pylint output to hold in memory
+        while files wait to be reported, the rest is moved to a temporary
+        file. Defaults to spool.DEFAULT_MAX_MEMORY
     """
     # Lists are mutable and should not be assigned in function arguments
     if ignored_files is None:
         ignored_files = []
+    if ignored_globs is None:
+        ignored_globs = []
+    if ignored_paths is None:
+        ignored_paths = []
+
+    if profiler is None:
+        profiler = profiling.Profiler()
+
+    if max_memory and not limits.supported():
+        print('WARNING: memory limits are not supported on this platform')
+
+    # The statuses failing the commit
+    failing = set(['FAILED', limits.TIMEOUT, limits.OOM])
+    if allow_timeout:
+        failing.discard(limits.TIMEOUT)
+    if allow_oom:
+        failing.discard(limits.OOM)
+
+    # Git state shared by the whole run
+    git_state = _GitState(revision_range)
+
+    if clear_cache:
+        _lint_cache(git_state).clear()
 
     # List of checked files and their results
     python_files = []
@@ -212,119 +1908,369 @@ def check_repo(
     # Set the exit code
     all_filed_passed = True
 
+    if use_asyncio:
+        # pylint: disable=import-outside-toplevel
+        # Only available on Python 3
+        from git_pylint_commit_hook import aio
+
+        # Read the git state with concurrent processes up front
+        profiler.switch('git')
+        with profiling.activate(profiler):
+            git_state.prefetch(aio.run_all, diff_only)
+
+    # Find the Python files before reading the configuration, which
+    # imports pylint, so a commit without any is done right away. Ignore
+    # patterns only ever leave files out, so they are matched afterwards
+    profiler.switch('git')
+    with profiling.activate(profiler):
+        staged_files = git_state.staged_files()
+        profiler.switch('classify')
+        candidates = _classify(staged_files, git_state)
+    if not candidates:
+        profiler.stop()
+        _write_empty_results(
+            shard, shard_results, 0, output_format, output_file)
+        return True
+
+    profiler.switch('config')
+    config_cache = _config_cache(git_state)
+    # Without a pylintrc given, subprojects may have their own
+    find_rcfiles = pylintrc is None
     if pylintrc is None:
         # If no config is found, use the old default '.pylintrc'
-        pylintrc = pylint_config.find_pylintrc() or '.pylintrc'
+        pylintrc = config_cache.find_pylintrc() or '.pylintrc'
+
+    # Load any pre-commit-hooks options from a .pylintrc file (if there is one)
+    options = config_cache.load(pylintrc)
+    if options is not None:
+        ignored_files = ignored_files + options.ignore
+        ignored_globs = ignored_globs + options.ignore_glob
+        ignored_paths = ignored_paths + options.ignore_path
+    else:
+        pylintrc = None
+
+    # Compile the ignore patterns once for the whole run
+    ignored = ignore.IgnoreMatcher(ignored_files, ignored_globs, ignored_paths)
 
-    if stash:
+    if stash and not index and not revision_range:
         maybe_stash_unstaged = _stash_unstaged
     else:
         maybe_stash_unstaged = _noop
 
     # Optionally stash any unstaged changes while we look at the tree
-    with maybe_stash_unstaged():
-        # Find Python files
-        for filename in _get_list_of_committed_files():
-            try:
-                if not _is_ignored(filename, ignored_files) and \
-                        _is_python_file(filename):
-                    python_files.append((filename, None))
-            except IOError:
+    with _profiled(maybe_stash_unstaged, git_state, profiler):
+        # Keep the Python files that are not ignored
+        for staged in candidates:
+            if ignored.match(staged.path):
+                continue
+            if not index and not os.path.exists(staged.path):
                 print('File not found (probably deleted): {}\t\tSKIPPED'.format(
-                    filename))
+                    staged.path))
+                continue
+            python_files.append(staged)
+
+        # Lint only our share of the files on this node
+        total_files = len(python_files)
+        if shard:
+            python_files = _shard(python_files, shard, shard_timings)
+            print('Linting shard {}/{}: {} of {} files'.format(
+                shard[0], shard[1], len(python_files), total_files))
+
+        index_contents = None
+        if index and revision_range:
+            with profiling.command(_CAT_FILE):
+                objects = batch.read_objects(
+                    staged.blob for staged in python_files)
+            index_contents = dict(
+                (staged.path, objects[staged.blob])
+                for staged in python_files)
+        elif index:
+            with profiling.command(_CAT_FILE):
+                index_contents = batch.read_index(
+                    staged.path for staged in python_files)
 
         # Don't do anything if there are no Python files
         if not python_files:
+            _write_empty_results(
+                shard, shard_results, total_files, output_format,
+                output_file)
             return True
 
-        # Load any pre-commit-hooks options from a .pylintrc file (if there is one)
-        if os.path.exists(pylintrc):
-            conf = configparser.SafeConfigParser()
-            conf.read(pylintrc)
-            if conf.has_option('pre-commit-hook', 'command'):
-                pylint = conf.get('pre-commit-hook', 'command')
-            if conf.has_option('pre-commit-hook', 'params'):
-                pylint_params += ' ' + conf.get('pre-commit-hook', 'params')
-            if conf.has_option('pre-commit-hook', 'limit'):
-                limit = float(conf.get('pre-commit-hook', 'limit'))
-        else:
-            pylintrc = None
-
-        # Pylint Python files
-        i = 1
-        for python_file, score in python_files:
-            # Allow __init__.py files to be completely empty
-            if os.path.basename(python_file) == '__init__.py':
-                if os.stat(python_file).st_size == 0:
+        # Add the unstaged modules importing the staged ones
+        dependent_files = set()
+        if check_dependents:
+            profiler.switch('dependents')
+            found = _find_dependents(
+                git_state, python_files, ignored, index, dependents_depth,
+                dependents_budget)
+            dependent_files.update(staged.path for staged in found)
+            python_files.extend(found)
+            if index:
+                with profiling.command(_CAT_FILE):
+                    index_contents.update(batch.read_index(dependent_files))
+
+        profiler.switch('config')
+        staged_files_by_path = dict(
+            (staged.path, staged) for staged in python_files)
+
+        # pylint: disable=import-outside-toplevel
+        # The daemon, the reports and the thread pool are only imported
+        # once there are files to lint, see _write_empty_results
+        from multiprocessing.pool import ThreadPool
+
+        from git_pylint_commit_hook import reporting
+        from git_pylint_commit_hook import server
+
+        if jobs is None:
+            jobs = _cpu_count()
+
+        # A listening daemon lints like an in process run. It cannot be
+        # held to the time and memory limits of pylint processes
+        server_path = server.socket_path(git_state.git_dir)
+        serving = use_server and not in_process and not timeout and \
+            not max_memory and server.available(server_path)
+
+        lint_configs = _lint_configs(
+            [staged.path for staged in python_files], config_cache,
+            pylintrc, find_rcfiles, pylint, pylint_params, limit,
+            batch_mode or in_process or serving)
+        config_cache.save()
+
+        # Files to lint, allowing __init__.py files to be completely empty
+        empty_inits = set()
+        for python_file in (staged.path for staged in python_files):
+            if index:
+                empty = not index_contents[python_file]
+            else:
+                empty = os.stat(python_file).st_size == 0
+            if os.path.basename(python_file) == '__init__.py' and empty:
+                empty_inits.add(python_file)
+        linted_files = [
+            staged.path for staged in python_files
+            if staged.path not in empty_inits]
+
+        # Results waiting to be reported
+        result_spool = spool.OutputSpool(
+            spool.DEFAULT_MAX_MEMORY if output_memory is None
+            else int(output_memory * 1024 * 1024))
+
+        # Expected lint times, to start the slowest files first. Files
+        # that were never linted one by one are estimated by size
+        timings = _timings(git_state)
+        weights = sharding.weights(dict(
+            (python_file, len(index_contents[python_file]) if index
+             else os.path.getsize(python_file))
+            for python_file in linted_files), timings.seconds)
+
+        # Blob ids of the contents pylint will see. The staged blob can
+        # only be trusted if pylint lints the staged contents
+        staged_blobs = index or git_state.worktree_matches_index
+        linted_blobs = {}
+        if use_cache or use_baseline:
+            for staged in python_files:
+                if staged.path not in empty_inits:
+                    linted_blobs[staged.path] = staged.blob if staged_blobs \
+                        else cache.blob_sha(staged.path)
+
+        # Look up the results of files we have linted before
+        profiler.switch('cache')
+        cached = {}
+        cache_keys = {}
+        lint_cache = _lint_cache(git_state) if use_cache else None
+        if lint_cache:
+            cached, cache_keys = _look_up_cache(
+                lint_cache, linted_blobs, staged_files_by_path, lint_configs,
+                dependent_files, result_spool)
+
+        # The status of every file, for the shard results
+        statuses = collections.OrderedDict()
+        # Written as the files are reported
+        results_output = None
+        if output_format:
+            results_output = reporting.create(output_format, output_file)
+
+        # Run pylint in parallel, reporting the results in order so the
+        # report below stays deterministic
+        profiler.switch('lint')
+        jobs = max(1, jobs)
+        pool = ThreadPool(jobs)
+        processes = _Processes(max_memory)
+        engine = _Engine(
+            pool, jobs, lint_configs, result_spool, processes, profiler,
+            weights, timeout, in_process, batch_mode, use_asyncio,
+            server_path if serving else None,
+            dict((staged.path, staged.blob) for staged in python_files))
+        baselines = {}
+        try:
+            # Find the scores of the committed versions of modified files,
+            # linting the ones missing from the baseline before the staged
+            # ones. head_scores waits for their scores, in order
+            baseline_scores = {}
+            missing = []
+            head_scores = None
+            if use_baseline:
+                for lint_config in lint_configs.values():
+                    if lint_config.rcfile in baselines:
+                        continue
+                    baselines[lint_config.rcfile] = _baseline(
+                        git_state, lint_config.key,
+                        None if lint_config.rcfile == pylintrc
+                        else lint_config.rcfile)
+                baseline_scores, missing = _look_up_baselines(
+                    baselines, python_files, linted_blobs, lint_configs)
+                for python_file, score in baseline_scores.items():
+                    staged = staged_files_by_path[python_file]
+                    if python_file not in cached and \
+                            linted_blobs[python_file] == staged.head_blob and \
+                            not always_show_violations and not results_output:
+                        # A file moved without changes keeps its score.
+                        # Its messages are not recorded, so it is linted
+                        # again when they are shown
+                        cached[python_file] = result_spool.put(
+                            batch.FileResult(
+                                python_file, score, False, None, '', '',
+                                None))
+            if missing:
+                head_scores = _lint_committed(engine, missing)
+
+            pending = engine.lint(
+                [path for path in linted_files if path not in cached],
+                index_contents,
+                dict((staged.path, staged.blob) for staged in python_files))
+
+            # Files are reported in order, or as they finish to fail fast
+            report_order = [staged.path for staged in python_files]
+            if fail_fast and pending and not engine.ordered:
+                report_order = itertools.chain(
+                    [path for path in report_order if path not in pending],
+                    (engine.finished.get() for _ in range(len(pending))))
+
+            # Pylint Python files
+            profiler.switch('report')
+            for i, python_file in enumerate(report_order, 1):
+                dependent = python_file in dependent_files
+                if python_file in empty_inits:
                     print(
                         'Skipping pylint on {} (empty __init__.py)..'
                         '\tSKIPPED'.format(python_file))
-
-                    # Bump parsed files
-                    i += 1
+                    statuses[python_file] = 'SKIPPED'
+                    if results_output:
+                        results_output.add({
+                            'path': python_file,
+                            'score': None,
+                            'status': 'SKIPPED',
+                            'passed': True,
+                            'ignored': False,
+                            'cached': False,
+                            'dependent': dependent,
+                            'duration': None,
+                            'messages': [],
+                        })
                     continue
 
-            # Start pylinting
-            sys.stdout.write("Running pylint on {} (file {}/{})..\t".format(
-                python_file, i, len(python_files)))
-            sys.stdout.flush()
-            try:
-                command = [pylint]
-                if pylint_params:
-                    command += pylint_params.split()
-                    if '--rcfile' not in pylint_params:
-                        if pylintrc:
-                            command.append('--rcfile={}'.format(pylintrc))
+                # Start pylinting
+                sys.stdout.write(
+                    "Running pylint on {} (file {}/{})..\t".format(
+                        python_file, i, len(python_files)))
+                sys.stdout.flush()
+                profiler.switch('lint')
+                if python_file in cached:
+                    result = result_spool.pop(cached[python_file])
                 else:
-                    if pylintrc:
-                        command.append('--rcfile={}'.format(pylintrc))
-
-                command.append(python_file)
-                proc = subprocess.Popen(
-                    command,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE)
-
-                out, _ = proc.communicate()
-            except OSError:
-                print("\nAn error occurred. Is pylint installed?")
-                return False
-
-            # Verify the score
-            score = _parse_score(out)
-            ignored = _check_ignore(out)
-            if ignored or score >= float(limit):
-                status = 'PASSED'
-            elif not out and not proc.returncode:
-                # pylint produced no output but also no errors
-                status = 'SKIPPED'
-            else:
-                status = 'FAILED'
-                all_filed_passed = False
-
-            # Add some output
-            print('{:.2}/10.00\t{}{}'.format(
-                decimal.Decimal(score),
-                status,
-                ignored and '\tIGNORED' or ''))
-
-            status_check_list = ['FAILED']
-
-            if always_show_violations:
-                status_check_list.append('PASSED')
-
-            if status in status_check_list:
-                if suppress_report:
-                    command.append('--reports=n')
-                    proc = subprocess.Popen(
-                        command,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE)
-                    out, _ = proc.communicate()
-
-                print(_futurize_str(out))
-
-            # Bump parsed files
-            i += 1
+                    try:
+                        result = pending.pop(python_file)()
+                    except OSError:
+                        print("\nAn error occurred. Is pylint installed?")
+                        all_filed_passed = False
+                        return False
+
+                    if python_file in profiler.files:
+                        timings.record(
+                            python_file, profiler.files[python_file])
+                    if lint_cache and python_file in cache_keys:
+                        _store_result(
+                            lint_cache, cache_keys[python_file], result)
+
+                # Remember the score of the blob about to be committed
+                staged = staged_files_by_path[python_file]
+                baseline = baselines.get(lint_configs[python_file].rcfile)
+                if baseline and result.score is not None and not dependent \
+                        and linted_blobs[python_file] == staged.blob:
+                    baseline.set(
+                        python_file, staged.blob, result.score,
+                        keep=[staged.head_blob])
+
+                # Wait for the committed versions to be linted
+                if head_scores is not None:
+                    try:
+                        head_scores = head_scores()
+                    except OSError:
+                        print("\nAn error occurred. Is pylint installed?")
+                        all_filed_passed = False
+                        return False
+                    for staged, head_score in zip(missing, head_scores):
+                        baseline_scores[staged.path] = head_score
+                        if head_score is not None:
+                            baselines[lint_configs[staged.path].rcfile].set(
+                                staged.path, staged.head_blob, head_score,
+                                keep=[linted_blobs[staged.path]])
+                    head_scores = None
+
+                # Verify the score, or the messages on the changed lines
+                profiler.switch('report')
+                passed, messages, flag = _verdict(
+                    result, lint_configs[python_file].limit,
+                    lint_configs[python_file].limits.limit(python_file),
+                    baseline_scores.get(python_file),
+                    git_state.changed_lines().get(python_file, set())
+                    if diff_only else None,
+                    max_new_messages,
+                    _dependent_lines(
+                        python_file, python_files, index_contents)
+                    if dependent else None)
+                status = _status(result, passed)
+                if status in failing:
+                    all_filed_passed = False
+                if not dependent:
+                    statuses[python_file] = status
+                if results_output:
+                    results_output.add({
+                        'path': python_file,
+                        'score': result.score,
+                        'status': status,
+                        'passed': status not in failing,
+                        'ignored': result.ignored,
+                        'cached': python_file in cached,
+                        'dependent': dependent,
+                        'duration': 0.0 if python_file in cached
+                                    else profiler.files.get(python_file),
+                        'messages': _message_fields(result),
+                    })
+                _print_verdict(
+                    result, status, flag, python_file in cached,
+                    status in failing or
+                    always_show_violations and status == 'PASSED',
+                    messages, suppress_report)
+
+                if fail_fast and status in failing:
+                    print('Stopping at the first failure (--fail-fast)')
+                    break
+        finally:
+            profiler.switch('cache')
+            processes.cancel()
+            pool.terminate()
+            engine.close()
+            result_spool.close()
+            if results_output:
+                results_output.close(all_filed_passed)
+            if lint_cache:
+                lint_cache.evict()
+            for baseline in baselines.values():
+                baseline.save()
+            timings.save()
+
+    if shard_results:
+        sharding.write_results(
+            shard_results, shard, all_filed_passed, statuses, total_files)
 
     return all_filed_passed
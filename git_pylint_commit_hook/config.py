@@ -0,0 +1,299 @@
+""" Resolution of the pylintrc files and their [pre-commit-hook] options
+
+Finding the pylintrc the way pylint does means importing pylint.config,
+which imports astroid and takes most of a second. The resolved path is
+kept in a JSON file together with the state of every file pylint's
+lookup looks at, so it is only looked up again once one of them changes.
+The [pre-commit-hook] options of every pylintrc are kept there as well,
+keyed by the modification time and size of the file.
+
+Subprojects can have a pylintrc of their own. A file is linted with the
+``pylintrc`` or ``.pylintrc`` closest to it below the repository root,
+or with the pylintrc of the repository if there is none.
+
+The ``limits`` option sets the score limit of the files matching a
+pattern, one pattern and limit per line::
+
+    [pre-commit-hook]
+    limits=
+        src/*               9.0
+        tests/*             7.0
+        re:(^|/)migrations/ 5.0
+
+Patterns are globs matched against the whole path relative to the
+repository root, or regular expressions searched for in the path when
+prefixed with ``re:``. The first matching pattern wins.
+"""
+import collections
+import fnmatch
+import json
+import os
+import re
+
+import configparser
+from pylint import __version__ as pylint_version
+
+from git_pylint_commit_hook import cache
+
+# The section of the pylintrc holding the options of the hook
+SECTION = 'pre-commit-hook'
+
+# The names of the per-directory pylintrc files, in order of preference
+RC_NAMES = ('pylintrc', '.pylintrc')
+
+# The prefix of the patterns of the limits option that are regular
+# expressions
+REGEX_PREFIX = 're:'
+
+# The [pre-commit-hook] options of a pylintrc. command, params and limit
+# are None if they are not set. limits holds [pattern, limit] pairs
+HookConfig = collections.namedtuple(
+    'HookConfig',
+    'command, params, limit, ignore, ignore_glob, ignore_path, limits'
+)
+
+
+def _option_lines(conf, option):
+    """ Returns the lines of a [pre-commit-hook] option, or an empty list
+
+    :type conf: configparser.ConfigParser
+    :param conf: The parsed pylintrc
+    :type option: str
+    :param option: Name of the option
+    :returns: list -- The non-empty lines of the value
+    """
+    if not conf.has_option(SECTION, option):
+        return []
+    return [
+        line.strip()
+        for line in conf.get(SECTION, option).splitlines()
+        if line.strip()
+    ]
+
+
+def _limit_pairs(conf):
+    """ Returns the [pattern, limit] pairs of the limits option
+
+    :type conf: configparser.ConfigParser
+    :param conf: The parsed pylintrc
+    :returns: list -- The pairs, in order
+    :raises: ValueError -- If a line is not a pattern and a number
+    """
+    pairs = []
+    for line in _option_lines(conf, 'limits'):
+        try:
+            pattern, limit = line.rsplit(None, 1)
+            pairs.append([pattern, float(limit)])
+        except ValueError:
+            raise ValueError(
+                'invalid line in the limits of [{}]: {}'.format(
+                    SECTION, line))
+    return pairs
+
+
+class LimitMatcher(object):
+    """ Picks the score limit of paths from the limits option """
+
+    def __init__(self, pairs):
+        """ Compile the patterns
+
+        :type pairs: list
+        :param pairs: [pattern, limit] pairs, as in HookConfig.limits
+        """
+        self._patterns = []
+        for pattern, limit in pairs:
+            if pattern.startswith(REGEX_PREFIX):
+                regexp = re.compile(pattern[len(REGEX_PREFIX):])
+            else:
+                regexp = re.compile('^' + fnmatch.translate(pattern))
+            self._patterns.append((regexp, limit))
+
+    def __bool__(self):
+        return bool(self._patterns)
+
+    __nonzero__ = __bool__
+
+    def limit(self, path, default=None):
+        """ Look up the limit of a path
+
+        :type path: str
+        :param path: Path relative to the repository root
+        :type default: float
+        :param default: Limit of the paths no pattern matches
+        :returns: float -- The limit of the first matching pattern, or
+            default
+        """
+        for regexp, limit in self._patterns:
+            if regexp.search(path):
+                return limit
+        return default
+
+
+def parse(rcfile):
+    """ Read the [pre-commit-hook] options of a pylintrc
+
+    :type rcfile: str
+    :param rcfile: Path of the pylintrc
+    :returns: HookConfig -- The options
+    """
+    conf = configparser.SafeConfigParser()
+    conf.read(rcfile)
+
+    def get(option):
+        if not conf.has_option(SECTION, option):
+            return None
+        return conf.get(SECTION, option)
+
+    limit = get('limit')
+    return HookConfig(
+        get('command'),
+        get('params'),
+        None if limit is None else float(limit),
+        _option_lines(conf, 'ignore'),
+        _option_lines(conf, 'ignore-glob'),
+        _option_lines(conf, 'ignore-path'),
+        _limit_pairs(conf))
+
+
+def _signature(path):
+    """ Returns the modification time and size of a file, or None """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+
+def _lookup_paths():
+    """ Returns the files that decide which pylintrc pylint finds
+
+    These are the candidates of pylint.config.find_pylintrc: the pylintrc
+    files in the working directory, in the parents of the packages it is
+    part of, named by $PYLINTRC, in the home directory and in /etc.
+    """
+    paths = list(RC_NAMES) + ['__init__.py']
+    directory = os.path.abspath(os.getcwd())
+    while os.path.isfile(os.path.join(directory, '__init__.py')):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+        paths.extend(
+            os.path.join(directory, name)
+            for name in RC_NAMES + ('__init__.py',))
+    if 'PYLINTRC' in os.environ:
+        paths.append(os.environ['PYLINTRC'])
+    home = os.path.expanduser('~')
+    paths.extend([
+        os.path.join(home, '.pylintrc'),
+        os.path.join(home, '.config', 'pylintrc'),
+        '/etc/pylintrc',
+    ])
+    return paths
+
+
+class ConfigCache(object):
+    """ The pylintrc files of a repository and their options, kept in a
+    single JSON file
+    """
+
+    def __init__(self, path):
+        """ Load the cache
+
+        :type path: str
+        :param path: Path of the JSON file
+        """
+        self.path = path
+        self.lookup = None
+        self.rcfiles = {}
+        self._directories = {}
+        self._changed = False
+        try:
+            with open(path) as file_handle:
+                data = json.load(file_handle)
+            self.lookup = data['lookup']
+            self.rcfiles = data['rcfiles']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def find_pylintrc(self):
+        """ Find the pylintrc of the working directory like pylint does
+
+        :returns: str -- Path of the pylintrc, or None if there is none
+        """
+        key = [
+            os.path.abspath(os.getcwd()), os.environ.get('PYLINTRC'),
+            os.path.expanduser('~'), pylint_version]
+        paths = _lookup_paths()
+        signatures = [[path, _signature(path)] for path in paths]
+        if self.lookup and self.lookup['key'] == key and \
+                self.lookup['signatures'] == signatures:
+            return self.lookup['rcfile']
+
+        # pylint: disable=import-outside-toplevel
+        from pylint.config import find_pylintrc
+
+        rcfile = find_pylintrc()
+        self.lookup = {
+            'key': key, 'signatures': signatures, 'rcfile': rcfile}
+        self._changed = True
+        return rcfile
+
+    def load(self, rcfile):
+        """ Read the [pre-commit-hook] options of a pylintrc
+
+        :type rcfile: str
+        :param rcfile: Path of the pylintrc
+        :returns: HookConfig -- The options, or None if there is no such
+            file
+        """
+        path = os.path.abspath(rcfile)
+        signature = _signature(path)
+        if signature is None:
+            return None
+
+        entry = self.rcfiles.get(path)
+        if entry and entry['signature'] == signature and \
+                sorted(entry['options']) == sorted(HookConfig._fields):
+            return HookConfig(**entry['options'])
+
+        options = parse(path)
+        self.rcfiles[path] = {
+            'signature': signature, 'options': options._asdict()}
+        self._changed = True
+        return options
+
+    def directory_rcfile(self, filename):
+        """ Find the pylintrc of the subproject a file is part of
+
+        :type filename: str
+        :param filename: Path of the file relative to the repository root
+        :returns: str -- Path of the closest pylintrc in the directories
+            of the file, or None if there is none below the root
+        """
+        directory = os.path.dirname(filename)
+        if not directory:
+            return None
+        if directory not in self._directories:
+            for name in RC_NAMES:
+                rcfile = os.path.join(directory, name)
+                if os.path.isfile(rcfile):
+                    self._directories[directory] = rcfile
+                    break
+            else:
+                self._directories[directory] = self.directory_rcfile(
+                    directory)
+        return self._directories[directory]
+
+    def save(self):
+        """ Write the cache back to disk, if it changed """
+        if not self._changed:
+            return
+        # Leave out the pylintrc files that are gone
+        self.rcfiles = dict(
+            (path, entry) for path, entry in self.rcfiles.items()
+            if os.path.exists(path))
+
+        cache.write_json_atomically(
+            self.path, {'lookup': self.lookup, 'rcfiles': self.rcfiles})
+        self._changed = False
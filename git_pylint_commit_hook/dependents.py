@@ -0,0 +1,285 @@
+""" Persistent index of the imports between the modules of a repository
+
+The index maps every tracked Python file to its blob id and the modules it
+imports. It is refreshed from ``git ls-files`` on every use, but only files
+whose blob changed since the last run are parsed again.
+"""
+import ast
+import json
+import os
+import subprocess
+
+from git_pylint_commit_hook import batch
+from git_pylint_commit_hook import cache
+from git_pylint_commit_hook import profiling
+
+
+def _module_name(path):
+    """ Returns the dotted module name of a file, relative to the root
+
+    :type path: str
+    :param path: Path of a Python file relative to the repository root
+    :returns: str -- The module name
+    """
+    parts = os.path.splitext(path)[0].split('/')
+    if parts[-1] == '__init__':
+        parts.pop()
+    return '.'.join(parts)
+
+
+def _package(path):
+    """ Returns the dotted name of the package of a file, relative imports
+    are resolved against
+    """
+    package = _module_name(path)
+    if not path.endswith('__init__.py'):
+        package = package.rpartition('.')[0]
+    return package
+
+
+def _import_base(package, node):
+    """ Returns the module a ``from module import name`` imports from
+
+    :type package: str
+    :param package: The package of the importing file, see _package
+    :type node: ast.ImportFrom
+    :param node: The import statement
+    :returns: str -- The module name, empty if the names are imported
+        from the root, or None if the import goes beyond the root
+    """
+    base = node.module or ''
+    if node.level:
+        parts = package.split('.') if package else []
+        if node.level - 1 > len(parts):
+            return None
+        parts = parts[:len(parts) - (node.level - 1)]
+        base = '.'.join(parts + ([base] if base else []))
+    return base
+
+
+def _dotted_name(node):
+    """ Returns the dotted name of a chain of attributes like ``a.b.c``, or
+    None if it does not start with a plain name
+    """
+    attributes = []
+    while isinstance(node, ast.Attribute):
+        attributes.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    return '.'.join([node.id] + attributes[::-1])
+
+
+def related_lines(path, source, paths):
+    """ Returns the lines of a file that involve the given modules
+
+    These are the lines importing the modules and the lines using the names
+    imported from them. Module names are matched like in
+    ImportIndex.dependents. Local names shadowing an imported one are
+    taken for it.
+
+    :type path: str
+    :param path: Path of the file relative to the repository root
+    :type source: bytes
+    :param source: Contents of the file
+    :type paths: list
+    :param paths: Paths of the modules relative to the repository root
+    :returns: set -- Line numbers
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, TypeError, ValueError):
+        return set()
+
+    modules = set()
+    for module_path in paths:
+        parts = _module_name(module_path).split('.')
+        modules.update('.'.join(parts[i:]) for i in range(len(parts)))
+
+    def involved(name):
+        parts = name.split('.')
+        return any(
+            '.'.join(parts[:i]) in modules for i in range(1, len(parts) + 1))
+
+    # Map the names bound by the imports to the dotted names they stand for
+    package = _package(path)
+    bound = {}
+    lines = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if involved(alias.name):
+                    lines.add(node.lineno)
+                    if alias.asname:
+                        bound[alias.asname] = alias.name
+                    else:
+                        first = alias.name.split('.')[0]
+                        bound[first] = first
+        elif isinstance(node, ast.ImportFrom):
+            base = _import_base(package, node)
+            if base is None:
+                continue
+            if base and involved(base):
+                lines.add(node.lineno)
+            for alias in node.names:
+                name = '{}.{}'.format(base, alias.name) if base \
+                    else alias.name
+                if alias.name != '*' and involved(name):
+                    lines.add(node.lineno)
+                    bound[alias.asname or alias.name] = name
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Name, ast.Attribute)):
+            name = _dotted_name(node)
+            first, _, rest = (name or '').partition('.')
+            if first in bound and involved(
+                    bound[first] + ('.' + rest if rest else '')):
+                lines.add(node.lineno)
+    return lines
+
+
+def _parse_imports(path, source):
+    """ Returns the names of the modules a file imports
+
+    Relative imports are resolved against the package of the file.
+    ``from module import name`` yields both the module and module.name,
+    as the name may be a submodule.
+
+    :type path: str
+    :param path: Path of the file relative to the repository root
+    :type source: bytes
+    :param source: Contents of the file
+    :returns: list -- Sorted module names
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, TypeError, ValueError):
+        return []
+
+    package = _package(path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = _import_base(package, node)
+            if base is None:
+                continue
+            if base:
+                names.add(base)
+            names.update(
+                '{}.{}'.format(base, alias.name) if base else alias.name
+                for alias in node.names if alias.name != '*')
+
+    return sorted(names)
+
+
+class ImportIndex(object):
+    """ The imports of all tracked Python files, stored on disk """
+
+    def __init__(self, path):
+        """ Load an index
+
+        :type path: str
+        :param path: Path of the JSON file holding the index
+        """
+        self.path = path
+        self.files = {}
+        try:
+            with open(path) as file_handle:
+                self.files = json.load(file_handle)['files']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    def update(self):
+        """ Bring the index in line with the git index
+
+        Only files whose blob changed since the last update are parsed.
+
+        :returns: dict -- Mapping the paths of all tracked Python files to
+            their blob ids
+        """
+        cmd = ['git', 'ls-files', '-s', '-z', '--', '*.py']
+        with profiling.command(cmd):
+            output = subprocess.check_output(cmd)
+        blobs = {}
+        for entry in output.decode('utf-8').split('\0'):
+            if entry:
+                meta, path = entry.split('\t', 1)
+                blobs[path] = meta.split()[1]
+
+        changed = [
+            path for path, blob in blobs.items()
+            if self.files.get(path, [None])[0] != blob
+        ]
+        removed = set(self.files) - set(blobs)
+        if not changed and not removed:
+            return blobs
+
+        with profiling.command(['git', 'cat-file', '--batch']):
+            contents = batch.read_objects(blobs[path] for path in changed)
+        for path in changed:
+            self.files[path] = [
+                blobs[path],
+                _parse_imports(path, contents.get(blobs[path], b'')),
+            ]
+        for path in removed:
+            del self.files[path]
+        self._save()
+        return blobs
+
+    def _save(self):
+        cache.write_json_atomically(self.path, {'files': self.files})
+
+    def _reverse_dependencies(self):
+        """ Returns a mapping of paths to the paths of the files importing
+        them
+
+        Imports are matched against module names relative to the root
+        first, and against the trailing part of module names otherwise,
+        to support source directories that are not packages themselves.
+        """
+        exact = {}
+        suffixes = {}
+        for path in self.files:
+            parts = _module_name(path).split('.')
+            exact.setdefault('.'.join(parts), set()).add(path)
+            for i in range(1, len(parts)):
+                suffixes.setdefault('.'.join(parts[i:]), set()).add(path)
+
+        reverse = {}
+        for path, (_, imports) in self.files.items():
+            for name in imports:
+                for target in exact.get(name) or suffixes.get(name, ()):
+                    if target != path:
+                        reverse.setdefault(target, set()).add(path)
+        return reverse
+
+    def dependents(self, paths, depth=1, budget=50):
+        """ Returns the files importing the given files, breadth first
+
+        :type paths: list
+        :param paths: Paths of the changed files
+        :type depth: int
+        :param depth: Number of import levels to follow
+        :type budget: int
+        :param budget: Maximum number of dependents to return
+        :returns: list -- Paths of the dependents, closest first
+        """
+        reverse = self._reverse_dependencies()
+        seen = set(paths)
+        frontier = sorted(paths)
+        found = []
+        for _ in range(depth):
+            next_frontier = []
+            for path in frontier:
+                for dependent in sorted(reverse.get(path, ())):
+                    if dependent in seen:
+                        continue
+                    if len(found) >= budget:
+                        return found
+                    seen.add(dependent)
+                    found.append(dependent)
+                    next_frontier.append(dependent)
+            frontier = next_frontier
+        return found
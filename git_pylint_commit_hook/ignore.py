@@ -0,0 +1,132 @@
+""" Matching of file paths against the ignore patterns of a run
+
+Three kinds of patterns are supported:
+
+* regular expressions, found anywhere in the path like with ``--ignore``
+* globs, matched against the whole path with ``fnmatch``, so ``*``
+  matches across directories
+* gitignore-style patterns, where ``*`` stops at a ``/``, ``**`` spans
+  directories, a leading or inner ``/`` anchors the pattern to the root
+  and a trailing ``/`` only matches directories
+
+All patterns are compiled into a single regular expression once, so
+matching a path costs one search however many patterns there are.
+"""
+import fnmatch
+import re
+
+# Patterns that can not be combined in one alternation, as the combined
+# expression would renumber their groups
+_BACKREFERENCE_REGEXP = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def _gitignore_regex(pattern):
+    """ Translate a gitignore-style pattern to a regular expression
+
+    :type pattern: str
+    :param pattern: The pattern
+    :returns: str -- A regular expression matching the ignored paths
+    """
+    if pattern.startswith('!'):
+        raise ValueError(
+            'negated ignore patterns are not supported: {}'.format(pattern))
+
+    directory = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    # A leading slash anchors the pattern too, the trailing one does not
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+            continue
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            regex += '/.*'
+            i += 3
+            continue
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        elif char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                regex += re.escape(char)
+            else:
+                chars = pattern[i + 1:end].replace('\\', '\\\\')
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                regex += '[' + chars + ']'
+                i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+
+    prefix = '^' if anchored else '(?:^|/)'
+    # A directory pattern matches the paths below the directory, other
+    # patterns match the path itself or, if it is a directory, below it
+    suffix = '/' if directory else '(?:/|$)'
+    return prefix + regex + suffix
+
+
+class IgnoreMatcher(object):
+    """ Decides whether paths are ignored, with all patterns compiled once
+    """
+
+    def __init__(self, regexes=(), globs=(), gitignore=()):
+        """ Compile the patterns
+
+        :type regexes: list
+        :param regexes: Regular expressions searched for in the path
+        :type globs: list
+        :param globs: Globs matched against the whole path
+        :type gitignore: list
+        :param gitignore: gitignore-style patterns
+        """
+        alternatives = []
+        self._separate = []
+        for regex in regexes:
+            # Check every expression on its own for a clear error message
+            compiled = re.compile(regex)
+            if _BACKREFERENCE_REGEXP.search(regex):
+                self._separate.append(compiled)
+            else:
+                alternatives.append(regex)
+        alternatives.extend('^' + fnmatch.translate(glob) for glob in globs)
+        alternatives.extend(_gitignore_regex(pattern) for pattern in gitignore)
+
+        self._regexp = None
+        if alternatives:
+            try:
+                self._regexp = re.compile('|'.join(
+                    '(?:{})'.format(alternative)
+                    for alternative in alternatives))
+            except re.error:
+                # Inline flags only work at the start of an expression
+                self._separate.extend(
+                    re.compile(alternative) for alternative in alternatives)
+
+    def __bool__(self):
+        return bool(self._regexp or self._separate)
+
+    __nonzero__ = __bool__
+
+    def match(self, path):
+        """ Check if a path is ignored
+
+        :type path: str
+        :param path: Path relative to the repository root
+        :returns: bool -- True if any pattern matches
+        """
+        if self._regexp is not None and self._regexp.search(path):
+            return True
+        return any(regexp.search(path) for regexp in self._separate)
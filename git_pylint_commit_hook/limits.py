@@ -0,0 +1,65 @@
+""" Time and memory limits of pylint processes
+
+A pylint process that runs into a limit is not rated. Its file gets the
+TIMEOUT or OOM status instead, which the hook can pass or fail.
+
+The memory limit caps the address space of the process. It is set by a
+shell wrapping the command with ``ulimit -v`` rather than with a
+preexec_fn, which is not safe in the threads that start pylint.
+"""
+import os
+import re
+import signal
+
+# The statuses of files whose pylint process ran into a limit
+TIMEOUT = 'TIMEOUT'
+OOM = 'OOM'
+
+# The last line of the traceback of a process that died of a MemoryError
+_OOM_REGEXP = re.compile(r'^MemoryError\b', re.MULTILINE)
+
+
+def supported():
+    """ Returns True if memory limits can be enforced on this platform """
+    return os.name == 'posix'
+
+
+def command(cmd, max_memory=None):
+    """ Wrap a command to limit the memory of its process
+
+    :type cmd: list
+    :param cmd: The command line
+    :type max_memory: int
+    :param max_memory: Maximum size of the address space in megabytes, or
+        None for no limit
+    :returns: list -- The command line to run
+    """
+    if not max_memory or not supported():
+        return cmd
+    return [
+        'sh', '-c', 'ulimit -v {} && exec "$@"'.format(int(max_memory) * 1024),
+        'sh'] + list(cmd)
+
+
+def out_of_memory(status, stderr, max_memory):
+    """ Check if a pylint process failed for lack of memory
+
+    Python raises MemoryError once the process reaches its limit, and
+    pylint dies of it with a traceback on stderr. The kernel's OOM killer
+    sends a SIGKILL instead. pylint's messages on stdout are never looked
+    at, as they may mention MemoryError for reasons of their own.
+
+    :type status: int
+    :param status: Exit status of the process, negative if it was killed
+    :type stderr: str
+    :param stderr: What pylint wrote to stderr
+    :type max_memory: int
+    :param max_memory: The memory limit of the process in megabytes, or
+        None if it had none
+    :returns: bool -- True if the process ran out of memory
+    """
+    if not status or not max_memory:
+        return False
+    if status == -getattr(signal, 'SIGKILL', 9):
+        return True
+    return bool(_OOM_REGEXP.search(stderr))
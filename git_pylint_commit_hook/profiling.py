@@ -0,0 +1,166 @@
+""" Timing of the phases, commands and files of a hook run
+
+A run is timed by a :class:`Profiler`. While it is active, see
+:func:`activate`, every command started within :func:`command` is
+recorded by it as well.
+"""
+import collections
+import contextlib
+import os
+import threading
+import time
+
+# The profilers of the runs in progress, innermost last
+_ACTIVE = []
+
+
+class Profiler(object):
+    """ A stopwatch splitting the run time of the hook into phases
+
+    The profiler is always in at most one phase. Switching to another phase
+    adds the time spent since the last switch to the current phase.
+
+    It also counts the commands run and the time spent linting every
+    file, which may be recorded from several threads.
+    """
+
+    def __init__(self):
+        self.phases = collections.OrderedDict()
+        self.commands = collections.OrderedDict()
+        self.files = {}
+        self._phase = None
+        self._started = None
+        self._lock = threading.Lock()
+
+    def switch(self, phase):
+        """ End the current phase and start another one
+
+        :type phase: str
+        :param phase: Name of the phase to start, or None to stop timing
+        """
+        now = time.time()
+        if self._phase is not None:
+            self.phases[self._phase] = \
+                self.phases.get(self._phase, 0.0) + now - self._started
+        self._phase = phase
+        self._started = now
+
+    def stop(self):
+        """ End the current phase """
+        self.switch(None)
+
+    def record_command(self, cmd, duration):
+        """ Record a finished command
+
+        :type cmd: list
+        :param cmd: The command line
+        :type duration: float
+        :param duration: Wall time of the command in seconds
+        """
+        name = _command_name(cmd)
+        with self._lock:
+            count, total = self.commands.get(name, (0, 0.0))
+            self.commands[name] = (count + 1, total + duration)
+
+    def record_file(self, filename, duration):
+        """ Record the time spent linting a file
+
+        :type filename: str
+        :param filename: The linted file
+        :type duration: float
+        :param duration: Wall time of the pylint run in seconds
+        """
+        with self._lock:
+            self.files[filename] = self.files.get(filename, 0.0) + duration
+
+    @property
+    def total(self):
+        """ Total time spent in all phases, in seconds """
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        """ Returns the timings as a JSON serializable dict """
+        return {
+            'total': self.total,
+            'phases': dict(self.phases),
+            'commands': dict(
+                (name, {'count': count, 'time': total})
+                for name, (count, total) in self.commands.items()),
+            'files': dict(self.files),
+        }
+
+    def summary(self, slowest=10):
+        """ Returns a table of the timings
+
+        :type slowest: int
+        :param slowest: Number of files to list, slowest first
+        :returns: str -- The table
+        """
+        total = self.total or 1.0
+        lines = ['{:<40}{:>10}{:>10}'.format('Phase', 'Time', '%')]
+        for phase, seconds in self.phases.items():
+            lines.append('{:<40}{:>9.3f}s{:>10.1f}'.format(
+                phase, seconds, 100 * seconds / total))
+        lines.append('{:<40}{:>9.3f}s'.format('total', self.total))
+
+        lines.append('')
+        lines.append('{:<40}{:>10}{:>10}'.format('Command', 'Time', 'Count'))
+        for name, (count, seconds) in sorted(
+                self.commands.items(), key=lambda item: -item[1][1]):
+            lines.append('{:<40}{:>9.3f}s{:>10}'.format(name, seconds, count))
+
+        if self.files:
+            lines.append('')
+            lines.append('{:<40}{:>10}'.format('File', 'Time'))
+            for filename, seconds in sorted(
+                    self.files.items(),
+                    key=lambda item: -item[1])[:slowest]:
+                lines.append('{:<40}{:>9.3f}s'.format(filename, seconds))
+
+        return '\n'.join(lines)
+
+
+def _command_name(cmd):
+    """ Returns a short name grouping similar commands
+
+    Git commands are named after their subcommand, scripts run by the
+    interpreter after the script.
+    """
+    parts = [os.path.basename(cmd[0])] if cmd else ['']
+    arguments = []
+    options = iter(cmd[1:])
+    for arg in options:
+        if arg == '-c':
+            next(options, None)
+        elif not arg.startswith('-'):
+            arguments.append(arg)
+    if parts[0] == 'git' and arguments:
+        parts.append(arguments[0])
+    elif parts[0].startswith('python') and arguments:
+        parts.append(os.path.basename(arguments[0]))
+    return ' '.join(parts)
+
+
+@contextlib.contextmanager
+def activate(profiler):
+    """ Record the commands run in the block with profiler """
+    _ACTIVE.append(profiler)
+    try:
+        yield profiler
+    finally:
+        _ACTIVE.remove(profiler)
+
+
+@contextlib.contextmanager
+def command(cmd):
+    """ Time a command run in the block with the active profiler
+
+    :type cmd: list
+    :param cmd: The command line
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        if _ACTIVE:
+            _ACTIVE[-1].record_command(cmd, time.time() - start)
@@ -0,0 +1,167 @@
+""" Machine readable results of a hook run
+
+The results are written as the files are reported, so the messages of
+large commits are never held in memory. Every file is a dict with the
+keys:
+
+* ``path``
+* ``score``, None if pylint did not rate the file
+* ``status``: PASSED, FAILED, SKIPPED, or TIMEOUT or OOM if pylint ran
+  into a limit
+* ``passed``: whether the status passes the commit
+* ``ignored``, ``cached`` and ``dependent`` flags
+* ``duration``: seconds spent linting the file, 0 for cached files and
+  None if unknown, as with --batch or --in-process
+* ``messages``: dicts with the ``line``, ``column``, ``msg_id``,
+  ``symbol`` and ``message`` of every pylint message
+"""
+import json
+import time
+
+# Formats supported by create
+FORMATS = ('json', 'junit')
+
+
+class _Output(object):
+    """ Writes results to a file, counting the totals on the way """
+
+    def __init__(self, path):
+        self.stream = open(path, 'w')
+        self.totals = {
+            'files': 0,
+            'passed': 0,
+            'failed': 0,
+            'skipped': 0,
+            'timeout': 0,
+            'oom': 0,
+            'cached': 0,
+            'messages': 0,
+        }
+        self._start = time.time()
+
+    def add(self, result):
+        """ Write the result of a file
+
+        :type result: dict
+        :param result: The result, see the module docstring
+        """
+        self.totals['files'] += 1
+        self.totals[result['status'].lower()] += 1
+        self.totals['cached'] += bool(result['cached'])
+        self.totals['messages'] += len(result['messages'])
+        self._write(result)
+        self.stream.flush()
+
+    def close(self, passed):
+        """ Write the totals and close the file
+
+        :type passed: bool
+        :param passed: Whether the whole run passed
+        """
+        self.totals['duration'] = time.time() - self._start
+        try:
+            self._finish(passed, self.totals)
+        finally:
+            self.stream.close()
+
+    def _write(self, result):
+        raise NotImplementedError
+
+    def _finish(self, passed, totals):
+        raise NotImplementedError
+
+
+class JsonOutput(_Output):
+    """ A JSON object with the list of files, the totals and the verdict
+    """
+
+    def __init__(self, path):
+        _Output.__init__(self, path)
+        self.stream.write('{"files": [')
+        self._separator = '\n'
+
+    def _write(self, result):
+        self.stream.write(self._separator + json.dumps(result, sort_keys=True))
+        self._separator = ',\n'
+
+    def _finish(self, passed, totals):
+        self.stream.write('\n], "totals": {}, "passed": {}}}\n'.format(
+            json.dumps(totals, sort_keys=True), json.dumps(passed)))
+
+
+class JUnitOutput(_Output):
+    """ A JUnit XML test suite with a test case per file
+
+    The counts of the suite are only known at the end, so the totals are
+    written to the output of the suite rather than to its attributes.
+    """
+
+    def __init__(self, path):
+        # pylint: disable=import-outside-toplevel
+        # xml.sax.saxutils pulls in urllib and email, so it is only
+        # imported when the output is written
+        from xml.sax import saxutils
+
+        self._saxutils = saxutils
+        _Output.__init__(self, path)
+        self.stream.write(
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<testsuite name="git-pylint-commit-hook">\n')
+
+    def _write(self, result):
+        attributes = {
+            'classname': 'pylint',
+            'name': result['path'],
+        }
+        if result['duration'] is not None:
+            attributes['time'] = '{:.3f}'.format(result['duration'])
+        self.stream.write('  <testcase {}>\n'.format(' '.join(
+            '{}={}'.format(name, self._saxutils.quoteattr(value))
+            for name, value in sorted(attributes.items()))))
+
+        messages = '\n'.join(
+            '{path}:{line}:{column}: {msg_id}: {message} ({symbol})'.format(
+                path=result['path'], **message)
+            for message in result['messages'])
+        score = 'not rated' if result['score'] is None else \
+            'rated {:.2f}/10'.format(result['score'])
+        if result['status'] == 'FAILED':
+            self.stream.write('    <failure message={}>{}</failure>\n'.format(
+                self._saxutils.quoteattr(score),
+                self._saxutils.escape(messages)))
+        elif result['status'] not in ('PASSED', 'SKIPPED'):
+            # pylint ran into a limit
+            self.stream.write('    <{0} message={1}/>\n'.format(
+                'skipped' if result['passed'] else 'error',
+                self._saxutils.quoteattr(result['status'])))
+        elif result['status'] == 'SKIPPED':
+            self.stream.write('    <skipped/>\n')
+        elif messages:
+            self.stream.write('    <system-out>{}</system-out>\n'.format(
+                self._saxutils.escape(messages)))
+        self.stream.write('  </testcase>\n')
+
+    def _finish(self, passed, totals):
+        summary = '{} - {files} files, {passed} passed, {failed} failed, ' \
+            '{skipped} skipped, {timeout} timed out, {oom} out of memory, ' \
+            '{cached} cached, {messages} messages in {duration:.3f}s'.format(
+                'PASSED' if passed else 'FAILED', **totals)
+        self.stream.write(
+            '  <system-out>{}</system-out>\n</testsuite>\n'.format(
+                self._saxutils.escape(summary)))
+
+
+def create(output_format, path):
+    """ Open a file for the results of a run
+
+    :type output_format: str
+    :param output_format: One of FORMATS
+    :type path: str
+    :param path: The file to write
+    :returns: object -- An output with the add and close methods
+    """
+    if output_format == 'json':
+        return JsonOutput(path)
+    if output_format == 'junit':
+        return JUnitOutput(path)
+    raise ValueError('unknown output format: {}'.format(output_format))
@@ -0,0 +1,334 @@
+""" A pylint daemon keeping astroid's module cache warm between hook runs
+
+Start it in the root of a repository::
+
+    git-pylint-commit-hook --serve
+
+It listens on a Unix domain socket named after the repository's .git
+directory, in a directory of the temporary directory only the user can
+access. Hook runs in the same repository send it their files and fall
+back to running pylint themselves when no daemon is listening. Sockets
+that other users could have created are never connected to.
+
+Every connection carries a single request and response, each a line of
+JSON. The daemon lints with the pylint it was started with, in its own
+working directory.
+"""
+from __future__ import print_function
+
+import collections
+import contextlib
+import errno
+import hashlib
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+import traceback
+
+from git_pylint_commit_hook import batch
+
+# The fields of pylint's messages the hook uses
+Message = collections.namedtuple(
+    'Message',
+    'path, line, column, msg_id, msg, symbol'
+)
+
+
+class ServerError(Exception):
+    """ The daemon failed to handle a request """
+
+
+def _uid():
+    return os.getuid() if hasattr(os, 'getuid') else 0
+
+
+def socket_path(git_dir):
+    """ Returns the path of the socket of the daemon of a repository
+
+    The socket lives in a per-user directory of the temporary directory,
+    as paths of Unix domain sockets are limited to about a hundred
+    characters.
+
+    :type git_dir: str
+    :param git_dir: Path of the repository's .git directory
+    :returns: str -- Path of the socket
+    """
+    digest = hashlib.sha1(
+        os.path.abspath(git_dir).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(
+        tempfile.gettempdir(),
+        'git-pylint-commit-hook-{}'.format(_uid()),
+        '{}.sock'.format(digest))
+
+
+def _owned(path, mode_check):
+    """ Check that a path is ours and passes a check of its mode """
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return info.st_uid == _uid() and mode_check(info.st_mode)
+
+
+def _private_directory(path):
+    """ Check that a directory belongs to the user and only the user can
+    access it
+    """
+    return _owned(path, lambda mode: stat.S_ISDIR(mode) and not mode & 0o077)
+
+
+def available(path):
+    """ Check if a daemon of the user may be listening on a socket
+
+    :type path: str
+    :param path: Path of the socket
+    :returns: bool -- True if the path is a socket of the user, in a
+        directory only the user can access
+    """
+    return _private_directory(os.path.dirname(path)) and \
+        _owned(path, stat.S_ISSOCK)
+
+
+def _send(sock, value):
+    sock.sendall(json.dumps(value).encode('utf-8') + b'\n')
+
+
+def _receive(sock):
+    with contextlib.closing(sock.makefile('rb')) as stream:
+        line = stream.readline()
+    if not line:
+        raise ServerError('connection closed without a response')
+    return json.loads(line.decode('utf-8'))
+
+
+def lint(path, pylint_args, filenames, contents=None, blobs=None):
+    """ Lint files with the daemon listening on a socket
+
+    :type path: str
+    :param path: Path of the daemon's socket
+    :type pylint_args: list
+    :param pylint_args: Options passed on to pylint
+    :type filenames: list
+    :param filenames: Files to lint
+    :type contents: dict
+    :param contents: Source to lint in place of the files on disk, as
+        returned by batch.read_index
+    :type blobs: dict
+    :param blobs: Mapping paths of staged files to their blob ids, so the
+        daemon can tell which cached modules changed
+    :returns: list -- A batch.FileResult per file, in the order of
+        filenames, or None if no daemon of the user is listening
+    :raises: ServerError -- If the daemon failed
+    """
+    if not available(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except socket.error:
+            return None
+
+        try:
+            _send(sock, {
+                'cwd': os.getcwd(),
+                'args': list(pylint_args),
+                'files': list(filenames),
+                'contents': None if contents is None else dict(
+                    (filename, source.decode('utf-8', 'replace'))
+                    for filename, source in contents.items()),
+                'blobs': blobs or {},
+            })
+            response = _receive(sock)
+        except (socket.error, ValueError) as error:
+            raise ServerError(str(error))
+    finally:
+        sock.close()
+
+    if 'error' in response:
+        raise ServerError(response['error'])
+    return [
+        batch.FileResult(
+            result['filename'], result['score'], result['ignored'],
+            [Message(*message) for message in result['messages']],
+            result['output'], result['output'], None)
+        for result in response['results']
+    ]
+
+
+class Server(object):
+    """ Lints the files of the repository in its working directory """
+
+    def __init__(self, path):
+        """ Create a daemon
+
+        :type path: str
+        :param path: Path of the socket to listen on
+        """
+        self.path = path
+        self.cwd = os.getcwd()
+        # Modification times and blob ids of the files of cached modules
+        self._mtimes = {}
+        self._blobs = {}
+
+    def invalidate(self, filenames, blobs):
+        """ Drop the modules whose files changed from astroid's cache
+
+        :type filenames: list
+        :param filenames: Files about to be linted, which are always
+            parsed again
+        :type blobs: dict
+        :param blobs: Mapping paths to their current blob ids
+        """
+        changed = set(os.path.abspath(filename) for filename in filenames)
+        for filename, blob in blobs.items():
+            filename = os.path.abspath(filename)
+            if self._blobs.get(filename, blob) != blob:
+                changed.add(filename)
+            self._blobs[filename] = blob
+
+        # pylint: disable=import-outside-toplevel,protected-access
+        # Clients import this module too, only the daemon needs astroid
+        import astroid
+
+        # Imports that failed before may resolve to new files now
+        astroid.MANAGER._mod_file_cache.clear()
+        cache = astroid.MANAGER.astroid_cache
+        for name, module in list(cache.items()):
+            if not module.file:
+                continue
+            filename = os.path.abspath(module.file)
+            try:
+                mtime = os.stat(filename).st_mtime
+            except OSError:
+                mtime = None
+            if filename in changed or \
+                    self._mtimes.get(filename, mtime) != mtime:
+                del cache[name]
+                self._mtimes.pop(filename, None)
+            else:
+                self._mtimes[filename] = mtime
+
+    def handle(self, request):
+        """ Lint the files of a request
+
+        :type request: dict
+        :param request: The decoded request
+        :returns: dict -- The response
+        """
+        if os.path.realpath(request['cwd']) != os.path.realpath(self.cwd):
+            return {'error': 'the daemon lints {}, not {}'.format(
+                self.cwd, request['cwd'])}
+
+        self.invalidate(request['files'], request['blobs'])
+        contents = request['contents']
+        if contents is not None:
+            contents = dict(
+                (filename, source.encode('utf-8'))
+                for filename, source in contents.items())
+        results = batch.run(request['args'], request['files'], contents)
+        return {'results': [
+            {
+                'filename': result.filename,
+                'score': result.score,
+                'ignored': result.ignored,
+                'messages': [
+                    [msg.path, msg.line, msg.column, msg.msg_id, msg.msg,
+                     msg.symbol]
+                    for msg in result.messages],
+                'output': result.output,
+            }
+            for result in results
+        ]}
+
+    def _listen(self):
+        directory = os.path.dirname(self.path)
+        try:
+            os.mkdir(directory, 0o700)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+        if not _private_directory(directory):
+            raise ServerError(
+                '{} must be a directory only you can access'.format(
+                    directory))
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except socket.error:
+            # Nobody is listening, remove what a crashed daemon left
+            try:
+                os.remove(self.path)
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    raise
+        else:
+            raise ServerError(
+                'a daemon is already listening on {}'.format(self.path))
+        finally:
+            sock.close()
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        sock.listen(5)
+        return sock
+
+    def serve_forever(self, requests=None):
+        """ Handle requests one at a time until interrupted
+
+        :type requests: int
+        :param requests: Number of connections to handle before returning,
+            or None to serve until interrupted
+        """
+        sock = self._listen()
+        print('Listening on {}'.format(self.path))
+        try:
+            while requests is None or requests > 0:
+                if requests is not None:
+                    requests -= 1
+                connection, _ = sock.accept()
+                with contextlib.closing(connection):
+                    try:
+                        request = _receive(connection)
+                    except (ServerError, ValueError, socket.error):
+                        continue
+                    # pylint exits on some errors. A failed request is sent
+                    # back, so the client lints without the daemon
+                    try:
+                        response = self.handle(request)
+                    except KeyboardInterrupt:
+                        raise
+                    except BaseException:  # pylint: disable=broad-except
+                        response = {'error': traceback.format_exc()}
+                    try:
+                        _send(connection, response)
+                    except socket.error:
+                        pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sock.close()
+            os.remove(self.path)
+
+
+def serve(git_dir):
+    """ Run the daemon of a repository in the foreground
+
+    :type git_dir: str
+    :param git_dir: Path of the repository's .git directory
+    :returns: int -- Exit code
+    """
+    try:
+        Server(socket_path(git_dir)).serve_forever()
+    except ServerError as error:
+        print(error, file=sys.stderr)
+        return 1
+    return 0
@@ -0,0 +1,202 @@
+""" Splitting the files of a run across CI nodes
+
+Every node runs the hook with the same ``--shard i/n`` spec, except for
+``i``, and the same timing data. The files are split deterministically,
+so together the nodes lint every file exactly once. The verdicts the
+nodes write with ``--shard-results`` are merged into one with
+``--merge-results``.
+"""
+from __future__ import print_function
+
+import json
+import subprocess
+
+
+def parse(spec):
+    """ Parse a shard spec
+
+    :type spec: str
+    :param spec: The spec, "i/n" for the i-th of n shards, counting from 1
+    :returns: tuple -- (i, n)
+    :raises: ValueError -- If the spec is malformed
+    """
+    try:
+        index, count = [int(part) for part in spec.split('/')]
+    except ValueError:
+        raise ValueError('shards are given as i/n, not {}'.format(spec))
+    if not 1 <= index <= count:
+        raise ValueError('shard {} is not between 1 and {}'.format(
+            index, count))
+    return index, count
+
+
+def load_timings(path):
+    """ Load the lint time of files measured by an earlier run
+
+    :type path: str
+    :param path: A JSON file mapping paths to seconds, or the timings
+        written with --profile-json
+    :returns: dict -- Mapping paths to seconds
+    """
+    with open(path) as file_handle:
+        timings = json.load(file_handle)
+    if isinstance(timings.get('files'), dict):
+        timings = timings['files']
+    return dict(
+        (filename, float(seconds)) for filename, seconds in timings.items())
+
+
+def object_sizes(objects):
+    """ Look up the size of git objects with a single git process
+
+    :type objects: list
+    :param objects: Object names, like blob ids
+    :returns: dict -- Mapping object names to their size in bytes.
+        Missing objects are left out
+    """
+    objects = list(objects)
+    if not objects:
+        return {}
+
+    process = subprocess.Popen(
+        ['git', 'cat-file', '--batch-check'],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE)
+    output, _ = process.communicate(''.join(
+        '{}\n'.format(name) for name in objects).encode('utf-8'))
+
+    sizes = {}
+    for name, line in zip(objects, output.decode('utf-8').splitlines()):
+        header = line.split()
+        if header[-1] != 'missing':
+            sizes[name] = int(header[2])
+    return sizes
+
+
+def weights(sizes, timings=None):
+    """ Estimate the time it takes to lint every file
+
+    Files with a recorded lint time weigh that time. The others are
+    estimated from their size, at the average speed of the recorded
+    files, or simply weigh their size if there are no recorded files.
+
+    :type sizes: dict
+    :param sizes: Mapping paths to their size in bytes
+    :type timings: dict
+    :param timings: Mapping paths to the seconds it took to lint them
+    :returns: dict -- Mapping paths to their weight
+    """
+    timings = timings or {}
+    known = [filename for filename in sizes if filename in timings]
+    known_size = sum(sizes[filename] for filename in known)
+    rate = 1.0
+    if known_size:
+        rate = sum(timings[filename] for filename in known) / known_size
+    return dict(
+        (filename, timings.get(filename, size * rate))
+        for filename, size in sizes.items())
+
+
+def split(weighted, count):
+    """ Split files into shards of about the same total weight
+
+    The heaviest files are assigned first, each to the lightest shard so
+    far. Ties are broken by path and shard number, so every node computes
+    the same split.
+
+    :type weighted: dict
+    :param weighted: Mapping paths to their weight
+    :type count: int
+    :param count: Number of shards
+    :returns: list -- A set of paths per shard
+    """
+    shards = [set() for _ in range(count)]
+    totals = [0.0] * count
+    for filename in sorted(weighted, key=lambda name: (-weighted[name], name)):
+        lightest = min(range(count), key=lambda i: (totals[i], i))
+        shards[lightest].add(filename)
+        totals[lightest] += weighted[filename]
+    return shards
+
+
+def write_results(path, shard, passed, files, total):
+    """ Write the verdict of a shard
+
+    :type path: str
+    :param path: File to write
+    :type shard: tuple
+    :param shard: (i, n) of the shard, or None for an unsharded run
+    :type passed: bool
+    :param passed: Whether all files of the shard passed
+    :type files: dict
+    :param files: Mapping the linted paths to their status
+    :type total: int
+    :param total: Number of files of all shards together
+    """
+    index, count = shard or (1, 1)
+    with open(path, 'w') as file_handle:
+        json.dump({
+            'shard': index,
+            'shards': count,
+            'passed': passed,
+            'files': files,
+            'total': total,
+        }, file_handle, indent=2, sort_keys=True)
+
+
+def merge_results(paths):
+    """ Merge the verdicts of all shards of a run into one
+
+    :type paths: list
+    :param paths: The files written by every shard
+    :returns: bool -- True if every shard reported and passed, and the
+        shards linted every file exactly once
+    """
+    shards = {}
+    counts = set()
+    for path in paths:
+        with open(path) as file_handle:
+            result = json.load(file_handle)
+        if result['shard'] in shards:
+            print('Shard {} is reported twice'.format(result['shard']))
+            return False
+        shards[result['shard']] = result
+        counts.add(result['shards'])
+
+    if len(counts) != 1:
+        print('The results are of runs with {} shards'.format(
+            ', '.join(str(count) for count in sorted(counts))))
+        return False
+    count = counts.pop()
+    missing = [i for i in range(1, count + 1) if i not in shards]
+    if missing:
+        print('Missing results of shards {}'.format(
+            ', '.join(str(i) for i in missing)))
+        return False
+
+    # Shards disagree on the split if they saw different timing data
+    files = set()
+    for result in shards.values():
+        files.update(result['files'])
+    totals = set(result['total'] for result in shards.values())
+    if totals != set([len(files)]) or \
+            sum(len(result['files']) for result in shards.values()) != \
+            len(files):
+        print('The shards did not split the same {} files, make sure '
+              'they all use the same timings'.format(max(totals)))
+        return False
+
+    passed = True
+    for i in range(1, count + 1):
+        result = shards[i]
+        failed = sorted(
+            (filename, status)
+            for filename, status in result['files'].items()
+            if status not in ('PASSED', 'SKIPPED'))
+        print('Shard {}/{}: {} files\t{}'.format(
+            i, count, len(result['files']),
+            'PASSED' if result['passed'] else 'FAILED'))
+        for filename, status in failed:
+            print('\t{}\t{}'.format(filename, status))
+        passed = passed and result['passed']
+    return passed
@@ -0,0 +1,102 @@
+""" Outputs of linted files waiting to be reported
+
+Files are reported in order, while pylint finishes them in any order, and
+the results of the cache are looked up before anything is linted. On a
+commit with thousands of files the outputs waiting to be reported would
+add up, so past a threshold they are moved to a temporary file and read
+back one at a time as the files are reported.
+"""
+import json
+import tempfile
+import threading
+
+# Default number of bytes of output held in memory
+DEFAULT_MAX_MEMORY = 32 * 1024 * 1024
+
+
+class OutputSpool(object):
+    """ Holds FileResults until they are reported, spilling their outputs
+    to a temporary file once the outputs in memory reach max_memory bytes
+
+    Results may be put and popped from several threads.
+    """
+
+    def __init__(self, max_memory=DEFAULT_MAX_MEMORY):
+        """ Create an empty spool
+
+        :type max_memory: int
+        :param max_memory: Number of bytes of output to hold in memory
+        """
+        self.max_memory = max_memory
+        self.memory = 0
+        self.spilled = 0
+        self._entries = {}
+        self._next_key = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(result):
+        size = len(result.output or '')
+        if result.brief is not result.output:
+            size += len(result.brief or '')
+        return size
+
+    def put(self, result):
+        """ Hold a result
+
+        :type result: batch.FileResult
+        :param result: The result
+        :returns: int -- The key to pop the result with
+        """
+        size = self._size(result)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            if self.memory + size <= self.max_memory:
+                self.memory += size
+                self._entries[key] = (result, size, None)
+                return key
+
+            # Only the outputs are spilled, the rest is small
+            data = json.dumps([
+                result.output,
+                None if result.brief is result.output else result.brief,
+            ]).encode('utf-8')
+            if self._file is None:
+                self._file = tempfile.TemporaryFile()
+            self._file.seek(0, 2)
+            location = (self._file.tell(), len(data))
+            self._file.write(data)
+            self.spilled += 1
+            self._entries[key] = (
+                result._replace(output=None, brief=None), size, location)
+        return key
+
+    def pop(self, key):
+        """ Take a result out of the spool
+
+        :type key: int
+        :param key: The key returned by put
+        :returns: batch.FileResult -- The result
+        """
+        with self._lock:
+            result, size, location = self._entries.pop(key)
+            if location is None:
+                self.memory -= size
+                return result
+            offset, length = location
+            self._file.seek(offset)
+            data = self._file.read(length)
+        output, brief = json.loads(data.decode('utf-8'))
+        return result._replace(
+            output=output, brief=output if brief is None else brief)
+
+    def close(self):
+        """ Drop the results left and remove the temporary file """
+        with self._lock:
+            self._entries = {}
+            self.memory = 0
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -1,11 +1,35 @@
 # pylint: disable=missing-docstring
+import io
+import json
 import os
 import shutil
 import subprocess
+import sys
 import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
+from xml.etree import ElementTree
 
+import astroid
+
+from git_pylint_commit_hook import batch
+from git_pylint_commit_hook import cache
 from git_pylint_commit_hook import commit_hook
+from git_pylint_commit_hook import config
+from git_pylint_commit_hook import dependents
+from git_pylint_commit_hook import ignore
+from git_pylint_commit_hook import limits
+from git_pylint_commit_hook import profiling
+from git_pylint_commit_hook import server
+from git_pylint_commit_hook import sharding
+from git_pylint_commit_hook import spool
+
+
+# The asyncio backend needs Python 3.8
+ASYNCIO = sys.version_info >= (3, 8)
+USE_ASYNCIO = (False, True) if ASYNCIO else (False,)
 
 
 class TestException(Exception):
@@ -37,6 +61,16 @@ class TestHook(unittest.TestCase):
     def cmd(self, args):
         return subprocess.check_output(args.split(), cwd=self.tmp_dir)
 
+    def check_repo(self, *args, **kwargs):
+        """Run commit_hook.check_repo, returning its result and output"""
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            result = commit_hook.check_repo(*args, **kwargs)
+            return result, sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
     def test_current_commit(self):
         """Test commit_hook._current_commit"""
 
@@ -95,6 +129,32 @@ class TestHook(unittest.TestCase):
         self.cmd('git add ' + a)
         self.assertEquals(commit_hook._get_list_of_committed_files(), [a])
 
+    def test_git_state(self):
+        """Test commit_hook._GitState"""
+        git_state = commit_hook._GitState()
+        self.assertFalse(git_state.has_head)
+        self.assertEqual(git_state.git_dir, '.git')
+
+        # Paths are read verbatim, including spaces and non-ASCII names
+        a = self.write_file('a b.py', 'foo')
+        b = self.write_file(u'\u00e4.py', 'bar')
+        self.cmd('git add .')
+        staged = git_state.staged_files()
+        self.assertEqual(
+            [(f.path, f.status) for f in staged], [(a, 'A'), (b, 'A')])
+        self.assertEqual(staged[0].blob, cache.blob_sha(a))
+
+        # Results are shared for the rest of the run
+        self.write_file('c', 'baz')
+        self.cmd('git add c')
+        self.assertIs(git_state.staged_files(), staged)
+
+        # But a new run sees the new state
+        self.cmd('git commit -m msg')
+        git_state = commit_hook._GitState()
+        self.assertTrue(git_state.has_head)
+        self.assertEqual(git_state.staged_files(), [])
+
     def test_is_python_file(self):
         """Test commit_hook._is_python_file"""
 
@@ -110,6 +170,177 @@ class TestHook(unittest.TestCase):
         self.write_file('b', '#!/usr/bin/env python')
         self.assertTrue(commit_hook._is_python_file(a))
 
+    def test_ignore_matcher(self):
+        """Test ignore.IgnoreMatcher"""
+        matcher = ignore.IgnoreMatcher(
+            ['^tests/', r'(a)\1'], ['*.png'],
+            ['build/', '/setup.py', 'src/**/gen_*.py', '[!x]y.txt'])
+        for path in ('tests/a.py', 'aa.py', 'img/a.png', 'build/a.py',
+                     'lib/build/a.py', 'setup.py', 'src/gen_a.py',
+                     'src/a/b/gen_c.py', 'ay.txt'):
+            self.assertTrue(matcher.match(path), path)
+        for path in ('lib/tests/a.py', 'build', 'lib/setup.py', 'xy.txt',
+                     'src/gen.py', 'a.py'):
+            self.assertFalse(matcher.match(path), path)
+
+        # Directory patterns with a leading slash are anchored
+        matcher = ignore.IgnoreMatcher((), (), ['/build/'])
+        self.assertTrue(matcher.match('build/a.py'))
+        self.assertFalse(matcher.match('lib/build/a.py'))
+
+        self.assertFalse(ignore.IgnoreMatcher())
+        self.assertRaises(ValueError, ignore.IgnoreMatcher, (), (), ['!a'])
+
+    def test_check_repo_ignore(self):
+        """Test commit_hook.check_repo skips ignored files"""
+        self.write_file('a.py', 'style error!\n')
+        self.write_file('b_pb2.py', 'style error!\n')
+        os.mkdir('build')
+        self.write_file('build/c.py', 'style error!\n')
+        self.write_file(
+            '.pylintrc', '[pre-commit-hook]\nignore-path=\n    build/\n')
+        self.cmd('git add .')
+
+        result, output = self.check_repo(
+            8.0, ignored_files=['^a'], ignored_globs=['*_pb2.py'])
+        self.assertTrue(result)
+        self.assertNotIn('Running pylint', output)
+
+    def test_check_repo_no_python_files(self):
+        """Test commit_hook.check_repo does not import pylint needlessly"""
+        self.cmd('git commit --allow-empty -m msg')
+        self.write_file('README', 'docs\n')
+        self.write_file('a.py', 'style error!\n')
+        self.cmd('git add README')
+        self.write_file('README', 'unstaged docs\n')
+
+        root = os.path.dirname(os.path.abspath(commit_hook.__file__))
+        script = (
+            'import sys\n'
+            'sys.path.insert(0, {!r})\n'
+            'from git_pylint_commit_hook import commit_hook\n'
+            'assert commit_hook.check_repo(10.0, stash=True)\n'
+            'print([name for name in sys.modules if name.startswith('
+            '("astroid", "pylint.config", "pylint.lint", "multiprocessing", '
+            '"xml", "git_pylint_commit_hook.server"))])\n'
+        ).format(os.path.dirname(root))
+        output = subprocess.check_output(
+            [sys.executable, '-c', script], cwd=self.tmp_dir)
+        # Nothing was stashed or printed either
+        self.assertEqual(output.decode('utf-8'), '[]\n')
+
+    def test_config_cache(self):
+        """Test config.ConfigCache"""
+        path = os.path.join('.git', 'config-cache.json')
+        self.write_file('.pylintrc', '[pre-commit-hook]\nlimit=5\n')
+        os.makedirs('sub/pkg')
+        self.write_file('sub/.pylintrc', '[pre-commit-hook]\nparams=-j1\n')
+
+        configs = config.ConfigCache(path)
+        rcfile = configs.find_pylintrc()
+        self.assertEqual(rcfile, os.path.abspath('.pylintrc'))
+        self.assertEqual(configs.load(rcfile).limit, 5.0)
+        self.assertIsNone(configs.load('missing'))
+        configs.save()
+
+        # pylint is not asked again until one of its candidates changes
+        configs = config.ConfigCache(path)
+        with mock.patch('pylint.config.find_pylintrc') as find_pylintrc, \
+                mock.patch.object(config, 'parse') as parse:
+            self.assertEqual(configs.find_pylintrc(), rcfile)
+            self.assertEqual(configs.load(rcfile).limit, 5.0)
+            self.assertFalse(find_pylintrc.called)
+            self.assertFalse(parse.called)
+        self.write_file('pylintrc', '[pre-commit-hook]\nlimit=7.5\n')
+        rcfile = configs.find_pylintrc()
+        self.assertEqual(rcfile, os.path.abspath('pylintrc'))
+        self.write_file('pylintrc', '[pre-commit-hook]\nlimit=8\n')
+        self.assertEqual(configs.load(rcfile).limit, 8.0)
+
+        # Subprojects have a pylintrc of their own
+        self.assertEqual(
+            configs.directory_rcfile('sub/pkg/a.py'), 'sub/.pylintrc')
+        self.assertEqual(configs.directory_rcfile('sub/a.py'), 'sub/.pylintrc')
+        self.assertIsNone(configs.directory_rcfile('a.py'))
+        self.assertEqual(configs.load('sub/.pylintrc').params, '-j1')
+
+    def test_check_repo_subprojects(self):
+        """Test commit_hook.check_repo lints subprojects with their pylintrc
+        """
+        os.makedirs('sub/lax')
+        self.write_file('a.py', 'x = 1\n')
+        self.write_file(
+            'sub/.pylintrc', '[pre-commit-hook]\nparams=--disable=all\n')
+        self.write_file('sub/b.py', 'x = 1\n')
+        self.write_file('sub/lax/.pylintrc', '[pre-commit-hook]\nlimit=-10\n')
+        self.write_file('sub/lax/c.py', 'x = 1\n')
+        self.cmd('git add .')
+
+        # Each group is linted in one run in batch and in process modes
+        for kwargs in ({}, {'batch_mode': True}, {'in_process': True}):
+            result, output = self.check_repo(8.0, use_cache=False, **kwargs)
+            self.assertFalse(result)
+            self.assertIn('a.py (file 1/3)..\t-10/10.00\tFAILED', output)
+            self.assertIn('b.py (file 2/3)..\t10/10.00\tPASSED', output)
+            self.assertIn('c.py (file 3/3)..\t-10/10.00\tPASSED', output)
+
+        # A pylintrc given to the hook is used for every file
+        result, output = self.check_repo(8.0, pylintrc='sub/.pylintrc')
+        self.assertTrue(result)
+
+    def test_limit_matcher(self):
+        """Test config.LimitMatcher"""
+        self.write_file('.pylintrc', '\n'.join([
+            '[pre-commit-hook]',
+            'limits=',
+            '    tests/*        7',
+            '    re:migrations/ 5.5',
+            '    src/*          9.0',
+            '']))
+        options = config.parse('.pylintrc')
+        self.assertEqual(options.limits, [
+            ['tests/*', 7.0], ['re:migrations/', 5.5], ['src/*', 9.0]])
+
+        matcher = config.LimitMatcher(options.limits)
+        self.assertTrue(matcher)
+        self.assertEqual(matcher.limit('tests/a/b.py'), 7.0)
+        self.assertEqual(matcher.limit('src/migrations/a.py'), 5.5)
+        self.assertEqual(matcher.limit('src/a.py', 8.0), 9.0)
+        self.assertEqual(matcher.limit('a/src/b.py', 8.0), 8.0)
+        self.assertFalse(config.LimitMatcher([]))
+
+        self.write_file('.pylintrc', '[pre-commit-hook]\nlimits=src/*\n')
+        self.assertRaises(ValueError, config.parse, '.pylintrc')
+
+    def test_check_repo_limits(self):
+        """Test commit_hook.check_repo applies the limits of every file"""
+        os.makedirs('src')
+        os.makedirs('tests')
+        for path in ('a.py', 'src/b.py', 'tests/c.py'):
+            self.write_file(path, 'x = 1\n')
+        self.write_file('.pylintrc', '\n'.join([
+            '[pre-commit-hook]',
+            'limits=',
+            '    tests/* -10',
+            '    re:^src/ 9',
+            '']))
+        self.cmd('git add .')
+
+        profiler = profiling.Profiler()
+        result, output = self.check_repo(
+            -10.0, batch_mode=True, jobs=1, profiler=profiler)
+        self.assertFalse(result)
+        self.assertIn('a.py (file 1/3)..\t-10/10.00\tPASSED\n', output)
+        self.assertIn(
+            'b.py (file 2/3)..\t-10/10.00\tFAILED\tLIMIT 9.00', output)
+        self.assertIn(
+            'c.py (file 3/3)..\t-10/10.00\tPASSED\tLIMIT -10.00', output)
+
+        # Files with different limits share a pylint run
+        self.assertEqual([
+            count for name, (count, _) in profiler.commands.items()
+            if name.endswith('batch.py')], [1])
+
     def test_parse_score(self):
         """Test commit_hook._parse_score"""
 
@@ -209,3 +440,1236 @@ Statistics by type
 Statistics by type
 ------------------'''
         self.assertFalse(commit_hook._check_ignore(text))
+
+    def test_check_repo_jobs(self):
+        """Test commit_hook.check_repo reports parallel runs in order"""
+        for name in ('c.py', 'a.py', 'b.py'):
+            self.write_file(name, '"""Docstring"""\nVALUE = 1\n')
+        self.write_file('d.py', 'style error!\n')
+        self.cmd('git add a.py b.py c.py d.py')
+
+        result, output = self.check_repo(8.0, jobs=4)
+        self.assertFalse(result)
+
+        lines = [line for line in output.splitlines()
+                 if line.startswith('Running pylint on')]
+        self.assertEqual(
+            [line.split()[3] for line in lines],
+            ['a.py', 'b.py', 'c.py', 'd.py'])
+        self.assertIn('PASSED', lines[0])
+        self.assertIn('FAILED', lines[3])
+
+    def test_check_repo_profiler(self):
+        """Test commit_hook.check_repo times the phases of a run"""
+        self.write_file('README', 'Readme\n')
+        self.cmd('git add README')
+        self.cmd('git commit -m msg')
+        self.write_file('a.py', '"""Docstring"""\nVALUE = 1\n')
+        self.cmd('git add a.py')
+
+        profiler = profiling.Profiler()
+        result, _ = self.check_repo(8.0, profiler=profiler, stash=True)
+        self.assertTrue(result)
+        self.assertEqual(
+            set(profiler.as_dict()['phases']),
+            set(['stash', 'git', 'classify', 'config', 'cache', 'lint',
+                 'report']))
+        self.assertAlmostEqual(
+            profiler.total, sum(profiler.phases.values()))
+        self.assertEqual(list(profiler.files), ['a.py'])
+        commands = profiler.as_dict()['commands']
+        self.assertEqual(commands['pylint']['count'], 1)
+        self.assertEqual(commands['git stash']['count'], 2)
+        self.assertEqual(commands['git diff-index']['count'], 1)
+        self.assertIn('a.py', profiler.summary())
+
+    def test_command_name(self):
+        """Test profiling._command_name"""
+        self.assertEqual(
+            profiling._command_name(
+                ['git', '-c', 'core.quotepath=off', 'diff', '--cached']),
+            'git diff')
+        self.assertEqual(
+            profiling._command_name(
+                ['/usr/bin/python', '/lib/batch.py', '--', 'a.py']),
+            'python batch.py')
+        self.assertEqual(
+            profiling._command_name(['pylint', '--reports=n', 'a.py']),
+            'pylint')
+
+    def test_output_parser(self):
+        """Test commit_hook._OutputParser separates the reports"""
+        output = (
+            '************* Module b\n'
+            'b.py:1:0: C0114: Missing module docstring\n'
+            '\n\n'
+            'Report\n'
+            '======\n'
+            '2 statements analysed.\n'
+            '\n\n\n'
+            '--------------------------------------\n'
+            'Your code has been rated at 5.00/10\n'
+            '\n')
+        parser = commit_hook._OutputParser()
+        for line in output.splitlines(True):
+            parser.feed(line)
+        result = parser.result('b.py')
+        self.assertEqual(result.score, 5.0)
+        self.assertEqual(result.output, output)
+        self.assertEqual(
+            result.brief,
+            '************* Module b\n'
+            'b.py:1:0: C0114: Missing module docstring\n'
+            '\n'
+            '--------------------------------------\n'
+            'Your code has been rated at 5.00/10\n'
+            '\n')
+
+        parser = commit_hook._OutputParser()
+        result = parser.result('b.py', 32, b'Traceback\n')
+        self.assertIsNone(result.score)
+        self.assertEqual(result.output, 'Traceback\n')
+
+    def test_check_repo_suppress_report(self):
+        """Test commit_hook.check_repo shows both views from one run"""
+        self.write_file('b.py', 'import os\n')
+        self.cmd('git add b.py')
+
+        for suppress_report in (False, True):
+            profiler = profiling.Profiler()
+            result, output = self.check_repo(
+                8.0, pylint_params='--reports=y', use_cache=False,
+                suppress_report=suppress_report, profiler=profiler)
+            self.assertFalse(result)
+            self.assertIn('unused-import', output)
+            self.assertIn('Your code has been rated', output)
+            self.assertEqual(
+                'Statistics by type' in output, not suppress_report)
+            self.assertEqual(profiler.commands['pylint'][0], 1)
+
+    def test_check_repo_server(self):
+        """Test commit_hook.check_repo lints with a running daemon"""
+        self.write_file('a.py', '"""Docstring"""\nVALUE = 1\n')
+        self.write_file('b.py', 'import os\n')
+        self.cmd('git add a.py b.py')
+
+        path = server.socket_path(commit_hook._git_dir())
+        daemon = server.Server(path)
+        thread = threading.Thread(target=daemon.serve_forever, args=(1,))
+        thread.start()
+        for _ in range(100):
+            if os.path.exists(path):
+                break
+            time.sleep(0.05)
+
+        try:
+            result, output = self.check_repo(8.0, use_cache=False, jobs=1)
+        finally:
+            thread.join(30)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(result)
+        self.assertIn('a.py (file 1/2)..\t10/10.00\tPASSED', output)
+        self.assertIn('unused-import', output)
+
+        # Without a daemon the files are linted locally
+        result, output = self.check_repo(8.0, use_cache=False, jobs=1)
+        self.assertFalse(result)
+        self.assertIn('unused-import', output)
+
+        # Runs with time or memory limits do not wait on the daemon
+        thread = threading.Thread(target=daemon.serve_forever, args=(1,))
+        thread.start()
+        for _ in range(100):
+            if os.path.exists(path):
+                break
+            time.sleep(0.05)
+        try:
+            options = [{'timeout': 30}]
+            if limits.supported():
+                options.append({'max_memory': 4096})
+            for limit in options:
+                profiler = profiling.Profiler()
+                result, output = self.check_repo(
+                    8.0, use_cache=False, jobs=1, profiler=profiler, **limit)
+                self.assertFalse(result)
+                self.assertEqual(profiler.commands['pylint'][0], 2)
+            result, output = self.check_repo(8.0, use_cache=False, jobs=1)
+        finally:
+            thread.join(30)
+        self.assertFalse(thread.is_alive())
+
+        # A request pylint exits on is sent back and the daemon goes on
+        thread = threading.Thread(target=daemon.serve_forever, args=(2,))
+        with mock.patch.object(server.batch, 'run', side_effect=SystemExit(2)):
+            thread.start()
+            for _ in range(100):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.05)
+            try:
+                for _ in range(2):
+                    result, output = self.check_repo(
+                        8.0, use_cache=False, jobs=1)
+                    self.assertFalse(result)
+                    self.assertIn('the pylint daemon failed', output)
+                    self.assertIn('unused-import', output)
+            finally:
+                thread.join(30)
+        self.assertFalse(thread.is_alive())
+
+    def test_server_available(self):
+        """Test server.available only trusts sockets of the user"""
+        directory = os.path.join(self.tmp_dir, 'sockets')
+        path = os.path.join(directory, 'daemon.sock')
+        self.assertFalse(server.available(path))
+        self.assertIsNone(server.lint(path, [], ['a.py']))
+
+        os.mkdir(directory, 0o700)
+        self.write_file(path, '')
+        self.assertFalse(server.available(path))
+        os.remove(path)
+
+        sock = server.Server(path)._listen()
+        try:
+            self.assertTrue(server.available(path))
+            # Others could replace the socket of a shared directory
+            os.chmod(directory, 0o777)
+            self.assertFalse(server.available(path))
+            self.assertRaises(server.ServerError, server.Server(path)._listen)
+        finally:
+            sock.close()
+
+    def test_server_invalidate(self):
+        """Test server.Server.invalidate drops changed modules"""
+        self.write_file('a.py', 'VALUE = 1\n')
+        self.write_file('b.py', 'VALUE = 1\n')
+        daemon = server.Server(os.path.join(self.tmp_dir, 'socket'))
+        cache = astroid.MANAGER.astroid_cache
+        try:
+            for name in ('a', 'b'):
+                astroid.MANAGER.ast_from_file(
+                    os.path.join(self.tmp_dir, name + '.py'),
+                    'hooktest_' + name, source=True)
+            daemon.invalidate([], {'a.py': '1', 'b.py': '1'})
+            self.assertIn('hooktest_a', cache)
+            self.assertIn('hooktest_b', cache)
+
+            os.utime('a.py', (0, 0))
+            daemon.invalidate([], {'a.py': '1', 'b.py': '2'})
+            self.assertNotIn('hooktest_a', cache)
+            self.assertNotIn('hooktest_b', cache)
+        finally:
+            cache.pop('hooktest_a', None)
+            cache.pop('hooktest_b', None)
+
+    @unittest.skipUnless(ASYNCIO, 'needs Python 3.8')
+    def test_check_repo_asyncio(self):
+        """Test commit_hook.check_repo with the asyncio backend"""
+        for name in ('c.py', 'a.py', 'b.py'):
+            self.write_file(name, '"""Docstring"""\nVALUE = 1\n')
+        self.write_file('d.py', 'style error!\n')
+        self.cmd('git add a.py b.py c.py d.py')
+
+        for index in (False, True):
+            profiler = profiling.Profiler()
+            result, output = self.check_repo(
+                8.0, jobs=2, use_asyncio=True, use_cache=False,
+                index=index, profiler=profiler)
+            self.assertFalse(result)
+            lines = [line for line in output.splitlines()
+                     if line.startswith('Running pylint on')]
+            self.assertEqual(
+                [line.split()[3] for line in lines],
+                ['a.py', 'b.py', 'c.py', 'd.py'])
+            self.assertIn('PASSED', lines[0])
+            self.assertIn('FAILED', lines[3])
+            self.assertEqual(profiler.commands['pylint'][0], 4)
+            self.assertEqual(len(profiler.files), 4)
+
+    def test_check_repo_timeout(self):
+        """Test commit_hook.check_repo kills slow pylint runs"""
+        self.write_file('a.py', '"""Docstring"""\nVALUE = 1\n')
+        self.cmd('git add a.py')
+        slow = self.write_file('slow', '#!/bin/sh\nexec sleep 30\n')
+        os.chmod(slow, 0o755)
+
+        for use_asyncio in USE_ASYNCIO:
+            start = time.time()
+            result, output = self.check_repo(
+                8.0, pylint=os.path.join(self.tmp_dir, slow),
+                use_cache=False, use_asyncio=use_asyncio, timeout=0.5)
+            self.assertLess(time.time() - start, 10)
+            self.assertFalse(result)
+            self.assertIn('TIMEOUT', output)
+            self.assertIn('pylint timed out after 0.5 seconds', output)
+
+            result, output = self.check_repo(
+                8.0, pylint=os.path.join(self.tmp_dir, slow),
+                use_cache=False, use_asyncio=use_asyncio, timeout=0.5,
+                allow_timeout=True)
+            self.assertTrue(result)
+            self.assertIn('TIMEOUT', output)
+            self.assertNotIn('pylint timed out', output)
+
+    @unittest.skipUnless(limits.supported(), 'needs ulimit')
+    def test_check_repo_max_memory(self):
+        """Test commit_hook.check_repo limits the memory of pylint"""
+        self.write_file('a.py', '"""Docstring"""\nVALUE = 1\n')
+        self.write_file('b.py', '"""Docstring"""\nVALUE = 1\n')
+        self.cmd('git add a.py b.py')
+        # Allocates 400 MB when linting a.py
+        greedy = self.write_file('greedy', '\n'.join([
+            '#!{}'.format(sys.executable),
+            'import sys',
+            'if sys.argv[-1] == "a.py":',
+            '    DATA = bytearray(400 << 20)',
+            'print("Your code has been rated at 10.00/10")',
+            '']))
+        os.chmod(greedy, 0o755)
+        greedy = os.path.join(self.tmp_dir, greedy)
+
+        result, output = self.check_repo(8.0, pylint=greedy, use_cache=False)
+        self.assertTrue(result)
+
+        for use_asyncio in USE_ASYNCIO:
+            result, output = self.check_repo(
+                8.0, pylint=greedy, use_cache=False, max_memory=200,
+                use_asyncio=use_asyncio)
+            self.assertFalse(result)
+            self.assertIn('a.py (file 1/2)..\t0/10.00\tOOM', output)
+            self.assertIn('pylint ran out of memory', output)
+            self.assertIn('b.py (file 2/2)..\t10/10.00\tPASSED', output)
+
+        result, output = self.check_repo(
+            8.0, pylint=greedy, use_cache=False, max_memory=200,
+            allow_oom=True)
+        self.assertTrue(result)
+
+        # Runs cut short by a limit are not cached
+        for _ in range(2):
+            result, output = self.check_repo(
+                8.0, pylint=greedy, max_memory=200, allow_oom=True)
+            self.assertTrue(result)
+            self.assertIn('a.py (file 1/2)..\t0/10.00\tOOM\n', output)
+
+        # Messages mentioning MemoryError are not taken for OOM
+        self.write_file('a.py', 'class MemoryError(Exception):\n    pass\n')
+        self.cmd('git add a.py')
+        for max_memory in (None, 200):
+            result, output = self.check_repo(
+                8.0, use_cache=False, max_memory=max_memory, allow_oom=True)
+            self.assertFalse(result)
+            self.assertIn('redefined-builtin', output)
+            self.assertNotIn('OOM', output)
+        self.assertFalse(limits.out_of_memory(
+            1, 'E: Redefining MemoryError\n', None))
+        self.assertTrue(limits.out_of_memory(
+            1, 'Traceback (most recent call last):\nMemoryError\n', 200))
+        self.assertTrue(limits.out_of_memory(-9, '', 200))
+
+    @unittest.skipUnless(ASYNCIO, 'needs Python 3.8')
+    def test_git_state_prefetch(self):
+        """Test commit_hook._GitState.prefetch"""
+        from git_pylint_commit_hook import aio
+
+        self.write_file('a.py', 'one\n')
+        self.cmd('git add a.py')
+        git_state = commit_hook._GitState()
+        git_state.prefetch(aio.run_all, changed_lines=True)
+        self.assertFalse(git_state.has_head)
+        self.assertEqual(
+            [staged.path for staged in git_state.staged_files()], ['a.py'])
+
+        self.cmd('git commit -m msg')
+        self.write_file('a.py', 'one\ntwo\n')
+        self.cmd('git add a.py')
+        git_state = commit_hook._GitState()
+        git_state.prefetch(aio.run_all, changed_lines=True)
+        self.assertTrue(git_state.has_head)
+        self.assertEqual(git_state._staged_files[0].status, 'M')
+        self.assertEqual(git_state._changed_lines, {'a.py': set([2])})
+
+    def test_check_repo_batch(self):
+        """Test commit_hook.check_repo scores batched files separately"""
+        self.write_file('a.py', '"""Docstring"""\nVALUE = 1\n')
+        self.write_file('b.py', 'import os\n')
+        self.write_file('c.py', '# pylint: skip-file\nimport os\n')
+        self.cmd('git add a.py b.py c.py')
+
+        for kwargs in ({'jobs': 1, 'batch_mode': True},
+                       {'jobs': 2, 'batch_mode': True},
+                       {'in_process': True}):
+            result, output = self.check_repo(8.0, use_cache=False, **kwargs)
+            self.assertFalse(result)
+
+            lines = [line for line in output.splitlines()
+                     if line.startswith('Running pylint on')]
+            self.assertIn('10/10.00\tPASSED', lines[0])
+            self.assertIn('-10/10.00\tFAILED', lines[1])
+            self.assertIn('SKIPPED', lines[2])
+            self.assertIn('Unused import os', output)
+
+    def test_split_batch_output(self):
+        """Test commit_hook._split_batch_output"""
+        text = (
+            '{0}a.py\nYour code has been rated at 8.51/10\n'
+            '{0}b.py\n'
+            '{0}c.py\nYour code has been rated at 2.00/10\n'
+        ).format(commit_hook.batch.SEPARATOR)
+        sections = commit_hook._split_batch_output(text)
+        self.assertEqual(sorted(sections), ['a.py', 'b.py', 'c.py'])
+        self.assertEqual(commit_hook._parse_score(sections['a.py']), 8.51)
+        self.assertEqual(sections['b.py'], '')
+        self.assertEqual(commit_hook._parse_score(sections['c.py']), 2.0)
+
+    def test_batch_run(self):
+        """Test commit_hook.batch.run"""
+        self.write_file('a.py', '"""Docstring"""\nVALUE = 1\n')
+        self.write_file('b.py', 'import os\n')
+        self.write_file('c.py', '# pylint: skip-file\nimport os\n')
+
+        a, b, c = commit_hook.batch.run(
+            ['--enable=file-ignored'], ['a.py', 'b.py', 'c.py'])
+
+        self.assertEqual(a.score, 10.0)
+        self.assertEqual(a.messages, [])
+        self.assertEqual(b.score, -10.0)
+        self.assertEqual(
+            sorted(msg.symbol for msg in b.messages),
+            ['missing-module-docstring', 'unused-import'])
+        self.assertIn('Your code has been rated at -10.00/10', b.output)
+        self.assertIsNone(c.score)
+        self.assertTrue(c.ignored)
+
+    def test_batch_run_same_module_name(self):
+        """Test commit_hook.batch.run scores modules sharing a name apart"""
+        os.makedirs('a')
+        os.makedirs('b')
+        self.write_file('a/util.py', '"""Docstring"""\nVALUE = 1\n')
+        self.write_file(
+            'b/util.py', '"""Docstring"""\nimport os\nimport re\nimport sys\n')
+        self.cmd('git add .')
+
+        a, b = commit_hook.batch.run([], ['a/util.py', 'b/util.py'])
+        self.assertEqual(a.score, 10.0)
+        self.assertEqual(b.score, 0.0)
+
+        for options in ({'batch_mode': True}, {'in_process': True}):
+            result, output = self.check_repo(
+                8.0, use_cache=False, jobs=1, **options)
+            self.assertFalse(result)
+            self.assertIn('a/util.py (file 1/2)..\t10/10.00\tPASSED', output)
+
+    def test_batch_run_bad_options(self):
+        """Test commit_hook.batch.run fails the files on bad options"""
+        self.write_file('a.py', '"""Docstring"""\nVALUE = 1\n')
+        self.write_file('b.py', '"""Docstring"""\nVALUE = 2\n')
+        self.cmd('git add .')
+
+        a, b = commit_hook.batch.run(['--bogus'], ['a.py', 'b.py'])
+        self.assertIsNone(a.score)
+        self.assertIn('no such option: --bogus', a.output)
+        self.assertEqual(b.output, a.output)
+
+        for options in ({}, {'batch_mode': True}, {'in_process': True}):
+            result, output = self.check_repo(
+                8.0, pylint_params='--bogus', use_cache=False, **options)
+            self.assertFalse(result)
+            self.assertIn('b.py (file 2/2)..\t0/10.00\tFAILED', output)
+            self.assertIn('no such option: --bogus', output)
+
+    def test_check_repo_cache(self):
+        """Test commit_hook.check_repo reuses cached results"""
+        self.write_file('a.py', '"""Docstring"""\nVALUE = 1\n')
+        self.write_file('b.py', 'import os\n')
+        self.cmd('git add a.py b.py')
+
+        result, output = self.check_repo(8.0)
+        self.assertFalse(result)
+        self.assertNotIn('CACHED', output)
+
+        # Nothing changed, everything comes from the cache
+        result, cached_output = self.check_repo(8.0)
+        self.assertFalse(result)
+        self.assertEqual(cached_output.count('CACHED'), 2)
+        self.assertIn('Unused import os', cached_output)
+
+        # A new limit applies to cached scores as well
+        result, _ = self.check_repo(-10.0)
+        self.assertTrue(result)
+
+        # Changed files are linted again
+        self.write_file('b.py', '"""Docstring"""\n\nVALUE = 2\n')
+        self.cmd('git add b.py')
+        result, output = self.check_repo(8.0)
+        self.assertTrue(result)
+        self.assertEqual(output.count('CACHED'), 1)
+
+        # Unless the cache is disabled or cleared
+        _, output = self.check_repo(8.0, use_cache=False)
+        self.assertNotIn('CACHED', output)
+        _, output = self.check_repo(8.0, clear_cache=True)
+        self.assertNotIn('CACHED', output)
+
+    def test_lint_cache_evict(self):
+        """Test cache.LintCache evicts the least recently used entries"""
+        lint_cache = cache.LintCache(
+            os.path.join(self.tmp_dir, 'cache'), max_size=120)
+        lint_cache.put('a', {'output': 'a' * 40})
+        lint_cache.put('b', {'output': 'b' * 40})
+        os.utime(os.path.join(lint_cache.path, 'a.json'), (0, 0))
+        os.utime(os.path.join(lint_cache.path, 'b.json'), (1, 1))
+        self.assertEqual(lint_cache.get('a'), {'output': 'a' * 40})
+        lint_cache.put('c', {'output': 'c' * 40})
+
+        lint_cache.evict()
+        self.assertIsNotNone(lint_cache.get('a'))
+        self.assertIsNone(lint_cache.get('b'))
+        self.assertIsNotNone(lint_cache.get('c'))
+
+        lint_cache.clear()
+        self.assertIsNone(lint_cache.get('a'))
+
+    def test_write_json_atomically(self):
+        """Test cache.write_json_atomically"""
+        path = os.path.join('dir', 'a.json')
+        cache.write_json_atomically(path, {'a': [1]})
+        with open(path) as file_handle:
+            self.assertEqual(file_handle.read(), '{"a":[1]}')
+
+        # A failed write leaves the file and no temporary file behind
+        self.assertRaises(
+            TypeError, cache.write_json_atomically, path, {'a': object()})
+        self.assertEqual(os.listdir('dir'), ['a.json'])
+        with open(path) as file_handle:
+            self.assertEqual(json.load(file_handle), {'a': [1]})
+
+    def test_blob_sha(self):
+        """Test cache.blob_sha matches the blob git stages"""
+        a = self.write_file('a', 'foo\n')
+        self.cmd('git add ' + a)
+        staged = self.cmd('git ls-files -s a').split()[1]
+        self.assertEqual(cache.blob_sha(a), staged.decode('ascii'))
+
+    def test_check_repo_index(self):
+        """Test commit_hook.check_repo lints the staged contents"""
+        self.write_file('a.py', 'import os\n')
+        self.write_file('b', '#!/usr/bin/env python\n')
+        self.write_file('__init__.py', '')
+        self.cmd('git add a.py b __init__.py')
+
+        # Fix everything without staging it
+        self.write_file('a.py', '"""Docstring"""\nVALUE = 1\n')
+        self.write_file('b', 'not python\n')
+        self.write_file('__init__.py', 'import os\n')
+
+        result, _ = self.check_repo(8.0, use_cache=False)
+        self.assertFalse(result)
+
+        for kwargs in ({}, {'batch_mode': True}, {'in_process': True}):
+            result, output = self.check_repo(
+                8.0, use_cache=False, index=True, **kwargs)
+            self.assertFalse(result)
+            lines = output.splitlines()
+            self.assertIn('__init__.py (empty __init__.py)', lines[0])
+            self.assertIn('FAILED', lines[1])
+            self.assertIn('Unused import os', output)
+            self.assertIn('Running pylint on b', output)
+
+        # The working tree is left alone
+        with open('a.py') as f:
+            self.assertEqual(f.read(), '"""Docstring"""\nVALUE = 1\n')
+
+    def test_read_index(self):
+        """Test commit_hook.batch.read_index"""
+        self.write_file('a b', 'foo\n')
+        self.write_file('c', '')
+        self.cmd('git add .')
+        self.write_file('a b', 'bar\n')
+        self.assertEqual(
+            commit_hook.batch.read_index(['a b', 'c', 'd']),
+            {'a b': b'foo\n', 'c': b''})
+
+    def test_read_prefixes(self):
+        """Test commit_hook.batch.read_prefixes"""
+        self.write_file('a', 'x' * 100000)
+        self.write_file('b', 'foo\n')
+        self.cmd('git add .')
+        blobs = dict(
+            (staged.path, staged.blob)
+            for staged in commit_hook._GitState().staged_files())
+        self.assertEqual(
+            commit_hook.batch.read_prefixes(
+                [blobs['a'], blobs['b'], 'f' * 40], 8),
+            {blobs['a']: b'x' * 8, blobs['b']: b'foo\n'})
+
+    def test_classify(self):
+        """Test commit_hook._classify"""
+        self.write_file('a.py', '')
+        self.write_file('script', '#!/usr/bin/env python\n')
+        self.write_file('binary', '\x00' * 1000)
+        self.write_file('skipped.py', '')
+        self.write_file('page.tpl', '')
+        self.write_file(
+            '.gitattributes', 'skipped.py -pylint\n*.tpl pylint\n')
+        self.cmd('git add .')
+
+        git_state = commit_hook._GitState()
+        for _ in range(2):
+            self.assertEqual(
+                [staged.path for staged in commit_hook._classify(
+                    git_state.staged_files(), git_state)],
+                ['a.py', 'page.tpl', 'script'])
+
+        classifications = commit_hook._classifications(git_state)
+        self.assertEqual(
+            sorted(classifications.blobs.values()), [False, False, True])
+
+    def test_changed_lines(self):
+        """Test commit_hook._GitState.changed_lines"""
+        a = self.write_file('a b.py', 'one\ntwo\nthree\n')
+        self.cmd('git add .')
+        self.assertEqual(
+            commit_hook._GitState().changed_lines(), {a: set([1, 2, 3])})
+
+        self.cmd('git commit -m msg')
+        self.write_file('a b.py', 'one\n2\nthree\nfour\nfive\n')
+        self.write_file('c', 'foo\n')
+        self.cmd('git add .')
+        self.assertEqual(
+            commit_hook._GitState().changed_lines(),
+            {a: set([2, 4, 5]), 'c': set([1])})
+
+        # Removed and added lines that look like file headers
+        self.write_file('c', '-- one\ntwo\nthree\nfour\n')
+        self.cmd('git add .')
+        self.cmd('git commit -m msg')
+        self.write_file('c', '++ one\ntwo\nthree\n4\n')
+        self.cmd('git add .')
+        self.assertEqual(
+            commit_hook._GitState().changed_lines(), {'c': set([1, 4])})
+
+        # Whatever prefixes the user configured for diffs
+        for option in ('diff.noprefix', 'diff.mnemonicPrefix'):
+            self.cmd('git config {} true'.format(option))
+            self.assertEqual(
+                commit_hook._GitState().changed_lines(), {'c': set([1, 4])})
+            self.cmd('git config --unset {}'.format(option))
+
+    def test_check_repo_diff_only(self):
+        """Test commit_hook.check_repo only gates on changed lines"""
+        self.write_file('a.py', 'import os\nimport sys\n')
+        self.cmd('git add a.py')
+        self.cmd('git commit -m msg')
+
+        # Fix the first line, break the third one
+        self.write_file('a.py', '"""Docstring"""\nimport sys\nimport re\n')
+        self.cmd('git add a.py')
+
+        for kwargs in ({}, {'in_process': True}):
+            result, output = self.check_repo(
+                10.0, diff_only=True, use_cache=False, **kwargs)
+            self.assertFalse(result)
+            self.assertIn('FAILED\t1 NEW', output)
+            self.assertIn('Unused import re', output)
+            self.assertNotIn('Unused import sys', output)
+
+            result, output = self.check_repo(
+                10.0, diff_only=True, max_new_messages=1, use_cache=False,
+                **kwargs)
+            self.assertTrue(result)
+
+    def test_check_repo_baseline(self):
+        """Test commit_hook.check_repo compares scores with the baseline"""
+        self.write_file('a.py', 'import os\nimport sys\n')
+        self.cmd('git add a.py')
+        self.cmd('git commit -m msg')
+
+        # Improve the file, but not up to the limit
+        self.write_file('a.py', '"""Docstring"""\nimport os\nimport sys\n')
+        self.cmd('git add a.py')
+        result, output = self.check_repo(8.0, use_baseline=True)
+        self.assertTrue(result)
+        self.assertIn('0/10.00\tPASSED\tBASELINE -5.00', output)
+
+        # Both versions are in the baseline now, so the committed version
+        # does not have to be linted again after the commit
+        with open(os.path.join(
+                '.git', 'git-pylint-commit-hook', 'baseline.json')) as f:
+            scores = json.load(f)['files']['a.py']
+        self.assertEqual(sorted(scores.values()), [-5.0, 0.0])
+        self.assertEqual(scores[cache.blob_sha('a.py')], 0.0)
+
+        # The committed version is linted by the engine of the staged one
+        for kwargs in ({'batch_mode': True, 'jobs': 1},
+                       {'batch_mode': True, 'jobs': 2}, {'in_process': True}):
+            os.remove(os.path.join(
+                '.git', 'git-pylint-commit-hook', 'baseline.json'))
+            result, output = self.check_repo(
+                8.0, use_baseline=True, use_cache=False, **kwargs)
+            self.assertTrue(result)
+            self.assertIn('0/10.00\tPASSED\tBASELINE -5.00', output)
+        self.cmd('git commit -m msg')
+
+        # Make it worse again
+        self.write_file('a.py', 'import os\nimport sys\nimport re\n')
+        self.cmd('git add a.py')
+        result, output = self.check_repo(8.0, use_baseline=True)
+        self.assertFalse(result)
+        self.assertIn('FAILED\tBASELINE 0.00', output)
+
+        # New files still use the limit
+        self.write_file('b.py', '"""Docstring"""\nVALUE = 1\n')
+        self.cmd('git add b.py')
+        _, output = self.check_repo(8.0, use_baseline=True)
+        self.assertIn('10/10.00\tPASSED\n', output)
+
+    def test_parse_imports(self):
+        """Test dependents._parse_imports"""
+        source = (
+            b'import os.path\n'
+            b'from . import sibling\n'
+            b'from ..other import name\n'
+            b'from .... import too_far\n'
+            b'from pkg.mod import *\n'
+        )
+        self.assertEqual(
+            dependents._parse_imports('pkg/sub/mod.py', source),
+            ['os.path', 'pkg.mod', 'pkg.other', 'pkg.other.name',
+             'pkg.sub', 'pkg.sub.sibling'])
+        self.assertEqual(
+            dependents._parse_imports('pkg/__init__.py', b'from . import a'),
+            ['pkg', 'pkg.a'])
+        self.assertEqual(dependents._parse_imports('a.py', b'def ('), [])
+
+    def test_import_index(self):
+        """Test dependents.ImportIndex"""
+        os.makedirs(os.path.join('src', 'pkg'))
+        self.write_file('src/pkg/__init__.py', '')
+        self.write_file('src/pkg/utils.py', '')
+        self.write_file('src/pkg/a.py', 'from . import utils\n')
+        self.write_file('src/pkg/b.py', 'import pkg.a\n')
+        self.write_file('c.py', 'from pkg.utils import f\n')
+        self.cmd('git add .')
+
+        path = os.path.join(self.tmp_dir, 'imports.json')
+        index = dependents.ImportIndex(path)
+        index.update()
+        self.assertEqual(
+            index.dependents(['src/pkg/utils.py']),
+            ['c.py', 'src/pkg/a.py'])
+        self.assertEqual(
+            index.dependents(['src/pkg/utils.py'], depth=2),
+            ['c.py', 'src/pkg/a.py', 'src/pkg/b.py'])
+        self.assertEqual(
+            index.dependents(['src/pkg/utils.py'], depth=2, budget=1),
+            ['c.py'])
+
+        # The index is stored and only updated for changed files
+        self.write_file('c.py', 'import os\n')
+        self.cmd('git add c.py')
+        index = dependents.ImportIndex(path)
+        self.assertEqual(index.files['c.py'][1], ['pkg.utils', 'pkg.utils.f'])
+        index.update()
+        self.assertEqual(index.files['c.py'][1], ['os'])
+        self.assertEqual(
+            index.dependents(['src/pkg/utils.py']), ['src/pkg/a.py'])
+
+    def test_check_repo_dependents(self):
+        """Test commit_hook.check_repo lints the dependents"""
+        self.write_file(
+            'utils.py', '"""Utils"""\n\n\ndef add(one):\n'
+            '    """Add"""\n    return one\n')
+        self.write_file(
+            'caller.py', '"""Caller"""\nimport utils\n\nVALUE = utils.add(1)\n')
+        self.cmd('git add .')
+        self.cmd('git commit -m msg')
+
+        self.write_file(
+            'utils.py', '"""Utils"""\n\n\ndef add(one, two):\n'
+            '    """Add"""\n    return one + two\n')
+        self.cmd('git add utils.py')
+
+        result, output = self.check_repo(8.0)
+        self.assertTrue(result)
+
+        result, output = self.check_repo(8.0, check_dependents=True)
+        self.assertFalse(result)
+        self.assertIn('Running pylint on caller.py (file 2/2)', output)
+        self.assertIn('FAILED\tDEPENDENT', output)
+        self.assertIn('no-value-for-parameter', output)
+
+        # Dependents deleted from the working tree are skipped, unless the
+        # staged contents are linted
+        os.remove('caller.py')
+        result, output = self.check_repo(8.0, check_dependents=True)
+        self.assertTrue(result)
+        self.assertNotIn('caller.py', output)
+        result, output = self.check_repo(
+            8.0, check_dependents=True, index=True)
+        self.assertFalse(result)
+        self.assertIn('FAILED\tDEPENDENT', output)
+
+    def test_check_repo_dependents_unrelated_errors(self):
+        """Test commit_hook.check_repo ignores the errors of the dependents
+        that do not involve the staged modules"""
+        self.write_file(
+            'utils.py', '"""Utils"""\n\n\ndef add(one):\n'
+            '    """Add"""\n    return one\n')
+        self.write_file(
+            'caller.py', '"""Caller"""\nimport not_installed_pkg\n'
+            'import utils\n\nVALUE = utils.add(not_installed_pkg.ONE)\n')
+        self.cmd('git add .')
+        self.cmd('git commit -m msg')
+
+        self.write_file(
+            'utils.py', '"""Utils"""\n\n\ndef add(one):\n'
+            '    """Add"""\n    return one + 1\n')
+        self.cmd('git add utils.py')
+        result, output = self.check_repo(8.0, check_dependents=True)
+        self.assertTrue(result)
+        self.assertIn('PASSED\tDEPENDENT', output)
+
+        # Errors involving the staged modules still fail the commit
+        self.write_file(
+            'utils.py', '"""Utils"""\n\n\ndef add(one, two):\n'
+            '    """Add"""\n    return one + two\n')
+        self.cmd('git add utils.py')
+        result, output = self.check_repo(8.0, check_dependents=True)
+        self.assertFalse(result)
+        self.assertIn('FAILED\tDEPENDENT', output)
+        self.assertIn('no-value-for-parameter', output)
+        self.assertNotIn('import-error', output)
+
+    def test_related_lines(self):
+        """Test dependents.related_lines"""
+        source = (
+            b'import os\n'
+            b'import pkg.utils\n'
+            b'from pkg import utils as short\n'
+            b'from .utils import add\n'
+            b'os.getcwd()\n'
+            b'pkg.utils.add(1)\n'
+            b'short.add(\n'
+            b'    os.sep)\n'
+            b'add(1)\n'
+            b'pkg.other.add(1)\n'
+        )
+        self.assertEqual(
+            dependents.related_lines(
+                'pkg/caller.py', source, ['src/pkg/utils.py']),
+            set([2, 3, 4, 6, 7, 9]))
+        self.assertEqual(
+            dependents.related_lines('a.py', b'def (', ['utils.py']), set())
+
+    def test_git_state_range(self):
+        """Test commit_hook._GitState with a revision range"""
+        self.write_file('a.py', 'one\n')
+        self.write_file('b.py', 'one\n')
+        self.cmd('git add .')
+        self.cmd('git commit -m msg')
+        self.cmd('git branch base')
+        self.write_file('a.py', 'one\ntwo\n')
+        # Unlike b.py, so it is not taken for a rename
+        self.write_file('c.py', 'three\n')
+        self.cmd('git add .')
+        self.cmd('git rm -q b.py')
+        self.cmd('git commit -m msg')
+        # Staged changes are not part of the range
+        self.write_file('d.py', 'one\n')
+        self.cmd('git add d.py')
+
+        for revision_range in ('base..HEAD', 'base...HEAD'):
+            git_state = commit_hook._GitState(revision_range)
+            self.assertEqual(
+                [(staged.path, staged.status)
+                 for staged in git_state.staged_files()],
+                [('a.py', 'M'), ('c.py', 'A')])
+            self.assertEqual(
+                git_state.changed_lines(), {'a.py': set([2]), 'c.py': set([1])})
+
+    def test_sharding(self):
+        """Test sharding.weights and sharding.split"""
+        with self.assertRaises(ValueError):
+            sharding.parse('3/2')
+        with self.assertRaises(ValueError):
+            sharding.parse('1-2')
+        self.assertEqual(sharding.parse('2/3'), (2, 3))
+
+        weights = sharding.weights(
+            {'a.py': 100, 'b.py': 200, 'c.py': 300}, {'a.py': 2.0})
+        self.assertEqual(weights, {'a.py': 2.0, 'b.py': 4.0, 'c.py': 6.0})
+        self.assertEqual(
+            sharding.weights({'a.py': 100}, {'b.py': 1.0}), {'a.py': 100})
+
+        weights = {'a.py': 6, 'b.py': 5, 'c.py': 4, 'd.py': 3, 'e.py': 1,
+                   'f.py': 1}
+        self.assertEqual(
+            sharding.split(weights, 2),
+            [set(['a.py', 'd.py', 'e.py']), set(['b.py', 'c.py', 'f.py'])])
+        self.assertEqual(sharding.split(weights, 1), [set(weights)])
+        self.assertEqual(
+            sharding.split({'a.py': 1}, 3), [set(['a.py']), set(), set()])
+
+    def test_check_repo_shards(self):
+        """Test commit_hook.check_repo with a sharded revision range"""
+        self.write_file('README', 'readme\n')
+        self.cmd('git add README')
+        self.cmd('git commit -m msg')
+        for name in ('a.py', 'b.py', 'c.py'):
+            self.write_file(name, '"""Docstring"""\nVALUE = 1\n')
+        self.write_file('d.py', 'style error!\n')
+        self.cmd('git add .')
+        self.cmd('git commit -m msg')
+        self.write_file('a.py', 'style error!\n')
+        with open('timings.json', 'w') as file_handle:
+            json.dump({'files': {'a.py': 1.0, 'b.py': 3.0}}, file_handle)
+
+        # The working tree is linted, unless the range is read from git
+        result, output = self.check_repo(
+            8.0, revision_range='HEAD~1..HEAD', use_cache=False)
+        self.assertIn('Running pylint on a.py (file 1/4)', output)
+        self.assertIn('Running pylint on d.py (file 4/4)', output)
+        result, output = self.check_repo(
+            8.0, revision_range='HEAD~1..HEAD', index=True, shard=(1, 2),
+            shard_timings='timings.json', shard_results='shard-1.json')
+        self.assertFalse(result)
+        self.assertIn('Linting shard 1/2: 2 of 4 files', output)
+        self.assertIn('Running pylint on b.py (file 1/2)', output)
+        self.assertIn('Running pylint on d.py (file 2/2)', output)
+
+        results = ['shard-1.json']
+        self.assertFalse(sharding.merge_results(results))
+        results.append('shard-2.json')
+        result, output = self.check_repo(
+            8.0, revision_range='HEAD~1..HEAD', index=True, shard=(2, 2),
+            shard_timings='timings.json', shard_results=results[1])
+        self.assertTrue(result)
+        self.assertIn('Linting shard 2/2: 2 of 4 files', output)
+
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            self.assertFalse(sharding.merge_results(results))
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertIn('Shard 1/2: 2 files\tFAILED\n\td.py\tFAILED', output)
+        self.assertIn('Shard 2/2: 2 files\tPASSED', output)
+
+        # Shards that split the files differently do not add up
+        self.check_repo(
+            8.0, revision_range='HEAD~1..HEAD', index=True, shard=(2, 2),
+            shard_results=results[1])
+        sys.stdout = io.StringIO()
+        try:
+            self.assertFalse(sharding.merge_results(results))
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertIn('did not split the same 4 files', output)
+
+    def test_check_repo_output_format(self):
+        """Test commit_hook.check_repo writes JSON and JUnit results"""
+        self.write_file('a.py', '"""Docstring"""\nVALUE = 1\n')
+        self.write_file('b.py', 'style error!\n')
+        self.write_file('__init__.py', '')
+        self.cmd('git add a.py b.py __init__.py')
+
+        result, _ = self.check_repo(
+            8.0, output_format='json', output_file='results.json')
+        self.assertFalse(result)
+        with open('results.json') as file_handle:
+            results = json.load(file_handle)
+        self.assertFalse(results['passed'])
+        self.assertEqual(
+            [(item['path'], item['status'], item['cached'])
+             for item in results['files']],
+            [('__init__.py', 'SKIPPED', False), ('a.py', 'PASSED', False),
+             ('b.py', 'FAILED', False)])
+        self.assertEqual(results['files'][1]['messages'], [])
+        self.assertGreater(results['files'][1]['duration'], 0)
+        message = results['files'][2]['messages'][0]
+        self.assertIsInstance(message.pop('column'), int)
+        self.assertEqual(message, {
+            'line': 1,
+            'msg_id': 'E0001',
+            'symbol': 'syntax-error',
+            'message': 'invalid syntax (<unknown>, line 1)',
+        })
+        totals = results['totals']
+        self.assertEqual(
+            (totals['files'], totals['passed'], totals['failed'],
+             totals['skipped'], totals['cached']),
+            (3, 1, 1, 1, 0))
+
+        result, _ = self.check_repo(
+            8.0, output_format='junit', output_file='results.xml')
+        suite = ElementTree.parse('results.xml').getroot()
+        cases = suite.findall('testcase')
+        self.assertEqual(
+            [case.get('name') for case in cases],
+            ['__init__.py', 'a.py', 'b.py'])
+        self.assertIsNotNone(cases[0].find('skipped'))
+        self.assertIsNone(cases[1].find('failure'))
+        self.assertIn('E0001', cases[2].find('failure').text)
+        self.assertEqual(cases[1].get('time'), '0.000')
+        self.assertTrue(suite.find('system-out').text.startswith(
+            'FAILED - 3 files, 1 passed, 1 failed, 1 skipped, 0 timed out, '
+            '0 out of memory, 1 cached'))
+
+        # The messages are read from pylint in process runs
+        result, _ = self.check_repo(
+            8.0, in_process=True, output_format='json',
+            output_file='results.json')
+        with open('results.json') as file_handle:
+            results = json.load(file_handle)
+        self.assertIsNone(results['files'][1]['duration'])
+        self.assertEqual(
+            results['files'][2]['messages'][0]['msg_id'], 'E0001')
+
+    def test_timings(self):
+        """Test cache.Timings"""
+        path = os.path.join(self.tmp_dir, 'timings', 'timings.json')
+        timings = cache.Timings(path)
+        timings.record('a.py', 2.0)
+        timings.record('a.py', 4.0)
+        timings.save()
+
+        timings = cache.Timings(path, max_entries=1)
+        self.assertEqual(timings.seconds, {'a.py': 3.0})
+        timings.record('b.py', 1.0)
+        timings.save()
+        self.assertEqual(cache.Timings(path).seconds, {'b.py': 1.0})
+
+    def write_fake_pylint(self):
+        """Write a pylint logging its files, failing bad.py and stalling on
+        slow.py. bad.py waits for slow.py to write its pid to slow.pid, if
+        there is a slow.py"""
+        fake = self.write_file('fake-pylint', '\n'.join([
+            '#!/bin/sh',
+            'for last; do :; done',
+            'echo "$last" >> lint.log',
+            'case "$last" in',
+            '    slow.py) echo $$ > slow.pid; exec sleep 30;;',
+            '    bad.py) while [ -f slow.py ] && [ ! -s slow.pid ]; do',
+            '                sleep 0.01',
+            '            done',
+            '            echo "$last:1:0: C0114: Missing (missing-docstring)"',
+            '            echo "Your code has been rated at 0.00/10";;',
+            '    *) echo "Your code has been rated at 10.00/10";;',
+            'esac',
+            '']))
+        os.chmod(fake, 0o755)
+        return os.path.join(self.tmp_dir, fake)
+
+    def test_check_repo_schedule(self):
+        """Test commit_hook.check_repo starts the slowest files first"""
+        fake = self.write_fake_pylint()
+        self.write_file('a.py', 'VALUE = 1\n')
+        self.write_file('b.py', 'VALUE = 1\n' * 10)
+        self.write_file('c.py', 'VALUE = 1\n' * 5)
+        self.cmd('git add a.py b.py c.py')
+
+        result, output = self.check_repo(
+            8.0, pylint=fake, jobs=1, use_cache=False)
+        self.assertTrue(result)
+        with open('lint.log') as file_handle:
+            self.assertEqual(file_handle.read().split(), ['b.py', 'c.py', 'a.py'])
+        self.assertLess(
+            output.index('a.py (file 1/3)'), output.index('b.py (file 2/3)'))
+
+        # The times of the last run take precedence over the size
+        timings = commit_hook._timings(commit_hook._GitState())
+        self.assertEqual(sorted(timings.seconds), ['a.py', 'b.py', 'c.py'])
+        timings.seconds = {'a.py': 3.0, 'b.py': 1.0, 'c.py': 2.0}
+        timings.record('a.py', 3.0)
+        timings.save()
+        os.remove('lint.log')
+        self.check_repo(8.0, pylint=fake, jobs=1, use_cache=False)
+        with open('lint.log') as file_handle:
+            self.assertEqual(file_handle.read().split(), ['a.py', 'c.py', 'b.py'])
+
+    def test_check_repo_fail_fast(self):
+        """Test commit_hook.check_repo --fail-fast kills the other runs"""
+        fake = self.write_fake_pylint()
+        self.write_file('slow.py', 'VALUE = 1\n')
+        self.write_file('bad.py', 'VALUE = 1\n')
+        self.cmd('git add slow.py bad.py')
+
+        for use_asyncio in USE_ASYNCIO:
+            start = time.time()
+            result, output = self.check_repo(
+                8.0, pylint=fake, jobs=2, use_cache=False, fail_fast=True,
+                use_asyncio=use_asyncio)
+            self.assertLess(time.time() - start, 10)
+            self.assertFalse(result)
+            self.assertIn('Running pylint on bad.py (file 1/2)', output)
+            self.assertIn('Stopping at the first failure', output)
+            self.assertNotIn('slow.py', output)
+
+            # The slow pylint was killed and reaped before check_repo
+            # returned
+            with open('slow.pid') as file_handle:
+                pid = int(file_handle.read())
+            os.remove('slow.pid')
+            self.assertRaises(OSError, os.kill, pid, 0)
+
+    def test_nul_fields(self):
+        """Test commit_hook._nul_fields splits fields across chunks"""
+        stream = io.BytesIO(b'M\0a.py\0A\0long name.py\0')
+        self.assertEqual(
+            list(commit_hook._nul_fields(stream, chunk_size=3)),
+            ['M', 'a.py', 'A', 'long name.py'])
+        self.assertEqual(list(commit_hook._nul_fields(io.BytesIO(b''))), [])
+
+    def test_raw_diff_files(self):
+        """Test commit_hook._raw_diff_files parses the records"""
+        head, blob, zero = 'a' * 40, 'b' * 40, '0' * 40
+        fields = [
+            ':100644 100644 {} {} M'.format(head, blob), 'm.py',
+            ':000000 100644 {} {} A'.format(zero, blob), 'a.py',
+            ':100644 000000 {} {} D'.format(head, zero), 'd.py',
+            ':100644 100644 {} {} R086'.format(head, blob), 'old.py',
+            'new.py',
+            ':100644 100644 {} {} C100'.format(head, head), 'src.py',
+            'copy.py',
+            '',
+        ]
+        self.assertEqual(
+            list(commit_hook._raw_diff_files(iter(fields))), [
+                commit_hook.StagedFile('m.py', 'M', blob, head, 'm.py'),
+                commit_hook.StagedFile('a.py', 'A', blob, zero, 'a.py'),
+                commit_hook.StagedFile('new.py', 'R', blob, head, 'old.py'),
+                commit_hook.StagedFile('copy.py', 'C', head, head, 'src.py'),
+            ])
+
+        # Output ending in the middle of a record
+        for end in (-3, -2):
+            self.assertRaises(
+                ValueError, list,
+                commit_hook._raw_diff_files(iter(fields[:end])))
+
+    def test_output_spool(self):
+        """Test spool.OutputSpool moves outputs past its limit to disk"""
+        output_spool = spool.OutputSpool(max_memory=10)
+        results = [
+            batch.FileResult(
+                'a.py', 9.0, False, None, 'a' * 8, 'a' * 8, None),
+            batch.FileResult(
+                'b.py', 5.0, False, None, u'b\u00e4' * 8, 'brief', None),
+            batch.FileResult('c.py', None, True, None, '', '', None),
+        ]
+        keys = [output_spool.put(result) for result in results]
+        self.assertEqual(output_spool.memory, 8)
+        self.assertEqual(output_spool.spilled, 1)
+
+        for key, result in reversed(list(zip(keys, results))):
+            self.assertEqual(output_spool.pop(key), result)
+        self.assertEqual(output_spool.memory, 0)
+        output_spool.close()
+
+    def test_check_repo_output_memory(self):
+        """Test commit_hook.check_repo reports spilled outputs in order"""
+        fake = self.write_fake_pylint()
+        for name in ('a.py', 'bad.py', 'c.py'):
+            self.write_file(name, 'VALUE = 1\n')
+        self.cmd('git add .')
+
+        for options in ({}, {'batch_mode': True}, {'use_asyncio': ASYNCIO}):
+            result, output = self.check_repo(
+                8.0, pylint=fake, use_cache=False, output_memory=0,
+                **options)
+            self.assertFalse(result)
+            self.assertIn('bad.py:1:0: C0114: Missing', output)
+            self.assertLess(output.index('a.py'), output.index('bad.py'))
+            self.assertLess(output.index('bad.py'), output.index('c.py'))
+
+    def test_git_state_renames(self):
+        """Test commit_hook._GitState detects renamed and copied files"""
+        self.write_file('a.py', 'VALUE = 1\n' * 10)
+        self.write_file('b.py', 'OTHER = 1\n' * 10)
+        self.cmd('git add .')
+        self.cmd('git commit -m msg')
+        self.cmd('git mv a.py moved.py')
+        self.write_file('b.py', 'OTHER = 1\n' * 10 + 'EDIT = 1\n')
+        self.write_file('copy.py', 'OTHER = 1\n' * 10 + 'COPY = 1\n')
+        self.cmd('git add .')
+
+        staged = commit_hook._GitState().staged_files()
+        self.assertEqual(
+            [(f.path, f.status, f.head_path) for f in staged],
+            [('b.py', 'M', 'b.py'), ('copy.py', 'C', 'b.py'),
+             ('moved.py', 'R', 'a.py')])
+        self.assertEqual(staged[2].blob, staged[2].head_blob)
+        self.assertEqual(
+            commit_hook._GitState().changed_lines(),
+            {'b.py': set([11]), 'copy.py': set([11])})
+
+    def test_moved_output(self):
+        """Test commit_hook._moved_output"""
+        os.makedirs(os.path.join('pkg', 'sub'))
+        self.write_file('pkg/__init__.py', '')
+        output = (
+            '************* Module a\n'
+            'a.py:1:0: C0114: Missing (missing-docstring)\n'
+            'Your code has been rated at 0.00/10\n')
+        self.assertEqual(
+            commit_hook._moved_output(output, 'a.py', 'pkg/sub/b.py'),
+            '************* Module b\n'
+            'pkg/sub/b.py:1:0: C0114: Missing (missing-docstring)\n'
+            'Your code has been rated at 0.00/10\n')
+        self.assertIn(
+            'Module pkg.b\n',
+            commit_hook._moved_output(output, 'a.py', 'pkg/b.py'))
+        self.assertIn(
+            'Module pkg\n',
+            commit_hook._moved_output(output, 'a.py', 'pkg/__init__.py'))
+
+    def test_check_repo_renames(self):
+        """Test commit_hook.check_repo reuses the results of moved files"""
+        fake = self.write_fake_pylint()
+        self.write_file('bad.py', 'VALUE = 1\n' * 10)
+        self.write_file('b.py', 'OTHER = 1\n' * 10)
+        self.cmd('git add .')
+        self.check_repo(8.0, pylint=fake, use_baseline=True)
+        self.cmd('git commit -m msg')
+        os.remove('lint.log')
+
+        # Pure renames are not linted again, neither from the cache nor
+        # from the baseline
+        os.makedirs('pkg')
+        self.cmd('git mv bad.py pkg/bad.py')
+        self.cmd('git mv b.py pkg/b.py')
+        for options in ({'use_baseline': True},
+                        {'use_baseline': True, 'use_cache': False}, {}):
+            result, output = self.check_repo(8.0, pylint=fake, **options)
+            self.assertFalse(os.path.exists('lint.log'))
+            self.assertIn('pkg/b.py (file 1/2)..\t10/10.00\tPASSED', output)
+            if options:
+                self.assertTrue(result)
+                self.assertIn('PASSED\tCACHED\tBASELINE 0.00', output)
+            else:
+                self.assertFalse(result)
+                self.assertIn('pkg/bad.py:1:0: C0114: Missing', output)
+
+        # Unless their messages are shown
+        result, output = self.check_repo(
+            8.0, pylint=fake, use_baseline=True, use_cache=False,
+            always_show_violations=True)
+        self.assertTrue(result)
+        with open('lint.log') as file_handle:
+            self.assertEqual(
+                sorted(file_handle.read().split()), ['pkg/b.py', 'pkg/bad.py'])
+        self.assertIn(
+            'BASELINE 0.00\nYour code has been rated at 10.00/10', output)
+        os.remove('lint.log')
+
+        # Renames with edits are linted as modifications
+        self.write_file('pkg/b.py', 'OTHER = 1\n' * 10 + 'EDIT = 1\n')
+        self.cmd('git add .')
+        result, output = self.check_repo(8.0, pylint=fake, use_baseline=True)
+        with open('lint.log') as file_handle:
+            self.assertEqual(file_handle.read().split(), ['pkg/b.py'])
+        self.assertIn('10/10.00\tPASSED\tBASELINE 10.00', output)